@@ -2,103 +2,996 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
+import sys
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import time
+import hashlib
+from collections import Counter
+from datetime import datetime, date, timedelta, timezone
+from functools import lru_cache
+from decimal import Decimal
+from itertools import groupby, islice
+import click
+from flask import Blueprint, Flask, current_app, render_template, stream_template, stream_with_context, request, Response, flash, redirect, url_for, jsonify, abort
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from flask_migrate import Migrate
 
-from forms import *
+from assets import Assets
+import autocomplete
+from cache import Cache
+import compression
+import dbpool
+import routing
+from sqlstats import SQLStats
+import exporter
+import geo
+import images
+from models import db, Venue, Artist, Show, ShowArchive, AreaSummary
+
+# Forms (Flask-WTF and WTForms), babel, dateutil, orjson and Pillow are
+# imported where they are first used, so starting a worker does not pay
+# for them.
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+# The app itself is built by create_app() at the end of this module. The
+# extensions are bound to it there and keep whatever they hold per app in
+# app.extensions, and the views, error handlers, filters and commands below
+# belong to the `fyyur` blueprint it registers. Commands are added to the
+# `flask` command itself, not to a `flask fyyur` group.
+moment = Moment()
+# Entries are filled from the primary, so a lagging replica cannot put
+# stale data back right after an invalidation; see routing.py.
+cache = Cache(fill_context=routing.primary_reads)
+sqlstats = SQLStats()
+assets = Assets()
+image_proxy = images.ImageProxy(endpoint='fyyur.image')
+bp = Blueprint('fyyur', __name__, cli_group=None)
 
-migrate = Migrate(app, db)
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
 
-# TODO: connect to a local postgresql database
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+# Left to babel, which reads them as the locale's formats of that width.
+NAMED_DATETIME_FORMATS = ('short', 'long')
+
+@lru_cache(maxsize=None)
+def _datetime_pattern(format, locale):
+  """Compiled babel pattern and locale, built once per (format, locale)."""
+  from babel import Locale, dates
+  locale = Locale.parse(locale)
+  pattern = DATETIME_FORMATS.get(format, format)
+  if pattern in NAMED_DATETIME_FORMATS:
+    # What babel.dates.format_datetime does for a width: the locale's date
+    # and time patterns joined by its datetime pattern, e.g. "{1}, {0}".
+    pattern = dates.get_datetime_format(pattern, locale) \
+        .replace('{0}', dates.get_time_format(pattern, locale).pattern) \
+        .replace('{1}', dates.get_date_format(pattern, locale).pattern)
+  return dates.parse_pattern(pattern), locale
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(value):
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+def _apply_pattern(pattern, locale, value):
+  if not isinstance(value, datetime):
+    value = _parse_datetime(value)
+  # Like babel.dates.format_datetime, read naive datetimes as UTC.
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=timezone.utc)
+  return pattern.apply(value, locale)
+
+@bp.app_template_filter('datetime')
+def format_datetime(value, format='medium', locale='en'):
+  """Format a datetime, or a string dateutil can parse, with a babel pattern.
+
+  `format` is 'full' or 'medium' (see DATETIME_FORMATS), 'short' or 'long'
+  (the locale's own formats) or a babel pattern. Passing datetime objects
+  skips parsing altogether.
+  """
+  pattern, locale = _datetime_pattern(format, locale)
+  return _apply_pattern(pattern, locale, value)
+
+@bp.app_template_filter('datetimes')
+def format_datetimes(values, format='medium', locale='en'):
+  """Batch form of format_datetime: one pattern lookup for the whole list."""
+  pattern, locale = _datetime_pattern(format, locale)
+  return [_apply_pattern(pattern, locale, value) for value in values]
+
+def _parse_date(value):
+  return date.fromisoformat(value)
 
 #----------------------------------------------------------------------------#
-# Models.
+# Queries.
 #----------------------------------------------------------------------------#
 
-class Venue(db.Model):
-    __tablename__ = 'Venue'
+def venue_areas(genre=None):
+  """Group venues by (city, state) with their number of upcoming shows.
+
+  The whole listing is read from AreaSummary, one row per area, in a single
+  scan of its (state, city) index. With `genre`, only venues listing that
+  genre are included, which AreaSummary cannot answer, so they are grouped
+  from Venue instead.
+  """
+  if genre:
+    return group_venue_areas(Venue.genres.contains([genre]))
+  return [{"city": row.city, "state": row.state, "venues": row.venues}
+          for row in AreaSummary.query.order_by(AreaSummary.state, AreaSummary.city)]
+
+def group_venue_areas(*criteria):
+  """The venue_areas() listing computed from Venue, for venues matching `criteria`.
+
+  The counts come from the maintained Venue.upcoming_shows_count column,
+  so this is a single query over Venue with no join against Show.
+  """
+  rows = db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      Venue.upcoming_shows_count,
+  ).filter(*criteria).order_by(Venue.state, Venue.city, Venue.name, Venue.id).all()
+
+  areas = []
+  for (city, state), venues_in_area in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+        "city": city,
+        "state": state,
+        "venues": [{
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.upcoming_shows_count,
+        } for row in venues_in_area]
+    })
+  return areas
+
+def _encode_search_cursor(rank, id):
+  return '{}:{}'.format(rank, id)
+
+def _decode_search_cursor(cursor):
+  try:
+    rank, id = cursor.split(':')
+    return Decimal(rank), int(id)
+  except (AttributeError, ValueError, ArithmeticError):
+    return None
+
+def search_by_name(model, search_term, cursor=None, limit=None):
+  """Case-insensitive partial name search, best matches first.
+
+  The ILIKE filter is served by the pg_trgm GIN index on `name`, and
+  matches are ranked by trigram similarity to the search term. Results are
+  paginated by keyset on (rank, id): pass the returned cursor back in to
+  get the next page. Returns (rows, next_cursor); next_cursor is None on
+  the last page.
+  """
+  limit = limit or current_app.config['SEARCH_PAGE_SIZE']
+  escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  # Rounded to a fixed-precision numeric so the rank can be compared for
+  # equality when it comes back in a cursor.
+  rank = db.func.round(db.cast(db.func.similarity(model.name, search_term), db.Numeric), 6)
+
+  query = db.session.query(model.id, model.name, model.upcoming_shows_count, rank.label('rank')) \
+      .filter(model.name.ilike('%{}%'.format(escaped), escape='\\'))
+
+  after = _decode_search_cursor(cursor)
+  if after:
+    after_rank, after_id = after
+    query = query.filter(db.or_(
+        rank < after_rank,
+        db.and_(rank == after_rank, model.id > after_id),
+    ))
+
+  rows = query.order_by(rank.desc(), model.id).limit(limit + 1).all()
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = _encode_search_cursor(rows[-1].rank, rows[-1].id)
+  return rows, next_cursor
+
+def search_results(model, search_term, cursor=None):
+  """Build the search page payload for `model`, one page at a time."""
+  rows, next_cursor = search_by_name(model, search_term, cursor)
+  return {
+      "count": len(rows),
+      "next_cursor": next_cursor,
+      "data": [{
+          "id": row.id,
+          "name": row.name,
+          "num_upcoming_shows": row.upcoming_shows_count,
+      } for row in rows]
+  }
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
+def _encode_show_cursor(row):
+  return '{}_{}'.format(row.start_time.isoformat(), row.id)
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+def _decode_show_cursor(cursor):
+  try:
+    start_time, id = cursor.split('_')
+    return datetime.fromisoformat(start_time), int(id)
+  except (AttributeError, ValueError):
+    return None
+
+def profile_shows(owner_column, owner_id, other, now=None, cursor=None, limit=None):
+  """Upcoming shows and one page of past shows of one venue or artist.
+
+  `owner_column` is the Show foreign key of the profile being rendered and
+  `other` the model on the other side of the show (Artist for a venue page,
+  Venue for an artist page), whose id, name and image_link are joined in.
+  Upcoming shows are all returned, soonest first. Past shows come
+  PROFILE_PAST_SHOWS_PAGE_SIZE at a time, most recent first, keyset
+  paginated on (start_time, id) from `cursor`. Both queries bound
+  start_time on their side of `now` (and the cursor), so on the
+  partitioned Show table only the partitions on that side are scanned, and
+  the past page reads them newest first until the page is full. Returns
+  (past_shows, upcoming_shows, next_cursor); next_cursor is None on the
+  last page.
+  """
+  now = now or datetime.now()
+  limit = limit or current_app.config['PROFILE_PAST_SHOWS_PAGE_SIZE']
+  prefix = other.__tablename__.lower()
+  query = db.session.query(
+      Show.id,
+      other.id.label('other_id'),
+      other.name,
+      other.image_link,
+      Show.start_time,
+  ).join(other, Show.__table__.c[prefix + '_id'] == other.id) \
+   .filter(owner_column == owner_id)
+
+  def show(row):
+    return {
+        prefix + "_id": row.other_id,
+        prefix + "_name": row.name,
+        prefix + "_image_link": row.image_link,
+        "start_time": row.start_time
+    }
 
-    website = db.Column(db.String(120), nullable=True)
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
-    seeking_talent = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(500), nullable=True)
+  upcoming_shows = [show(row) for row in query.filter(Show.start_time > now)
+                    .order_by(Show.start_time, Show.id)]
 
-    shows = db.relationship('Show', backref='venue', lazy=True)
-class Artist(db.Model):
-    __tablename__ = 'Artist'
+  past = query.filter(Show.start_time <= now)
+  after = _decode_show_cursor(cursor)
+  if after:
+    past = past.filter(Show.start_time <= after[0],
+                       db.tuple_(Show.start_time, Show.id) < db.tuple_(*after))
+  rows = past.order_by(Show.start_time.desc(), Show.id.desc()).limit(limit + 1).all()
+  next_cursor = _encode_show_cursor(rows[limit - 1]) if len(rows) > limit else None
+  return [show(row) for row in rows[:limit]], upcoming_shows, next_cursor
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
+def venue_profile(venue_id, cursor=None):
+  """Everything the venue page shows, or None if there is no such venue.
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+  Past shows are paginated, see profile_shows(); `cursor` selects the page.
+  """
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return None
+
+  past_shows, upcoming_shows, past_shows_cursor = profile_shows(Show.venue_id, venue_id, Artist, cursor=cursor)
+  return {
+      "id": venue.id,
+      "name": venue.name,
+      "genres": venue.genres,
+      "address": venue.address,
+      "city": venue.city,
+      "state": venue.state,
+      "phone": venue.phone,
+      "website": venue.website,
+      "facebook_link": venue.facebook_link,
+      "seeking_talent": venue.seeking_talent,
+      "seeking_description": venue.seeking_description,
+      "image_link": venue.image_link,
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows,
+      # The counters include archived shows (see partitions.py) but move a
+      # show to past only at the next rollover; upcoming_shows is split by
+      # the clock, so shows started since are counted as past here too.
+      "past_shows_count": venue.past_shows_count + venue.upcoming_shows_count - len(upcoming_shows),
+      "upcoming_shows_count": len(upcoming_shows),
+      "past_shows_cursor": cursor,
+      "past_shows_next_cursor": past_shows_cursor,
+  }
 
-    website = db.Column(db.String(120), nullable=True)
-    seeking_venue = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(500), nullable=True)
-    shows = db.relationship('Show', backref='artist', lazy=True)
+def artist_profile(artist_id, cursor=None):
+  """Everything the artist page shows, or None if there is no such artist.
+
+  Past shows are paginated, see profile_shows(); `cursor` selects the page.
+  """
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return None
+
+  past_shows, upcoming_shows, past_shows_cursor = profile_shows(Show.artist_id, artist_id, Venue, cursor=cursor)
+  return {
+      "id": artist.id,
+      "name": artist.name,
+      "genres": artist.genres,
+      "city": artist.city,
+      "state": artist.state,
+      "phone": artist.phone,
+      "website": artist.website,
+      "facebook_link": artist.facebook_link,
+      "seeking_venue": artist.seeking_venue,
+      "seeking_description": artist.seeking_description,
+      "image_link": artist.image_link,
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows,
+      # The counters include archived shows (see partitions.py) but move a
+      # show to past only at the next rollover; upcoming_shows is split by
+      # the clock, so shows started since are counted as past here too.
+      "past_shows_count": artist.past_shows_count + artist.upcoming_shows_count - len(upcoming_shows),
+      "upcoming_shows_count": len(upcoming_shows),
+      "past_shows_cursor": cursor,
+      "past_shows_next_cursor": past_shows_cursor,
+  }
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def artist_list(genre=None):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = query.filter(Artist.genres.contains([genre]))
+  return [{"id": row.id, "name": row.name} for row in query.order_by(Artist.id)]
+
+class ShowsPage(object):
+  """One keyset-paginated page of /shows, fetched while it is iterated.
+
+  Upcoming shows come first, soonest first, followed by past shows, most
+  recent first. Each part is read in (start_time, id) order from the
+  cursor onwards, so a page costs the same however deep it is. Rows are
+  yielded as they arrive from the database cursor and never collected into
+  a list; `next_cursor` is set once iteration reaches the end of the page,
+  or stays None on the last page.
+  """
+
+  def __init__(self, cursor=None, start=None, end=None, limit=None, now=None):
+    self.start = start
+    self.end = end
+    self.limit = limit or current_app.config['SHOWS_PAGE_SIZE']
+    self.now = now or datetime.now()
+    self.cursor = cursor
+    self.segment, self.after = self._decode_cursor(cursor)
+    self.next_cursor = None
+
+  @staticmethod
+  def _decode_cursor(cursor):
+    try:
+      segment, start_time, id = cursor.split('_')
+      return segment, (datetime.fromisoformat(start_time), int(id))
+    except (AttributeError, ValueError):
+      pass
+    return ('past' if cursor == 'past' else 'upcoming'), None
+
+  @staticmethod
+  def _encode_cursor(segment, row):
+    if row is None:
+      return segment
+    return '{}_{}_{}'.format(segment, row.start_time.isoformat(), row.id)
+
+  @property
+  def filters(self):
+    """The date filters, as query string arguments for url_for()."""
+    return {name: value.isoformat()
+            for name, value in (('start', self.start), ('end', self.end)) if value}
+
+  def _query(self, segment, after):
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+    ).join(Venue, Show.venue_id == Venue.id) \
+     .join(Artist, Show.artist_id == Artist.id)
+
+    if self.start:
+      query = query.filter(Show.start_time >= self.start)
+    if self.end:
+      query = query.filter(Show.start_time < self.end + timedelta(days=1))
+
+    # The plain start_time bound next to each row comparison lets
+    # PostgreSQL prune Show partitions outside the page.
+    key = db.tuple_(Show.start_time, Show.id)
+    if segment == 'upcoming':
+      query = query.filter(Show.start_time > self.now)
+      if after:
+        query = query.filter(Show.start_time >= after[0], key > db.tuple_(*after))
+      return query.order_by(Show.start_time, Show.id)
+
+    query = query.filter(Show.start_time <= self.now)
+    if after:
+      query = query.filter(Show.start_time <= after[0], key < db.tuple_(*after))
+    return query.order_by(Show.start_time.desc(), Show.id.desc())
+
+  def __iter__(self):
+    remaining = self.limit
+    segment, after = self.segment, self.after
+    while segment:
+      last = None
+      # One row past the page tells whether there is a next one.
+      for row in self._query(segment, after).limit(remaining + 1).yield_per(100):
+        if remaining == 0:
+          self.next_cursor = self._encode_cursor(segment, last)
+          return
+        remaining -= 1
+        last = row
+        yield {
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": row.start_time
+        }
+      segment, after = ('past' if segment == 'upcoming' else None), None
 
-class Show(db.Model):
-    __tablename__ = 'Show'
+#----------------------------------------------------------------------------#
+# Exports.
+#----------------------------------------------------------------------------#
 
-    id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime, nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+EXPORT_COLUMNS = {
+    'shows': [
+        ('id', 'int'), ('start_time', 'datetime'),
+        ('venue_id', 'int'), ('venue_name', 'str'), ('venue_city', 'str'), ('venue_state', 'str'),
+        ('artist_id', 'int'), ('artist_name', 'str'),
+    ],
+    'venues': [
+        ('id', 'int'), ('name', 'str'), ('city', 'str'), ('state', 'str'), ('address', 'str'),
+        ('phone', 'str'), ('genres', 'list'), ('website', 'str'), ('facebook_link', 'str'),
+        ('image_link', 'str'), ('seeking_talent', 'bool'), ('seeking_description', 'str'),
+        ('upcoming_shows_count', 'int'), ('past_shows_count', 'int'),
+    ],
+    'artists': [
+        ('id', 'int'), ('name', 'str'), ('city', 'str'), ('state', 'str'), ('phone', 'str'),
+        ('genres', 'list'), ('website', 'str'), ('facebook_link', 'str'), ('image_link', 'str'),
+        ('seeking_venue', 'bool'), ('seeking_description', 'str'),
+        ('upcoming_shows_count', 'int'), ('past_shows_count', 'int'),
+    ],
+}
+
+def export_rows(kind, start=None, end=None, city=None, state=None, venue_id=None, artist_id=None):
+  """Rows of an export in EXPORT_COLUMNS order, read through a server-side cursor.
+
+  For shows, city and state filter on the venue and start/end on the show
+  date. For venues and artists, start and end do not apply and only the
+  matching id filter does.
+  """
+  if kind == 'shows':
+    query = db.session.query(
+        Show.id, Show.start_time,
+        Show.venue_id, Venue.name, Venue.city, Venue.state,
+        Show.artist_id, Artist.name,
+    ).join(Venue, Show.venue_id == Venue.id) \
+     .join(Artist, Show.artist_id == Artist.id)
+    if start:
+      query = query.filter(Show.start_time >= start)
+    if end:
+      query = query.filter(Show.start_time < end + timedelta(days=1))
+    if venue_id:
+      query = query.filter(Show.venue_id == venue_id)
+    if artist_id:
+      query = query.filter(Show.artist_id == artist_id)
+    located, order = Venue, (Show.start_time, Show.id)
+  else:
+    model = Venue if kind == 'venues' else Artist
+    query = db.session.query(*[getattr(model, name) for name, type in EXPORT_COLUMNS[kind]])
+    id = venue_id if kind == 'venues' else artist_id
+    if id:
+      query = query.filter(model.id == id)
+    located, order = model, (model.id,)
+
+  if city:
+    query = query.filter(located.city == city)
+  if state:
+    query = query.filter(located.state == state)
+  return query.order_by(*order).yield_per(1000)
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Caching.
+#----------------------------------------------------------------------------#
+
+# A cached page has its data under its key ('venues', 'artists',
+# 'venue:<id>', 'artist:<id>'), its rendered fragment under the same key
+# plus ':html' and its API payload plus ':json'. invalidate() drops every
+# variant of a key.
+CACHE_VARIANTS = ('', ':html', ':json')
+
+def invalidate(*keys):
+  cache.delete(*[key + variant for key in keys for variant in CACHE_VARIANTS])
+
+def invalidate_from_command(*keys):
+  """invalidate(*keys), or clear the whole cache without keys, from a
+  `flask` command. That only reaches the app with a shared backend; the
+  command's own 'lru' cache is not the app's, so then it says so instead.
+  """
+  if not cache.shared:
+    click.echo('CACHE_BACKEND is {!r}, so the running app keeps the pages it cached for up to {} '
+               'seconds, or until it restarts.'.format(current_app.config['CACHE_BACKEND'],
+                                                       current_app.config['CACHE_DEFAULT_TIMEOUT']))
+  elif keys:
+    invalidate(*keys)
+  else:
+    cache.clear()
+
+def cached_fragment(key, template, load_context):
+  """Rendered `template`, cached under `key`:html.
+
+  `load_context` returns the template context and is only called on a miss.
+  Fragments hold page content only, never the layout, so flashed messages
+  and the navigation stay per request.
+  """
+  html = cache.get(key + ':html')
+  if html is None:
+    with cache.filling():
+      html = render_template(template, **load_context())
+    cache.set(key + ':html', html)
+  return Markup(html)
+
+def streamed_fragment(key, template, **context):
+  """Like cached_fragment, but yields the fragment as it renders on a miss.
+
+  The chunks are collected on the way through and cached once the fragment
+  is complete, so a miss still streams.
+  """
+  html = cache.get(key + ':html')
+  if html is not None:
+    yield Markup(html)
+    return
+
+  current_app.update_template_context(context)
+  chunks = []
+  with cache.filling():
+    for chunk in current_app.jinja_env.get_template(template).generate(context):
+      chunks.append(chunk)
+      yield Markup(chunk)
+  cache.set(key + ':html', ''.join(chunks))
+
+def _json_default(value):
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  raise TypeError('{!r} is not JSON serializable'.format(value))
+
+@lru_cache(maxsize=None)
+def _orjson():
+  try:
+    import orjson
+  except ImportError:
+    return None
+  return orjson
+
+def dumps(data):
+  """Serialize to JSON bytes, with orjson when it is installed."""
+  orjson = _orjson()
+  if orjson is not None:
+    return orjson.dumps(data)
+  return json.dumps(data, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+def cached_json(key, load):
+  """A conditional JSON response for the data cached under `key`.
+
+  The serialized body, its ETag and Last-Modified are cached under
+  `key`:json, so a revalidation that ends in 304 costs one cache lookup and
+  neither touches the database nor serializes anything. `load` is only
+  called on a miss; returns None if it finds nothing.
+  """
+  entry = cache.get(key + ':json')
+  if entry is None:
+    data = cache.get_or_set(key, load)
+    if data is None:
+      return None
+    body = dumps(data)
+    entry = {
+        'body': body,
+        'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+    }
+    cache.set(key + ':json', entry)
+
+  response = Response(entry['body'], mimetype='application/json')
+  response.set_etag(entry['etag'])
+  response.last_modified = entry['last_modified']
+  response.cache_control.no_cache = True
+  return response.make_conditional(request)
+
+def shows_generation():
+  """Token in every /shows page key; invalidating 'shows' retires them all."""
+  return cache.get_or_set('shows', time.time_ns)
+
+def shows_page_key(page):
+  return 'shows:{}:{}:{}:{}'.format(shows_generation(), page.cursor or '',
+                                   page.filters.get('start', ''), page.filters.get('end', ''))
+
+def venue_cache_keys(venue_id):
+  """Keys holding data about a venue, including profiles of its artists."""
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return ['venues', 'shows', 'venue:{}'.format(venue_id)] + \
+         ['artist:{}'.format(id) for id, in artist_ids]
+
+def artist_cache_keys(artist_id):
+  """Keys holding data about an artist, including profiles of its venues."""
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return ['artists', 'shows', 'artist:{}'.format(artist_id)] + \
+         ['venue:{}'.format(id) for id, in venue_ids]
+
+#----------------------------------------------------------------------------#
+# Show counters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+def count_show(venue_id, artist_id, upcoming, delta=1):
+  """Add `delta` to the upcoming or past show counter of a venue and artist.
+
+  The increments are issued as UPDATE ... SET n = n + delta in the current
+  session, so they commit or roll back together with the show itself.
+  """
+  for model, id in ((Venue, venue_id), (Artist, artist_id)):
+    column = model.upcoming_shows_count if upcoming else model.past_shows_count
+    model.query.filter(model.id == id) \
+        .update({column: column + delta}, synchronize_session=False)
+
+def roll_over_shows(now=None, batch_size=1000):
+  """Move shows whose start_time has passed from upcoming to past.
+
+  Returns the number of shows rolled over. Each batch is committed on its
+  own, and rows locked by a concurrent run are skipped.
+  """
+  now = now or datetime.now()
+  total = 0
+  while True:
+    due = db.session.query(Show.id, Show.venue_id, Show.artist_id) \
+        .filter(Show.is_upcoming, Show.start_time <= now) \
+        .order_by(Show.id) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    if not due:
+      return total
+
+    for model, moved in ((Venue, Counter(show.venue_id for show in due)),
+                         (Artist, Counter(show.artist_id for show in due))):
+      for id, n in moved.items():
+        model.query.filter(model.id == id).update({
+            model.upcoming_shows_count: model.upcoming_shows_count - n,
+            model.past_shows_count: model.past_shows_count + n,
+        }, synchronize_session=False)
+    Show.query.filter(Show.id.in_([show.id for show in due])) \
+        .update({Show.is_upcoming: False}, synchronize_session=False)
+    refresh_areas(venue_ids_areas(set(show.venue_id for show in due)))
+    db.session.commit()
+    total += len(due)
+
+def show_counter_drift(model, column):
+  """Rows of `model` whose counters disagree with the Show table.
+
+  `column` is the Show foreign key pointing at `model`. Each row carries
+  the stored counters and the ones recomputed from Show.is_upcoming, plus
+  archived_shows_count for the past shows no longer in Show.
+  """
+  counts = db.session.query(
+      column.label('id'),
+      db.func.count(Show.id).filter(Show.is_upcoming).label('upcoming'),
+      db.func.count(Show.id).filter(db.not_(Show.is_upcoming)).label('past'),
+  ).group_by(column).subquery()
+  upcoming = db.func.coalesce(counts.c.upcoming, 0)
+  past = db.func.coalesce(counts.c.past, 0) + model.archived_shows_count
+  return db.session.query(
+      model.id,
+      model.upcoming_shows_count,
+      model.past_shows_count,
+      upcoming.label('actual_upcoming'),
+      past.label('actual_past'),
+  ).outerjoin(counts, counts.c.id == model.id) \
+   .filter(db.or_(model.upcoming_shows_count != upcoming, model.past_shows_count != past)) \
+   .order_by(model.id) \
+   .all()
+
+#----------------------------------------------------------------------------#
+# Show batches.
+#----------------------------------------------------------------------------#
+
+# The parts of a recurrence rule the form takes, by FREQ. With them every
+# period of a rule (a day, a week, a month) has a date in it, so expanding
+# the rule costs time in proportion to the dates it gives. dateutil would
+# otherwise search up to the year 9999 for a date of rules like
+# FREQ=SECONDLY;BYMONTH=2;BYMONTHDAY=30, COUNT or UNTIL notwithstanding.
+RECURRENCE_PARTS = {
+  'DAILY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST', 'BYDAY'},
+  'WEEKLY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST', 'BYDAY'},
+  'MONTHLY': {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST', 'BYDAY', 'BYMONTHDAY'},
+}
+
+def recurrence_error(rule):
+  """Why the new show form does not take `rule`, or None; see
+  RECURRENCE_PARTS. Month days and the nth weekdays of a month are those
+  every month has: 1 to 28, counted from either end, and 1st to 4th."""
+  parts = {}
+  for part in rule.split(';'):
+    name, _, value = part.partition('=')
+    parts[name.strip().upper()] = value.strip().upper()
+  freq = parts.get('FREQ')
+  if freq not in RECURRENCE_PARTS:
+    return 'Repeat DAILY, WEEKLY or MONTHLY.'
+  extra = sorted(set(parts) - RECURRENCE_PARTS[freq])
+  if extra:
+    return 'FREQ={} does not take {}.'.format(freq, ', '.join(extra))
+  if 'BYDAY' in parts and 'BYMONTHDAY' in parts:
+    return 'Give BYDAY or BYMONTHDAY, not both.'
+  for day in parts.get('BYDAY', '').split(','):
+    nth = day[:-2]
+    if nth and freq != 'MONTHLY':
+      return 'Only MONTHLY rules take the nth weekday of a month.'
+    if nth and not (nth.lstrip('+-').isdigit() and 1 <= int(nth.lstrip('+-')) <= 4):
+      return 'BYDAY takes the 1st to 4th weekday of a month, from the start (1FR) or the end (-1FR).'
+  for day in filter(None, parts.get('BYMONTHDAY', '').split(',')):
+    if not (day.lstrip('+-').isdigit() and 1 <= int(day.lstrip('+-')) <= 28):
+      return 'BYMONTHDAY takes days 1 to 28, or -1 to -28 counted from the end of the month.'
+  return None
+
+def expand_show_times(start_time, recurrence=None, dates=None, limit=None):
+  """The start times a new show listing asks for.
+
+  They are `start_time`, the occurrences of `recurrence`, an RFC 5545 rule
+  such as FREQ=WEEKLY;COUNT=50 that starts at `start_time`, and `dates`,
+  one per line or comma, at the time of `start_time` unless they give one.
+  Returns the distinct times in order, and (text, error) for every part
+  that could not be read, a rule that gives no dates or is not one
+  recurrence_error() takes, or any times past SHOW_BATCH_LIMIT.
+  """
+  import dateutil.parser
+  import dateutil.rrule
+  limit = limit or current_app.config['SHOW_BATCH_LIMIT']
+  times, problems = {start_time}, []
+  rule = (recurrence or '').strip()
+  if rule.upper().startswith('RRULE:'):
+    rule = rule[len('RRULE:'):]
+  error = rule and recurrence_error(rule)
+  if error:
+    problems.append((recurrence, error))
+  elif rule:
+    try:
+      occurrences = list(islice(dateutil.rrule.rrulestr(rule, dtstart=start_time), limit + 1))
+    except (ValueError, TypeError) as e:
+      problems.append((recurrence, 'Not a valid recurrence rule: {}'.format(e)))
+    else:
+      if not occurrences:
+        problems.append((recurrence, 'The rule gives no dates from the start time on.'))
+      elif len(occurrences) > limit:
+        problems.append((recurrence, 'Repeats more than {} times; give it a COUNT or UNTIL.'.format(limit)))
+      elif any(value.tzinfo for value in occurrences):
+        problems.append((recurrence, 'Give times without a time zone.'))
+      else:
+        times.update(occurrences)
+  for text in (dates or '').replace(',', '\n').splitlines():
+    text = text.strip()
+    if not text:
+      continue
+    try:
+      value = dateutil.parser.parse(text, default=start_time)
+    except (ValueError, OverflowError):
+      problems.append((text, 'Not a date.'))
+      continue
+    if value.tzinfo:
+      problems.append((text, 'Give times without a time zone.'))
+    else:
+      times.add(value)
+  if len(times) > limit:
+    problems.append(('{} shows'.format(len(times)), 'At most {} shows can be listed at once.'.format(limit)))
+  return sorted(times), problems
+
+def show_batch_rows(venue_id, artist_id, times, now=None):
+  """A Show row for each of `times`, with an 'error' when the venue or the
+  artist already has a show then.
+
+  Those shows are found in one query, on the (venue_id, start_time) and
+  (artist_id, start_time) indexes.
+  """
+  now = now or datetime.now()
+  taken = {}
+  for show in db.session.query(Show.venue_id, Show.start_time) \
+      .filter(Show.start_time.in_(times), db.or_(Show.venue_id == venue_id, Show.artist_id == artist_id)):
+    who = 'venue' if show.venue_id == venue_id else 'artist'
+    taken.setdefault(show.start_time, 'The {} already has a show at this time.'.format(who))
+  return [{
+      "venue_id": venue_id,
+      "artist_id": artist_id,
+      "start_time": start_time,
+      "is_upcoming": start_time > now,
+      "error": taken.get(start_time),
+  } for start_time in times]
+
+def insert_shows(venue_id, artist_id, rows):
+  """Insert the show_batch_rows() `rows` with a single multi-row INSERT.
+
+  The counters and the area summary are updated in the same session, so
+  everything commits or rolls back together.
+  """
+  columns = ('venue_id', 'artist_id', 'start_time', 'is_upcoming')
+  db.session.execute(Show.__table__.insert().values([{column: row[column] for column in columns} for row in rows]))
+  upcoming = sum(1 for row in rows if row['is_upcoming'])
+  for is_upcoming, delta in ((True, upcoming), (False, len(rows) - upcoming)):
+    if delta:
+      count_show(venue_id, artist_id, upcoming=is_upcoming, delta=delta)
+  refresh_areas([venue_area(venue_id)])
+
+#----------------------------------------------------------------------------#
+# Area summary.
+#----------------------------------------------------------------------------#
+
+# First key of the advisory locks refresh_areas() takes, the second being
+# a hash of the area.
+AREA_LOCK_NAMESPACE = 0x41726561
+
+def _in_area(model, area):
+  city, state = area
+  return db.and_(model.city == city, model.state == state)
+
+def venue_area(venue_id):
+  """The (city, state) of a venue, or None."""
+  row = db.session.query(Venue.city, Venue.state).filter(Venue.id == venue_id).first()
+  return tuple(row) if row else None
+
+def venue_ids_areas(venue_ids):
+  """The distinct (city, state) pairs of `venue_ids`."""
+  venue_ids = list(venue_ids)
+  if not venue_ids:
+    return set()
+  return set(tuple(row) for row in db.session.query(Venue.city, Venue.state)
+             .filter(Venue.id.in_(venue_ids)).distinct())
+
+def refresh_areas(areas, now=None):
+  """Recompute the AreaSummary rows of `areas`, (city, state) pairs.
+
+  Runs in the current session, so the summary commits or rolls back with
+  the write that changed it. Areas left without venues lose their row.
+
+  Two writers in one area would otherwise race: both delete its row and
+  insert a new one, and one fails on the unique (state, city) index or
+  commits counts read before the other committed. So on PostgreSQL each
+  area is first locked for the rest of the transaction, and only then are
+  its venues read, which sees every write that held the lock before.
+  Rows are written with INSERT ... ON CONFLICT (state, city) DO UPDATE.
+  SQLite needs no lock, as it lets one writer in at a time.
+  """
+  areas = sorted(set(area for area in areas if area is not None),
+                 key=lambda area: tuple(part or '' for part in area))
+  if not areas:
+    return
+  now = now or datetime.now()
+  dialect = db.session.bind.dialect.name
+  if dialect == 'postgresql':
+    # Always in the same order, so two writers cannot deadlock.
+    for city, state in areas:
+      db.session.execute(db.text('SELECT pg_advisory_xact_lock(:namespace, hashtext(:area))'),
+                         {'namespace': AREA_LOCK_NAMESPACE, 'area': '{}\x1f{}'.format(state, city)})
+
+  rows = [dict(area, refreshed_at=now)
+          for area in group_venue_areas(db.or_(*[_in_area(Venue, area) for area in areas]))]
+  if rows:
+    insert = (postgresql_insert if dialect == 'postgresql' else sqlite_insert)(AreaSummary.__table__).values(rows)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['state', 'city'],
+        set_={'venues': insert.excluded.venues, 'refreshed_at': insert.excluded.refreshed_at}))
+  empty = set(areas) - set((row['city'], row['state']) for row in rows)
+  if empty:
+    AreaSummary.query.filter(db.or_(*[_in_area(AreaSummary, area) for area in empty])) \
+        .delete(synchronize_session=False)
+
+def rebuild_area_summary(now=None):
+  """Replace every AreaSummary row; returns the number of areas.
+
+  On PostgreSQL the table is locked first, so refresh_areas() calls wait
+  for the rebuild instead of writing rows between its delete and insert.
+  """
+  now = now or datetime.now()
+  if db.session.bind.dialect.name == 'postgresql':
+    db.session.execute(db.text('LOCK TABLE "AreaSummary" IN EXCLUSIVE MODE'))
+  AreaSummary.query.delete(synchronize_session=False)
+  areas = group_venue_areas()
+  db.session.add_all([AreaSummary(refreshed_at=now, **area) for area in areas])
+  return len(areas)
+
+def area_summary_drift():
+  """(city, state, problem) for every AreaSummary row that is out of date."""
+  stored = {(row.city, row.state): row.venues for row in AreaSummary.query}
+  drift = []
+  for area in group_venue_areas():
+    key = (area['city'], area['state'])
+    venues = stored.pop(key, None)
+    if venues is None:
+      drift.append(key + ('missing',))
+    elif venues != area['venues']:
+      drift.append(key + ('stale',))
+  drift.extend(key + ('no venues left',) for key in stored)
+  return drift
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+def nearby_index():
+  """This app's geo.NearbyIndex, used by nearby_venues() where there is no
+  earthdistance index; see create_app()."""
+  return current_app.extensions['fyyur']['nearby']
+
+def locate_venue(venue):
+  """Set the coordinates of `venue` from GAZETTEER_PATH, if there is one;
+  cleared when its city is not in it."""
+  path = current_app.config.get('GAZETTEER_PATH')
+  if path and os.path.exists(path):
+    venue.latitude, venue.longitude = geo.gazetteer(path).get(geo.area_key(venue.city, venue.state), (None, None))
+
+def geocode_venues(places, overwrite=False):
+  """Set venue coordinates from `places`, a geo.load_gazetteer() result,
+  with one UPDATE per area.
+
+  Only venues without coordinates are changed unless `overwrite`. Returns
+  the number of venues located and the (city, state, venues) not found.
+  """
+  located, missing = 0, []
+  areas = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id)).group_by(Venue.city, Venue.state)
+  if not overwrite:
+    areas = areas.filter(Venue.latitude.is_(None))
+  for city, state, venues in areas.all():
+    point = places.get(geo.area_key(city, state))
+    if point is None:
+      missing.append((city, state, venues))
+      continue
+    query = Venue.query.filter(_in_area(Venue, (city, state)))
+    if not overwrite:
+      query = query.filter(Venue.latitude.is_(None))
+    located += query.update({Venue.latitude: point[0], Venue.longitude: point[1]}, synchronize_session=False)
+  return located, missing
+
+def nearby_venues(lat, lng, radius, limit):
+  """Venues within `radius` km of (lat, lng), nearest first, with their
+  distance and number of upcoming shows.
+
+  On PostgreSQL this is one query, which finds the venues in a box around
+  the point with the ix_Venue_location index and then checks and sorts
+  them by distance. Elsewhere nearby_index finds them, and one query
+  fetches them.
+  """
+  columns = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+             Venue.latitude, Venue.longitude, Venue.upcoming_shows_count)
+  if db.session.bind.dialect.name == 'postgresql':
+    point = db.func.ll_to_earth(lat, lng)
+    location = db.func.ll_to_earth(Venue.latitude, Venue.longitude)
+    distance = db.func.earth_distance(point, location)
+    rows = [(row, row.distance / 1000) for row in db.session.query(*columns, distance.label('distance'))
+            .filter(db.func.earth_box(point, radius * 1000).op('@>')(location), distance <= radius * 1000)
+            .order_by(distance, Venue.id).limit(limit)]
+  else:
+    matches = nearby_index().search(lat, lng, radius, limit, max_age=current_app.config['NEARBY_MAX_AGE'])
+    venues = {row.id: row for row in db.session.query(*columns).filter(Venue.id.in_([id for id, _ in matches]))}
+    rows = [(venues[id], distance) for id, distance in matches if id in venues]
+  return [{
+      "id": row.id,
+      "name": row.name,
+      "city": row.city,
+      "state": row.state,
+      "address": row.address,
+      "latitude": row.latitude,
+      "longitude": row.longitude,
+      "distance_km": round(distance, 2),
+      "num_upcoming_shows": row.upcoming_shows_count,
+    } for row, distance in rows]
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -106,136 +999,60 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  
-  # Query to get all venues and group them by city and state
-  venues_query = db.session.query(Venue).all()
-  
-  # Create a dictionary to store the data
-  data = []
-  cities_states = set((venue.city, venue.state) for venue in venues_query)
-  
-  for city_state in cities_states:
-      city, state = city_state
-      venues_in_city_state = [venue for venue in venues_query if venue.city == city and venue.state == state]
-      
-      venues_data = []
-      for venue in venues_in_city_state:
-          num_upcoming_shows = len([show for show in venue.shows if show.start_time > datetime.now()])
-          venues_data.append({
-              "id": venue.id,
-              "name": venue.name,
-              "num_upcoming_shows": num_upcoming_shows,
-          })
-      
-      data.append({
-          "city": city,
-          "state": state,
-          "venues": venues_data
-      })
-  
-  return render_template('pages/venues.html', areas=data);
+  # num_upcoming_shows comes from the maintained counters, see venue_areas().
+  genre = request.args.get('genre', '').strip()
+  if genre:
+    # Filtered lists are a GIN index lookup and are not cached, so writes
+    # never have to invalidate one key per genre.
+    content = Markup(render_template('fragments/venues.html', areas=venue_areas(genre)))
+  else:
+    content = cached_fragment('venues', 'fragments/venues.html',
+                              lambda: {'areas': cache.get_or_set('venues', venue_areas)})
+  return render_template('pages/venues.html', content=content, genre=genre)
 
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on venues with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  
-  search_term = request.form.get('search_term', '')
-  search_term = f"%{search_term.lower()}%"
-  
-  # Perform case-insensitive search using SQLAlchemy
-  venues_query = Venue.query.filter(Venue.name.ilike(search_term)).all()
-  
-  # Prepare the response data
-  response = {
-      "count": len(venues_query),
-      "data": []
-  }
-  
-  for venue in venues_query:
-      num_upcoming_shows = len([show for show in venue.shows if show.start_time > datetime.now()])
-      response["data"].append({
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows": num_upcoming_shows,
-      })
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  # Partial, case-insensitive search: "Music" returns "The Musical Hop" and
+  # "Park Square Live Music & Coffee", best matches first.
+  search_term = request.form.get('search_term', '').strip()
+  response = search_results(Venue, search_term, request.form.get('cursor'))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-
-  # Query the venue by ID
-  venue = Venue.query.get(venue_id)
+  key = 'venue:{}'.format(venue_id)
+  cursor = request.args.get('past')
+  if cursor:
+    # Older pages of past shows are not cached, as for /venues?genre=.
+    venue = venue_profile(venue_id, cursor)
+  else:
+    venue = cache.get_or_set(key, lambda: venue_profile(venue_id))
   if not venue:
       return render_template('errors/404.html'), 404
-  
-  # Query the past shows
-  past_shows = Show.query.filter(Show.venue_id == venue_id, Show.start_time < datetime.now()).all()
-  past_shows_data = []
-  for show in past_shows:
-      past_shows_data.append({
-          "artist_id": show.artist.id,
-          "artist_name": show.artist.name,
-          "artist_image_link": show.artist.image_link,
-          "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-      })
-
-  # Query the upcoming shows
-  upcoming_shows = Show.query.filter(Show.venue_id == venue_id, Show.start_time > datetime.now()).all()
-  upcoming_shows_data = []
-  for show in upcoming_shows:
-      upcoming_shows_data.append({
-          "artist_id": show.artist.id,
-          "artist_name": show.artist.name,
-          "artist_image_link": show.artist.image_link,
-          "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-      })
-
-  # Create the data structure
-
-  # venue.genres = [Genre("Rock"), Genre("Jazz")]
-  data = {
-      "id": venue.id,
-      "name": venue.name,
-      # "genres": [genre.name for genre in venue.genres],
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link,
-      "past_shows": past_shows_data,
-      "upcoming_shows": upcoming_shows_data,
-      "past_shows_count": len(past_shows_data),
-      "upcoming_shows_count": len(upcoming_shows_data),
-  }
-  # data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_venue.html', venue=data)
+
+  if cursor:
+    content = Markup(render_template('fragments/show_venue.html', venue=venue))
+  else:
+    content = cached_fragment(key, 'fragments/show_venue.html', lambda: {'venue': venue})
+  return render_template('pages/show_venue.html', venue=venue, content=content)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
+    from forms import VenueForm
     form = VenueForm(request.form)
 
     if form.validate():
@@ -254,14 +1071,20 @@ def create_venue_submission():
                 seeking_description=form.seeking_description.data,
                 image_link=form.image_link.data
             )
+            locate_venue(new_venue)
 
             # Add the new Venue to the database
             db.session.add(new_venue)
+            db.session.flush()
+            refresh_areas([(new_venue.city, new_venue.state)])
             db.session.commit()
+            invalidate('venues')
+            autocomplete_indexes()['venues'].set(new_venue.id, new_venue.name)
+            nearby_index().invalidate()
 
             # Flash success message
             flash('Venue ' + new_venue.name + ' was successfully listed!')
-            return redirect(url_for('index'))
+            return redirect(url_for('fyyur.index'))
 
         except Exception as e:
             # Rollback in case of error and flash error message
@@ -273,7 +1096,7 @@ def create_venue_submission():
     flash('Please correct the errors below and try again.')
     return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     try:
         # Find the venue by its ID
@@ -282,136 +1105,104 @@ def delete_venue(venue_id):
         if venue is None:
             # Venue not found
             flash('Venue not found.')
-            return redirect(url_for('index'))
+            return redirect(url_for('fyyur.index'))
 
         # Delete the venue from the database
+        keys = venue_cache_keys(venue.id)
+        area = (venue.city, venue.state)
         db.session.delete(venue)
+        db.session.flush()
+        refresh_areas([area])
         db.session.commit()
+        invalidate(*keys)
+        autocomplete_indexes()['venues'].discard(venue.id)
+        nearby_index().invalidate()
+        purge_image(venue.image_link)
 
         # Flash success message
         flash('Venue ' + venue.name + ' was successfully deleted!')
-        return redirect(url_for('index'))
+        return redirect(url_for('fyyur.index'))
 
     except Exception as e:
         # Rollback in case of error and flash error message
         db.session.rollback()
         flash('An error occurred. Venue could not be deleted. Error: ' + str(e))
-        return redirect(url_for('index'))
+        return redirect(url_for('fyyur.index'))
     
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-
-    # Query all artists from the database
-    artists = Artist.query.all()
-    
-    # Format the data to match the expected structure
-    data = [{"id": artist.id, "name": artist.name} for artist in artists]
-    
-    return render_template('pages/artists.html', artists=data)
+  genre = request.args.get('genre', '').strip()
+  if genre:
+    # Not cached, as for /venues?genre=.
+    content = Markup(render_template('fragments/artists.html', artists=artist_list(genre)))
+  else:
+    content = cached_fragment('artists', 'fragments/artists.html',
+                              lambda: {'artists': cache.get_or_set('artists', artist_list)})
+  return render_template('pages/artists.html', content=content, genre=genre)
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  
-  search_term = request.form.get('search_term', '').strip().lower()
-    
-  # Query the database for artists with names containing the search term
-  artists = Artist.query.filter(
-      Artist.name.ilike(f'%{search_term}%')
-  ).all()
-  
-  # Format the data for response
-  response = {
-      "count": len(artists),
-      "data": [{
-          "id": artist.id,
-          "name": artist.name,
-          "num_upcoming_shows": len(UpcomingShow.query.filter_by(artist_id=artist.id).all()) 
-      } for artist in artists]
-  }
+  # Partial, case-insensitive search: "A" returns "Guns N Petals", "Matt
+  # Quevado" and "The Wild Sax Band", best matches first.
+  search_term = request.form.get('search_term', '').strip()
+  response = search_results(Artist, search_term, request.form.get('cursor'))
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
-  # return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  # Query the artist with the given artist_id from the database
-    artist = Artist.query.get(artist_id)
+    key = 'artist:{}'.format(artist_id)
+    cursor = request.args.get('past')
+    if cursor:
+        # Older pages of past shows are not cached, as for show_venue.
+        artist = artist_profile(artist_id, cursor)
+    else:
+        artist = cache.get_or_set(key, lambda: artist_profile(artist_id))
     
     if artist is None:
         # Handle the case where the artist_id does not exist
         flash('Artist not found!', 'error')
-        return redirect(url_for('artists'))
-    
-    # Query the past shows for this artist
-    past_shows = Show.query.filter(Show.artist_id == artist_id, Show.start_time < datetime.utcnow()).all()
-    upcoming_shows = Show.query.filter(Show.artist_id == artist_id, Show.start_time >= datetime.utcnow()).all()
-    
-    # Format the data
-    data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": artist.genres.split(','),
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "website": artist.website,
-        "facebook_link": artist.facebook_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "image_link": artist.image_link,
-        "past_shows": [{
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.isoformat()
-        } for show in past_shows],
-        "upcoming_shows": [{
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.isoformat()
-        } for show in upcoming_shows],
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
-    }
+        return redirect(url_for('fyyur.artists'))
     
-    return render_template('pages/show_artist.html', artist=data)
+    if cursor:
+        content = Markup(render_template('fragments/show_artist.html', artist=artist))
+    else:
+        content = cached_fragment(key, 'fragments/show_artist.html', lambda: {'artist': artist})
+    return render_template('pages/show_artist.html', artist=artist, content=content)
 
 #  Update
 #  ----------------------------------------------------------------
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
     artist = Artist.query.get(artist_id)
     
     if artist is None:
         flash('Artist not found!', 'error')
-        return redirect(url_for('artists'))
+        return redirect(url_for('fyyur.artists'))
 
     form = ArtistForm(obj=artist)
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
+    from forms import ArtistForm
     form = ArtistForm(request.form)
     artist = Artist.query.get(artist_id)
 
     if artist is None:
         flash('Artist not found!', 'error')
-        return redirect(url_for('artists'))
+        return redirect(url_for('fyyur.artists'))
 
     if form.validate():
         try:
             # Update artist with new data from the form
+            old_image_link = artist.image_link
             artist.name = form.name.data
-            artist.genres = ','.join(form.genres.data)  # Assuming genres is a list
+            artist.genres = form.genres.data
             artist.city = form.city.data
             artist.state = form.state.data
             artist.phone = form.phone.data
@@ -422,8 +1213,12 @@ def edit_artist_submission(artist_id):
             artist.image_link = form.image_link.data
 
             db.session.commit()
+            invalidate(*artist_cache_keys(artist_id))
+            autocomplete_indexes()['artists'].set(artist.id, artist.name)
+            if artist.image_link != old_image_link:
+                purge_image(old_image_link)
             flash(f'Artist {artist.name} was successfully updated!', 'success')
-            return redirect(url_for('show_artist', artist_id=artist_id))
+            return redirect(url_for('fyyur.show_artist', artist_id=artist_id))
         except Exception as e:
             db.session.rollback()
             flash('An error occurred. Artist could not be updated.', 'error')
@@ -434,15 +1229,16 @@ def edit_artist_submission(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   # Query the database to get the venue with the specified ID
   venue = Venue.query.get(venue_id)
 
   # If the venue is not found, flash an error message and redirect to the venues list page
   if venue is None:
       flash('Venue not found!', 'error')
-      return redirect(url_for('venues'))
+      return redirect(url_for('fyyur.venues'))
 
   # Initialize the form with values from the venue object
   form = VenueForm(obj=venue)
@@ -450,18 +1246,19 @@ def edit_venue(venue_id):
   # Render the edit venue template with the form and venue data
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
 
+    from forms import VenueForm
   # Retrieve the venue from the database using the provided ID
     venue = Venue.query.get(venue_id)
 
     # If the venue is not found, flash an error message and redirect to the venues list page
     if venue is None:
         flash('Venue not found!', 'error')
-        return redirect(url_for('venues'))
+        return redirect(url_for('fyyur.venues'))
 
     # Populate the venue object with data from the form
     form = VenueForm(request.form, obj=venue)
@@ -470,10 +1267,21 @@ def edit_venue_submission(venue_id):
     if form.validate():
         try:
             # Update the venue with the new data from the form
+            old_area = (venue.city, venue.state)
+            old_image_link = venue.image_link
             form.populate_obj(venue)
+            if (venue.city, venue.state) != old_area or venue.latitude is None:
+                locate_venue(venue)
+            db.session.flush()
+            refresh_areas([old_area, (venue.city, venue.state)])
             
             # Commit the changes to the database
             db.session.commit()
+            invalidate(*venue_cache_keys(venue_id))
+            autocomplete_indexes()['venues'].set(venue.id, venue.name)
+            nearby_index().invalidate()
+            if venue.image_link != old_image_link:
+                purge_image(old_image_link)
 
             # Flash a success message
             flash('Venue ' + venue.name + ' was successfully updated!', 'success')
@@ -483,20 +1291,22 @@ def edit_venue_submission(venue_id):
             flash('An error occurred. Venue ' + venue.name + ' could not be updated. Error: ' + str(e), 'error')
     
     # Redirect to the venue's detail page
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('fyyur.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   
+  from forms import ArtistForm
   form = ArtistForm(request.form)
     
   if form.validate():
@@ -518,6 +1328,8 @@ def create_artist_submission():
           # Add the new artist to the session and commit to the database
           db.session.add(artist)
           db.session.commit()
+          invalidate('artists')
+          autocomplete_indexes()['artists'].set(artist.id, artist.name)
           
           # Flash success message
           flash('Artist ' + artist.name + ' was successfully listed!', 'success')
@@ -539,73 +1351,526 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  # Query the database to get all shows
-  shows = Show.query.join(Artist).join(Venue).all()
-  
-  data = []
-  for show in shows:
-      data.append({
-          "venue_id": show.venue_id,
-          "venue_name": show.venue.name,
-          "artist_id": show.artist_id,
-          "artist_name": show.artist.name,
-          "artist_image_link": show.artist.image_link,
-          "start_time": show.start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-      })
-  
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/create')
+  # displays list of shows at /shows, one page at a time. The page is
+  # streamed, so the first bytes go out before all of its rows are read.
+  page = ShowsPage(
+      cursor=request.args.get('cursor'),
+      start=request.args.get('start', type=_parse_date),
+      end=request.args.get('end', type=_parse_date),
+  )
+  content = streamed_fragment(shows_page_key(page), 'fragments/shows.html', shows=page)
+  return Response(stream_template('pages/shows.html', filters=page.filters, content=content))
+
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
+  from forms import ShowForm
   form = ShowForm()
+  # Reload stale picker indexes now rather than on the first keystroke.
+  warm_autocomplete()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
+  from forms import ShowForm
   try:
         # Get form data
-        artist_id = request.form['artist_id']
-        venue_id = request.form['venue_id']
-        start_time = request.form['start_time']
-
-        # Create a new Show record
-        new_show = Show(
-            artist_id=artist_id,
-            venue_id=venue_id,
-            start_time=start_time
-        )
-
-        # Add and commit the new Show to the database
-        db.session.add(new_show)
+        artist_id = int(request.form['artist_id'])
+        venue_id = int(request.form['venue_id'])
+        import dateutil.parser
+        start_time = dateutil.parser.parse(request.form['start_time'])
+
+        # Check both ids in one round trip instead of finding out from a
+        # foreign key violation after the insert.
+        artist_exists, venue_exists = db.session.query(
+            db.exists().where(Artist.id == artist_id),
+            db.exists().where(Venue.id == venue_id),
+        ).one()
+        if not (artist_exists and venue_exists):
+            for label, id, exists in (('artist', artist_id, artist_exists), ('venue', venue_id, venue_exists)):
+                if not exists:
+                    flash('There is no {} with ID {}.'.format(label, id))
+            return render_template('forms/new_show.html', form=ShowForm(request.form)), 400
+
+        # A residency can be listed at once, with a recurrence rule and/or a
+        # list of dates. Every show is checked on its own, and all of them
+        # are listed together or none is.
+        times, problems = expand_show_times(start_time, request.form.get('recurrence'), request.form.get('dates'))
+        rows = show_batch_rows(venue_id, artist_id, times)
+        rejected = len(problems) + sum(1 for row in rows if row['error'])
+        if rejected:
+            show_rows = [{'text': text, 'start_time': None, 'error': error} for text, error in problems] + rows
+            flash('{} of the shows could not be listed, so none were. Fix or remove them and try again.'.format(rejected))
+            return render_template('forms/new_show.html', form=ShowForm(request.form), show_rows=show_rows), 400
+
+        # Insert the shows and bump the venue and artist counters in the
+        # same transaction
+        insert_shows(venue_id, artist_id, rows)
         db.session.commit()
+        invalidate('venues', 'shows', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id))
 
         # On successful db insert, flash success
-        flash('Show was successfully listed!')
+        if len(rows) == 1:
+            flash('Show was successfully listed!')
+        else:
+            flash('{} shows were successfully listed!'.format(len(rows)))
   except Exception as e:
       # Rollback in case of error
       db.session.rollback()
       flash(f'An error occurred. Show could not be listed. Error: {str(e)}')
-  finally:
-      # Close the session
-      db.session.close()
 
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Autocomplete
+#  ----------------------------------------------------------------
+#  Name lookups for the show form's artist and venue pickers, answered from
+#  per-process prefix indexes; see autocomplete.py.
+
+def autocomplete_indexes():
+  """This app's autocomplete.PrefixIndex per kind; see create_app()."""
+  return current_app.extensions['fyyur']['autocomplete']
+
+def warm_autocomplete():
+  """Load the indexes that are not loaded yet or are older than
+  AUTOCOMPLETE_MAX_AGE. gunicorn.conf.py calls this in the master, so the
+  workers fork with them loaded."""
+  for index in autocomplete_indexes().values():
+    index.warm(current_app.config['AUTOCOMPLETE_MAX_AGE'])
+
+@bp.route('/api/autocomplete/<any(artists, venues):kind>')
+def api_autocomplete(kind):
+  limit = min(max(request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT'], type=int), 1), 50)
+  matches = autocomplete_indexes()[kind].search(
+      request.args.get('q', ''), limit=limit, max_age=current_app.config['AUTOCOMPLETE_MAX_AGE'])
+  return Response(dumps(matches), mimetype='application/json')
+
+#  Nearby
+#  ----------------------------------------------------------------
+
+@bp.route('/venues/nearby')
+def venues_nearby():
+  # ?lat=&lng=&radius= in degrees and km; venues without coordinates,
+  # see `flask geocode-venues`, are never returned.
+  lat = request.args.get('lat', type=float)
+  lng = request.args.get('lng', type=float)
+  radius = request.args.get('radius', current_app.config['NEARBY_DEFAULT_RADIUS'], type=float)
+  if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+    error = 'lat and lng must be given, in degrees'
+  elif not 0 < radius <= current_app.config['NEARBY_MAX_RADIUS']:
+    error = 'radius must be between 0 and {} km'.format(current_app.config['NEARBY_MAX_RADIUS'])
+  else:
+    data = nearby_venues(lat, lng, radius, current_app.config['NEARBY_LIMIT'])
+    return Response(dumps({"radius_km": radius, "data": data}), mimetype='application/json')
+  return Response(dumps({"error": error}), status=400, mimetype='application/json')
+
+#  Images
+#  ----------------------------------------------------------------
+#  Resized, cached copies of image_link, linked by image_url() in the
+#  templates; see images.py.
+
+def purge_image(link):
+  """Purge the proxy's files of `link`, an image_link that was changed or
+  deleted, unless another venue or artist still uses it. Call it after the
+  commit."""
+  if not link:
+    return
+  used = db.session.query(db.or_(
+      db.exists().where(Venue.image_link == link),
+      db.exists().where(Artist.image_link == link),
+  )).scalar()
+  if not used:
+    image_proxy.purge(link)
+
+@bp.route('/img/<any(venues, artists):kind>/<int:id>/<any({}):size>'.format(', '.join(images.SIZES)))
+def image(kind, id, size):
+  model = Venue if kind == 'venues' else Artist
+  link = db.session.query(model.image_link).filter(model.id == id).scalar()
+  if not link or not image_proxy.enabled:
+    abort(404)
+  response = image_proxy.response(link, size)
+  if response is None:
+    return Response('Image unavailable', status=502, mimetype='text/plain',
+                    headers={'Cache-Control': 'public, max-age={}'.format(images.RETRY_AFTER)})
+  return response
+
+#  API
+#  ----------------------------------------------------------------
+#  Read-only JSON versions of the pages above, built from the same queries
+#  and cache entries. Every response carries an ETag and Last-Modified.
+
+def api_not_found():
+  return Response(dumps({"error": "not found"}), status=404, mimetype='application/json')
+
+def api_uncached(data):
+  if data is None:
+    return api_not_found()
+  return Response(dumps(data), mimetype='application/json')
+
+@bp.route('/api/v1/venues')
+def api_venues():
+  return cached_json('venues', venue_areas)
+
+@bp.route('/api/v1/venues/<int:venue_id>')
+def api_venue(venue_id):
+  # ?past=<past_shows_next_cursor> pages through past shows, uncached.
+  if request.args.get('past'):
+    return api_uncached(venue_profile(venue_id, request.args['past']))
+  return cached_json('venue:{}'.format(venue_id), lambda: venue_profile(venue_id)) or api_not_found()
+
+@bp.route('/api/v1/artists')
+def api_artists():
+  return cached_json('artists', artist_list)
+
+@bp.route('/api/v1/artists/<int:artist_id>')
+def api_artist(artist_id):
+  if request.args.get('past'):
+    return api_uncached(artist_profile(artist_id, request.args['past']))
+  return cached_json('artist:{}'.format(artist_id), lambda: artist_profile(artist_id)) or api_not_found()
+
+@bp.route('/api/v1/shows')
+def api_shows():
+  # Same pagination as /shows: follow next_cursor until it is null.
+  page = ShowsPage(
+      cursor=request.args.get('cursor'),
+      start=request.args.get('start', type=_parse_date),
+      end=request.args.get('end', type=_parse_date),
+  )
+
+  def load():
+    data = list(page)
+    return {"data": data, "next_cursor": page.next_cursor}
+
+  return cached_json(shows_page_key(page), load)
+
+#  Exports
+#  ----------------------------------------------------------------
+
+@bp.route('/export/<kind>.<format>')
+def export(kind, format):
+  # Streams the whole table, filtered by the query string, without ever
+  # holding more than one chunk of rows.
+  if kind not in EXPORT_COLUMNS or format not in exporter.available_formats():
+    abort(404)
+  rows = export_rows(
+      kind,
+      start=request.args.get('start', type=_parse_date),
+      end=request.args.get('end', type=_parse_date),
+      city=request.args.get('city'),
+      state=request.args.get('state'),
+      venue_id=request.args.get('venue_id', type=int),
+      artist_id=request.args.get('artist_id', type=int),
+  )
+  chunks = exporter.WRITERS[format](EXPORT_COLUMNS[kind], rows)
+  return Response(stream_with_context(chunks), mimetype=exporter.CONTENT_TYPES[format], headers={
+      'Content-Disposition': 'attachment; filename={}.{}'.format(kind, format),
+  })
+
+#  Internal
+#  ----------------------------------------------------------------
+
+@bp.route('/internal/cache')
+def cache_stats():
+  return jsonify(cache.stats())
+
+@bp.route('/internal/db-pool')
+def db_pool_stats():
+  # For this worker process only; multiply by the worker count.
+  status = dict(dbpool.pool_status(db.engine), profile=current_app.config['DB_PROFILE'])
+  if current_app.config['SQLALCHEMY_BINDS'].get(routing.REPLICA_BIND):
+    status['replica'] = dbpool.pool_status(db.get_engine(current_app, bind=routing.REPLICA_BIND))
+  return jsonify(status)
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@bp.cli.command('rollover-shows')
+def rollover_shows_command():
+  """Move shows that have started from the upcoming to the past counters.
+
+  Meant to be run periodically, e.g. every few minutes from cron.
+  """
+  total = roll_over_shows()
+  if total:
+    invalidate_from_command('venues')
+  click.echo('Rolled over {} show(s).'.format(total))
+
+@bp.cli.command('verify-show-counters')
+@click.option('--fix', is_flag=True, help='Overwrite drifted counters with the recomputed values.')
+def verify_show_counters_command(fix):
+  """Recompute venue and artist show counters from Show and report drift."""
+  drifted = 0
+  for model, column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    for row in show_counter_drift(model, column):
+      drifted += 1
+      click.echo('{} {}: upcoming {} != {}, past {} != {}'.format(
+          model.__tablename__, row.id,
+          row.upcoming_shows_count, row.actual_upcoming,
+          row.past_shows_count, row.actual_past))
+      if fix:
+        model.query.filter(model.id == row.id).update({
+            model.upcoming_shows_count: row.actual_upcoming,
+            model.past_shows_count: row.actual_past,
+        }, synchronize_session=False)
+
+  stale = Show.query.filter(Show.is_upcoming, Show.start_time <= datetime.now()).count()
+  if stale:
+    click.echo('{} show(s) have started but are still counted as upcoming; '
+               'run `flask rollover-shows`.'.format(stale))
+
+  if fix:
+    db.session.commit()
+    if drifted:
+      invalidate_from_command()
+  click.echo('{} counter row(s) drifted{}.'.format(drifted, ', fixed' if fix and drifted else ''))
+  if drifted and not fix:
+    sys.exit(1)
+
+@bp.cli.group('area-summary')
+def area_summary_group():
+  """Maintain the AreaSummary table behind /venues."""
+
+@area_summary_group.command('rebuild')
+def area_summary_rebuild_command():
+  """Recompute every area from Venue."""
+  areas = rebuild_area_summary()
+  db.session.commit()
+  invalidate_from_command('venues')
+  click.echo('Rebuilt {} area(s).'.format(areas))
+
+@area_summary_group.command('status')
+def area_summary_status_command():
+  """Report how old the summary is and which areas disagree with Venue."""
+  areas, oldest = db.session.query(db.func.count(AreaSummary.id), db.func.min(AreaSummary.refreshed_at)).one()
+  click.echo('{} area(s), oldest refreshed {}.'.format(
+      areas, '{} ago'.format(datetime.now() - oldest) if oldest else 'never'))
+  drift = area_summary_drift()
+  for city, state, problem in drift:
+    click.echo('{}, {}: {}'.format(city, state, problem))
+  click.echo('{} area(s) out of date{}.'.format(
+      len(drift), '; run `flask area-summary rebuild`' if drift else ''))
+  if drift:
+    sys.exit(1)
+
+@bp.cli.command('geocode-venues')
+@click.argument('gazetteer', required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option('--country', default='US', show_default=True,
+              help='Country code of the places to read from a GeoNames file.')
+@click.option('--all', 'overwrite', is_flag=True, help='Relocate venues that already have coordinates.')
+def geocode_venues_command(gazetteer, country, overwrite):
+  """Fill venue coordinates from a local gazetteer file, by city and state.
+
+  GAZETTEER is a CSV with city, state, latitude and longitude columns or a
+  GeoNames dump; GAZETTEER_PATH by default.
+  """
+  path = gazetteer or current_app.config['GAZETTEER_PATH']
+  if not path or not os.path.exists(path):
+    raise click.ClickException('No gazetteer file; pass one or set GAZETTEER_PATH.')
+  located, missing = geocode_venues(geo.load_gazetteer(path, country), overwrite=overwrite)
+  db.session.commit()
+  nearby_index().invalidate()
+  for city, state, venues in missing:
+    click.echo('{}, {}: not in the gazetteer ({} venue(s)).'.format(city, state, venues))
+  click.echo('Located {} venue(s); {} area(s) not found.'.format(located, len(missing)))
+
+@bp.cli.group('show-partitions')
+def show_partitions_group():
+  """Maintain the monthly partitions of Show (PostgreSQL only)."""
+  import partitions
+  if not partitions.is_partitioned():
+    raise click.ClickException('Show is not a partitioned table; run `flask db upgrade` on PostgreSQL.')
+
+@show_partitions_group.command('list')
+def show_partitions_list_command():
+  """List the partitions with their estimated rows, and the archived months."""
+  import partitions
+  for name, rows, bound in partitions.list_partitions():
+    click.echo('{:<16} {:>10} rows  {}'.format(name, max(rows, 0), bound))
+  for archive in ShowArchive.query.order_by(ShowArchive.range_start):
+    click.echo('{:<16} {:>10} rows  archived {:%Y-%m-%d} to {}'.format(
+        archive.partition, archive.rows, archive.archived_at, archive.path))
+
+@show_partitions_group.command('ensure')
+@click.option('--months-ahead', default=12, show_default=True, help='Months after this one to create.')
+def show_partitions_ensure_command(months_ahead):
+  """Create the partitions for the coming months.
+
+  Also splits off a partition for every month the default partition holds
+  shows of. Meant to be run periodically, e.g. daily from cron.
+  """
+  import partitions
+  created = partitions.ensure_partitions(months_ahead)
+  for name, moved in created:
+    click.echo('Created {}, moved {} show(s) from the default partition.'.format(name, moved))
+  click.echo('Created {} partition(s).'.format(len(created)))
+
+@show_partitions_group.command('archive')
+@click.option('--before', required=True, type=click.DateTime(['%Y-%m']),
+              help='Archive the months before this one (YYYY-MM).')
+@click.option('--dir', 'directory', type=click.Path(file_okay=False),
+              help='Where to write the archives; SHOW_ARCHIVE_DIR by default.')
+def show_partitions_archive_command(before, directory):
+  """Move whole past months of shows to gzipped CSV files and drop them."""
+  import partitions
+  try:
+    archived = partitions.archive_before(before, directory or current_app.config['SHOW_ARCHIVE_DIR'])
+  except ValueError as e:
+    raise click.ClickException(str(e))
+  finally:
+    invalidate_from_command()
+  for archive in archived:
+    click.echo('Archived {} show(s) of {} to {}.'.format(archive.rows, archive.partition, archive.path))
+  click.echo('Archived {} partition(s).'.format(len(archived)))
+
+@show_partitions_group.command('restore')
+@click.argument('name')
+def show_partitions_restore_command(name):
+  """Load an archived month back into Show."""
+  import partitions
+  try:
+    rows = partitions.restore_partition(name)
+  except ValueError as e:
+    raise click.ClickException(str(e))
+  finally:
+    invalidate_from_command()
+  click.echo('Restored {} show(s) to {}.'.format(rows, name))
+
+@bp.cli.command('build-assets')
+@click.option('--clean', is_flag=True, help='Remove earlier builds first.')
+def build_assets_command(clean):
+  """Fingerprint, bundle and precompress static/ into static/dist/.
+
+  Restart the app afterwards to serve the new build.
+  """
+  from assets import brotli
+  manifest = assets.build(clean=clean)
+  click.echo('Built {} asset(s) into {}.'.format(len(manifest), assets.dist_folder))
+  if brotli is None:
+    click.echo('The brotli package is not installed; only .gz copies were written.')
+
+@bp.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per committed batch.')
+@click.option('--errors', type=click.Path(dir_okay=False),
+              help='Rejected rows report, SOURCE.errors.ndjson by default.')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and start over.')
+def import_command(kind, source, format, batch_size, errors, restart):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file.
+
+  Rows are validated with the same forms as the create pages. Each batch
+  commits on its own, with the checkpoint that counts it; rerunning the
+  command resumes after the last one.
+  """
+  from importer import run_import
+  try:
+    run_import(kind, source, format=format, batch_size=batch_size,
+               errors_path=errors, restart=restart, echo=click.echo)
+  finally:
+    invalidate_from_command()
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_COLUMNS)))
+@click.option('--format', default='csv', show_default=True, type=click.Choice(sorted(exporter.WRITERS)))
+@click.option('--output', '-o', default='-', type=click.File('wb'), help='Output file, stdout by default.')
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='Shows on or after this date.')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Shows on or before this date.')
+@click.option('--city')
+@click.option('--state')
+@click.option('--venue-id', type=int)
+@click.option('--artist-id', type=int)
+def export_command(kind, format, output, start, end, city, state, venue_id, artist_id):
+  """Stream venues, artists or shows to a CSV, NDJSON or Parquet file."""
+  rows = export_rows(kind, start=start and start.date(), end=end and end.date(),
+                     city=city, state=state, venue_id=venue_id, artist_id=artist_id)
+  for chunk in exporter.WRITERS[format](EXPORT_COLUMNS[kind], rows):
+    output.write(chunk)
+
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+def _secret_key(app):
+  """The key in the instance folder, created on first use, so every worker
+  process signs sessions with the same key. SECRET_KEY overrides it."""
+  path = os.path.join(app.instance_path, 'secret_key')
+  if not os.path.exists(path):
+    os.makedirs(app.instance_path, exist_ok=True)
+    # Written aside and linked into place, so a worker racing this one
+    # either loses the link or reads the complete key.
+    staged = '{}.{}'.format(path, os.getpid())
+    with open(os.open(staged, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+      f.write(os.urandom(32))
+    try:
+      os.link(staged, path)
+    except FileExistsError:
+      pass
+    finally:
+      os.remove(staged)
+  with open(path, 'rb') as f:
+    return f.read()
+
+def create_app(config='config', overrides=None):
+  """Build the app from `config`, a module name or object, and the
+  `overrides` mapping on top of it, e.g. a test database.
+
+  Under gunicorn, load it once in the master with `--preload` so the
+  workers share it; see gunicorn.conf.py.
+  """
+  app = Flask(__name__)
+  app.config.from_object(config)
+  app.config.update(overrides or {})
+  if not app.config.get('SECRET_KEY'):
+    app.config['SECRET_KEY'] = _secret_key(app)
+
+  # Compiled templates are kept on disk, so a fresh process loads them
+  # instead of compiling each one again on its first render.
+  if app.config.get('JINJA_BYTECODE_CACHE_DIR'):
+    os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
+  db.init_app(app)
+  routing.init_app(app)
+  moment.init_app(app)
+  cache.init_app(app)
+  sqlstats.init_app(app)
+  assets.init_app(app)
+  image_proxy.init_app(app)
+  # Only `flask db` needs Flask-Migrate, and alembic with it.
+  if os.environ.get('FLASK_RUN_FROM_CLI'):
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+  # Per-process indexes, loaded from this app's database on first use:
+  # names for the show form's pickers, and venue coordinates where there
+  # is no earthdistance index; see autocomplete.py and geo.py.
+  app.extensions['fyyur'] = {
+      'autocomplete': {
+          'artists': autocomplete.PrefixIndex(lambda: db.session.query(Artist.id, Artist.name)),
+          'venues': autocomplete.PrefixIndex(lambda: db.session.query(Venue.id, Venue.name)),
+      },
+      'nearby': geo.NearbyIndex(lambda: db.session.query(Venue.id, Venue.latitude, Venue.longitude)
+                                .filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None))),
+  }
+
+  app.register_blueprint(bp)
+  compression.init_app(app)
+
+  if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
@@ -615,17 +1880,19 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+  return app
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
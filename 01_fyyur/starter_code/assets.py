@@ -0,0 +1,212 @@
+"""Fingerprinted, precompressed static files, built by `flask build-assets`.
+
+The build copies every file under static/ to static/dist/ with a hash of
+its content in its name (css/main.css becomes css/main.3f9a1c0b2d4e.css),
+concatenates the stylesheets of layouts/main.html into css/main.bundle.css,
+and writes .gz and, with the brotli package installed, .br copies of the
+compressible files next to them. dist/manifest.json maps each original name
+to its fingerprinted one. Relative url()s in stylesheets are rewritten to
+point at the fingerprinted files.
+
+Once a manifest exists, url_for('static', filename=...) returns the
+fingerprinted name, and the static view serves files under dist/ with a
+year-long immutable Cache-Control header, picking the .br or .gz copy the
+client accepts. Without one, static files are served as before. Rebuild
+after changing anything under static/, and restart the app to load the new
+manifest; earlier builds stay in place for pages still referring to them
+unless --clean is given.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Bundle name: the files concatenated into it, in order.
+BUNDLES = {
+    'css/main.bundle.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.ttf', '.otf', '.eot', '.ico', '.txt')
+# Smaller files gain too little from compression to be worth the copies.
+MIN_COMPRESS_SIZE = 1024
+# In order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_NOT_RELATIVE = re.compile(r'^(?:[a-z][a-z0-9+.-]*:|/|#)', re.I)
+
+
+def fingerprint(name, content):
+    stem, ext = posixpath.splitext(name)
+    return '{}.{}{}'.format(stem, hashlib.sha256(content).hexdigest()[:12], ext)
+
+
+def rewrite_css_urls(css, source, target, manifest):
+    """`css`, read from static/`source` and to be served as static/`target`,
+    with its relative url()s pointing at the fingerprinted files, or at the
+    original ones when they are not in `manifest`."""
+    def replace(match):
+        quote, url = match.groups()
+        if _NOT_RELATIVE.match(url):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        resolved = manifest.get(resolved, resolved)
+        return 'url({0}{1}{2}{0})'.format(
+            quote, posixpath.relpath(resolved, posixpath.dirname(target)), suffix)
+    return _CSS_URL.sub(replace, css)
+
+
+def _compress(path, content):
+    """Write the .gz and .br copies of `content` that are worth keeping."""
+    if not path.endswith(COMPRESSIBLE) or len(content) < MIN_COMPRESS_SIZE:
+        return
+    copies = [('.gz', gzip.compress(content, 9, mtime=0))]
+    if brotli is not None:
+        copies.append(('.br', brotli.compress(content)))
+    for suffix, compressed in copies:
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d != DIST]
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+
+
+class Assets(object):
+    """Serves the fingerprinted build of static/; see the module docstring.
+
+    Config keys:
+      ASSETS_FINGERPRINT    use the manifest when there is one, default True
+
+    Each app's manifest is kept in app.extensions['assets'].
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['assets'] = {}
+        app.url_defaults(self._fingerprinted)
+        app.view_functions['static'] = self.send_static
+        app.add_template_global(self.bundle, 'asset_bundle')
+        self.load(app)
+
+    @property
+    def manifest(self):
+        return current_app.extensions['assets']
+
+    @property
+    def dist_folder(self):
+        return os.path.join(current_app.static_folder, DIST)
+
+    def load(self, app=None):
+        """(Re)read the manifest of `app`, the current app by default."""
+        app = app or current_app._get_current_object()
+        path = os.path.join(app.static_folder, DIST, MANIFEST)
+        manifest = {}
+        if app.config.get('ASSETS_FINGERPRINT', True) and os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+        app.extensions['assets'] = manifest
+
+    def _fingerprinted(self, endpoint, values):
+        if endpoint == 'static':
+            manifest = self.manifest
+            if values.get('filename') in manifest:
+                values['filename'] = manifest[values['filename']]
+
+    def bundle(self, name):
+        """Filenames to link for bundle `name`: the bundle once built, the
+        files it is made of until then."""
+        return [name] if name in self.manifest else BUNDLES[name]
+
+    def build(self, clean=False):
+        """Build static/dist/ and load its manifest; returns the manifest."""
+        static_folder = current_app.static_folder
+        if clean and os.path.isdir(self.dist_folder):
+            shutil.rmtree(self.dist_folder)
+        manifest = {}
+
+        def write(name, content):
+            manifest[name] = posixpath.join(DIST, fingerprint(name, content))
+            path = os.path.join(static_folder, *manifest[name].split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            _compress(path, content)
+
+        def read(name):
+            with open(os.path.join(static_folder, *name.split('/')), 'rb') as f:
+                return f.read()
+
+        def css(name, target_dir):
+            # Fingerprints do not change the directory, so relative urls
+            # can be rewritten before the target name is known.
+            return rewrite_css_urls(read(name).decode('utf-8'), name,
+                                    posixpath.join(DIST, target_dir, 'x.css'), manifest)
+
+        # Stylesheets last, so the files they refer to are in the manifest.
+        sources = list(_source_files(static_folder))
+        for name in sources:
+            if not name.endswith('.css'):
+                write(name, read(name))
+        for name in sources:
+            if name.endswith('.css'):
+                write(name, css(name, posixpath.dirname(name)).encode('utf-8'))
+        for bundle, parts in BUNDLES.items():
+            content = '\n'.join(css(part, posixpath.dirname(bundle)) for part in parts)
+            write(bundle, content.encode('utf-8'))
+
+        path = os.path.join(self.dist_folder, MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+        self.load()
+        return manifest
+
+    def send_static(self, filename):
+        """The app's static view, with encodings and caching for dist/."""
+        if not filename.startswith(DIST + '/'):
+            return current_app.send_static_file(filename)
+        name = filename[len(DIST) + 1:]
+        for encoding, suffix in ENCODINGS:
+            path = safe_join(self.dist_folder, name + suffix)
+            if request.accept_encodings[encoding] and path and os.path.isfile(path):
+                response = send_from_directory(self.dist_folder, name + suffix,
+                                               mimetype=mimetypes.guess_type(name)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist_folder, name)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
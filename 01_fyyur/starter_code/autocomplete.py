@@ -0,0 +1,94 @@
+"""In-memory prefix indexes behind /api/autocomplete/<kind>.
+
+An index keeps every venue or artist name, case-folded, once per word it
+contains ("the musical hop" also as "musical hop" and "hop"), in a sorted
+list. A lookup bisects to the first key that starts with the prefix and
+walks forward, so it costs O(log n + matches) and no database round trip.
+
+Under gunicorn the master loads the indexes before forking (see
+gunicorn.conf.py); otherwise each process loads its own on first use. A
+worker reloads its copy once it is older than AUTOCOMPLETE_MAX_AGE seconds. The create, edit and delete
+handlers update the copy of the process they run in straight away; other
+workers catch up on their next reload.
+"""
+import bisect
+import threading
+import time
+
+
+def fold(value):
+    """`value` lowercased, with runs of whitespace collapsed."""
+    return ' '.join((value or '').casefold().split())
+
+
+def _entries(id, name):
+    words = fold(name).split(' ')
+    return [(' '.join(words[i:]), id) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex(object):
+    """Prefix search over the (id, name) rows `load` returns.
+
+    Writers replace the key list instead of changing it in place, so
+    searches read a consistent snapshot without taking the lock.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._keys = []
+        self._names = {}
+        self.loaded_at = None
+
+    def reload(self):
+        rows = list(self._load())
+        keys = sorted(entry for id, name in rows for entry in _entries(id, name))
+        with self._lock:
+            self._keys, self._names = keys, dict(rows)
+            self.loaded_at = time.monotonic()
+        return len(rows)
+
+    def warm(self, max_age=None):
+        """Load the index, or reload it if older than `max_age` seconds."""
+        loaded_at = self.loaded_at
+        if loaded_at is None or (max_age is not None and time.monotonic() - loaded_at > max_age):
+            self.reload()
+
+    def set(self, id, name):
+        """Add `id`, or rename it; a no-op until the index is loaded."""
+        with self._lock:
+            if self.loaded_at is None:
+                return
+            keys = [key for key in self._keys if key[1] != id] if id in self._names else list(self._keys)
+            for entry in _entries(id, name):
+                bisect.insort(keys, entry)
+            names = dict(self._names)
+            names[id] = name
+            self._keys, self._names = keys, names
+
+    def discard(self, id):
+        with self._lock:
+            if self.loaded_at is None or id not in self._names:
+                return
+            names = dict(self._names)
+            del names[id]
+            self._keys, self._names = [key for key in self._keys if key[1] != id], names
+
+    def search(self, prefix, limit=10, max_age=None):
+        """[{'id', 'name'}] of up to `limit` names with a word starting with
+        `prefix`, in order of the matching words."""
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        self.warm(max_age)
+        keys, names = self._keys, self._names
+        matches, seen = [], set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and len(matches) < limit and keys[i][0].startswith(prefix):
+            id = keys[i][1]
+            if id not in seen and id in names:
+                seen.add(id)
+                matches.append({'id': id, 'name': names[id]})
+            i += 1
+        return matches
+
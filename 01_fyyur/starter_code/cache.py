@@ -0,0 +1,243 @@
+import contextlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUBackend(object):
+    """In-process least-recently-used store with per-entry expiry.
+
+    Each process gets its own copy, and delete_many() and clear() only
+    reach that copy: a write served by one worker, or made by a `flask`
+    command, leaves the pages other processes cached until they expire.
+    So this suits a single process only; see gunicorn.conf.py.
+    """
+
+    shared = False
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'evictions': self.evictions}
+
+
+class RedisBackend(object):
+    """Store shared by all workers, on anything that speaks the Redis API.
+
+    `client` only needs get, set (with `ex`), delete and, for clear(),
+    scan_iter. A redis.Redis instance works, and so does a local stand-in
+    such as fakeredis.
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+    def delete_many(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        stats = {}
+        info = getattr(self.client, 'info', None)
+        if info is not None:
+            try:
+                stats['evictions'] = info('stats').get('evicted_keys', 0)
+            except Exception:
+                pass
+        return stats
+
+
+class NullBackend(object):
+    """Caches nothing; every lookup is a miss."""
+
+    # Nothing cached can go stale in another process.
+    shared = True
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete_many(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class Cache(object):
+    """Read-through cache with hit/miss counters, configured from the app.
+
+    Config keys:
+      CACHE_BACKEND          'lru' (default, per process), 'redis' (shared
+                             by every process) or 'null'
+      CACHE_DEFAULT_TIMEOUT  seconds before an entry expires, 0 for never
+      CACHE_LRU_SIZE         number of entries kept by the 'lru' backend
+      CACHE_REDIS_URL        server used by the 'redis' backend
+
+    Each app gets its own backend and counters, kept in
+    app.extensions['cache'] and used through current_app. Pass `backend` to
+    init_app() to use an already configured one instead, e.g. a
+    RedisBackend around a local stand-in client.
+
+    `fill_context`, if given, returns the context manager that values to
+    be cached are computed in; see filling().
+    """
+
+    def __init__(self, app=None, fill_context=None):
+        self.fill_context = fill_context
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        app.extensions['cache'] = _CacheState(
+            backend or self._make_backend(app.config), app.config.get('CACHE_DEFAULT_TIMEOUT', 300))
+
+    @staticmethod
+    def _make_backend(config):
+        name = config.get('CACHE_BACKEND', 'lru')
+        if name == 'lru':
+            return LRUBackend(config.get('CACHE_LRU_SIZE', 1024))
+        if name == 'redis':
+            import redis
+            return RedisBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']))
+        if name == 'null':
+            return NullBackend()
+        raise ValueError('Unknown CACHE_BACKEND {!r}'.format(name))
+
+    @property
+    def state(self):
+        return current_app.extensions['cache']
+
+    @property
+    def backend(self):
+        return self.state.backend
+
+    @backend.setter
+    def backend(self, backend):
+        self.state.backend = backend
+
+    @property
+    def shared(self):
+        """Whether deleting an entry here deletes it for every process,
+        i.e. whether more than one process can serve the app."""
+        return self.backend.shared
+
+    def get(self, key):
+        state = self.state
+        value = state.backend.get(key)
+        if value is None:
+            state.misses += 1
+        else:
+            state.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        state = self.state
+        state.backend.set(key, value, state.default_timeout if timeout is None else timeout)
+
+    def filling(self):
+        """The context to compute a value to cache in: `fill_context`, or
+        nothing with no fill_context or a NullBackend, which stores nothing."""
+        if self.fill_context is None or isinstance(self.backend, NullBackend):
+            return contextlib.nullcontext()
+        return self.fill_context()
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Return the cached value for `key`, computing and storing it on a miss.
+
+        `compute` runs in filling(). A None result from it is returned but
+        not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            with self.filling():
+                value = compute()
+            if value is not None:
+                self.set(key, value, timeout)
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete_many(keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        state = self.state
+        lookups = state.hits + state.misses
+        stats = {
+            'backend': type(state.backend).__name__,
+            'hits': state.hits,
+            'misses': state.misses,
+            'hit_ratio': round(state.hits / lookups, 4) if lookups else None,
+            'evictions': 0,
+        }
+        stats.update(state.backend.stats())
+        return stats
+
+
+class _CacheState(object):
+
+    def __init__(self, backend, default_timeout):
+        self.backend = backend
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
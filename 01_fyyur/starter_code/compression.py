@@ -0,0 +1,198 @@
+"""gzip and brotli compression of responses, as WSGI middleware.
+
+The encoding is negotiated from Accept-Encoding: brotli when the brotli
+package is installed and the client prefers it or ranks it equal to gzip,
+else gzip. Only textual responses (HTML, CSS, JavaScript, JSON, NDJSON, CSV,
+SVG) of at least COMPRESS_MIN_SIZE bytes are compressed; responses that
+already have a Content-Encoding, such as the precompressed files of
+assets.py, or that ask for no-transform, pass through untouched.
+
+Streamed responses stay streamed. The body is compressed as it is read
+from the app; the first COMPRESS_MIN_SIZE bytes, normally the start of the
+page layout, are flushed as soon as they are in, and after that output is
+flushed every COMPRESS_FLUSH_SIZE bytes of input. Flushing after every
+chunk would keep the chunks, which Jinja makes very small, from compressing
+well.
+
+Config keys:
+  COMPRESS_ENABLED          default True
+  COMPRESS_MIN_SIZE         default 512
+  COMPRESS_FLUSH_SIZE       default 8192
+  COMPRESS_GZIP_LEVEL       default 6
+  COMPRESS_BROTLI_QUALITY   default 4
+"""
+import itertools
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_set_header
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-ndjson',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+class GzipEncoder(object):
+
+    def __init__(self, level=6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder(object):
+
+    def __init__(self, quality=4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def supported_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress_chunks(chunks, encoder, first_size, flush_size):
+    """Compress the byte strings `chunks`, flushing once `first_size` bytes
+    are in and then every `flush_size` bytes.
+
+    Yields once per chunk, b'' while the encoder holds on to its input, as
+    PEP 3333 asks of middleware.
+    """
+    pending, threshold = 0, first_size
+    for chunk in chunks:
+        out = encoder.compress(chunk)
+        pending += len(chunk)
+        if pending >= threshold:
+            out += encoder.flush()
+            pending, threshold = 0, flush_size
+        yield out
+    yield encoder.finish()
+
+
+class CompressMiddleware(object):
+    """Compresses the responses of the WSGI app `app`; see the module docstring."""
+
+    def __init__(self, app, min_size=512, flush_size=8192, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.min_size = min_size
+        self.flush_size = flush_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def negotiate(self, accept_encoding):
+        """The encoding to use for `accept_encoding`, or None."""
+        accept = parse_accept_header(accept_encoding)
+        # max() keeps the first of equal qualities, i.e. the preferred one.
+        encoding = max(supported_encodings(), key=lambda encoding: accept[encoding])
+        return encoding if accept[encoding] > 0 else None
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.gzip_level)
+
+    def compressible(self, status, headers):
+        code = int(status.split(None, 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        if not headers.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+
+        response, written = {}, []
+
+        def capture(status, headers, exc_info=None):
+            response.update(status=status, headers=headers, exc_info=exc_info)
+            return written.append
+
+        body = self.app(environ, capture)
+        # Apps usually start the response before returning the body; pass
+        # anything that will not be compressed straight through, keeping
+        # wsgi.file_wrapper bodies intact.
+        if 'status' in response and not self.compressible(response['status'], Headers(response['headers'])):
+            write = start_response(response['status'], response['headers'], response['exc_info'])
+            for data in written:
+                write(data)
+            return body
+        return self._compressed(body, response, written, start_response, encoding)
+
+    def _compressed(self, body, response, written, start_response, encoding):
+        try:
+            chunks = itertools.chain(written, body)
+            head, size = [], 0
+            for chunk in chunks:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size:
+                    break
+
+            headers = Headers(response['headers'])
+            if size < self.min_size or not self.compressible(response['status'], headers):
+                start_response(response['status'], response['headers'], response['exc_info'])
+                for chunk in itertools.chain(head, chunks):
+                    yield chunk
+                return
+
+            headers.remove('Content-Length')
+            headers['Content-Encoding'] = encoding
+            vary = parse_set_header(headers.get('Vary'))
+            vary.add('Accept-Encoding')
+            headers['Vary'] = vary.to_header()
+            # The compressed body is a different sequence of bytes.
+            etag = headers.get('ETag')
+            if etag and not etag.startswith('W/'):
+                headers['ETag'] = 'W/' + etag
+            start_response(response['status'], headers.to_wsgi_list(), response['exc_info'])
+
+            for chunk in compress_chunks(itertools.chain([b''.join(head)], chunks),
+                                         self.encoder(encoding), self.min_size, self.flush_size):
+                yield chunk
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def init_app(app):
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    app.wsgi_app = CompressMiddleware(
+        app.wsgi_app,
+        min_size=app.config.get('COMPRESS_MIN_SIZE', 512),
+        flush_size=app.config.get('COMPRESS_FLUSH_SIZE', 8192),
+        gzip_level=app.config.get('COMPRESS_GZIP_LEVEL', 6),
+        brotli_quality=app.config.get('COMPRESS_BROTLI_QUALITY', 4),
+    )
@@ -1,8 +1,14 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Shared by every worker process. Unset, create_app() generates one once and
+# keeps it in instance/secret_key.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+
+# Compiled templates are cached here across processes; unset to disable.
+JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR', os.path.join(basedir, 'instance', 'jinja_cache'))
+
 # Enable debug mode.
 DEBUG = True
 
@@ -10,4 +16,107 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres:b@localhost:5432/myproject01'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres:b@localhost:5432/myproject01')
+
+# Read replica for GET requests, see routing.py; unset to use the primary
+# only. After a write the client reads from the primary for
+# REPLICA_PIN_SECONDS.
+REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+REPLICA_PIN_SECONDS = 10
+
+# Connection pool per deployment, see dbpool.py. DB_PROFILE picks one of
+# these, and DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
+# and DB_POOL_PRE_PING override single values. Each worker process has its
+# own pool, so workers * (pool_size + max_overflow) must stay below the
+# server's max_connections.
+DB_POOL_PROFILES = {
+    'development': {'pool_size': 2, 'max_overflow': 3, 'pool_recycle': 1800, 'pool_timeout': 10},
+    'production': {'pool_size': 5, 'max_overflow': 5, 'pool_recycle': 1800, 'pool_timeout': 30},
+    # Many small workers, e.g. gunicorn with a high --workers count.
+    'small': {'pool_size': 1, 'max_overflow': 2, 'pool_recycle': 1800, 'pool_timeout': 30},
+}
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+_pool = DB_POOL_PROFILES[DB_PROFILE]
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', _pool['pool_size'])),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', _pool['max_overflow'])),
+    # Seconds; older connections are replaced before use.
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', _pool['pool_recycle'])),
+    # Seconds a request waits for a connection before failing.
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', _pool['pool_timeout'])),
+    # Test each connection on checkout, so a database restart costs a
+    # reconnect instead of an error.
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no'),
+}
+
+# Serve the fingerprinted files `flask build-assets` writes to static/dist/,
+# once it has been run; see assets.py.
+ASSETS_FINGERPRINT = True
+
+# gzip/brotli compression of responses; see compression.py.
+COMPRESS_ENABLED = True
+COMPRESS_MIN_SIZE = 512
+COMPRESS_FLUSH_SIZE = 8192
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 4
+
+# Number of results per page on /venues/search and /artists/search.
+SEARCH_PAGE_SIZE = 20
+
+# Number of shows per page on /shows.
+SHOWS_PAGE_SIZE = 30
+
+# Number of past shows per page on the venue and artist pages.
+PROFILE_PAST_SHOWS_PAGE_SIZE = 12
+
+# Suggestions returned by /api/autocomplete/<kind>, and how many seconds a
+# worker keeps its in-memory name index before reloading it.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_AGE = 300
+
+# Most shows one submission of the new show form may list, counting every
+# date of its recurrence rule and date list.
+SHOW_BATCH_LIMIT = 366
+
+# Gazetteer that `flask geocode-venues` and the venue forms take venue
+# coordinates from, see geo.py; unset to leave new venues without them.
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', os.path.join(basedir, 'data', 'gazetteer.csv'))
+
+# /venues/nearby: radius in km when none is given and the largest allowed,
+# the most venues returned, and how many seconds a worker keeps its
+# in-memory index of venue coordinates (not used on PostgreSQL).
+NEARBY_DEFAULT_RADIUS = 25
+NEARBY_MAX_RADIUS = 500
+NEARBY_LIMIT = 50
+NEARBY_MAX_AGE = 300
+
+# Resized venue and artist images served from /img/, see images.py. The
+# cache is shared by the worker processes and kept under its size cap.
+IMAGE_PROXY_ENABLED = True
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(basedir, 'instance', 'images'))
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = 5
+IMAGE_FETCH_MAX_BYTES = 10 * 1024 * 1024
+# Let image links point at private addresses, e.g. a local test origin.
+IMAGE_PROXY_ALLOW_PRIVATE = False
+
+# Where `flask show-partitions archive` writes archived Show partitions,
+# one gzipped CSV per month. Any mounted cold-storage path will do.
+SHOW_ARCHIVE_DIR = os.environ.get('SHOW_ARCHIVE_DIR', os.path.join(basedir, 'archive'))
+
+# Read-through cache for page data and rendered fragments, see cache.py.
+# CACHE_BACKEND is 'lru' (per process), 'redis' (shared) or 'null'. Only
+# 'redis' and 'null' can serve more than one worker process, and only
+# 'redis' lets `flask` commands invalidate what the app has cached.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru')
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_LRU_SIZE = 1024
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# Per-request SQL counts and timings, see sqlstats.py. A statement that runs
+# more than SQLSTATS_N_PLUS_ONE_THRESHOLD times in one request is logged as
+# an N+1 query, or raises when TESTING.
+SQLSTATS_ENABLED = True
+SQLSTATS_HEADERS = True
+SQLSTATS_N_PLUS_ONE_THRESHOLD = 5
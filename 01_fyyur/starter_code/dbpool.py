@@ -0,0 +1,82 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# create_engine() arguments that only a QueuePool accepts.
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection.
+
+    The time covers waiting for a free connection as well as opening a new
+    one within the overflow, which is what a request sees either way.
+    Counters are per pool and so per worker process.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+
+def engine_options(sa_url, options):
+    """Pool settings that suit the database `sa_url` points at.
+
+    SQLite, used by scripts/benchmark.py, keeps Flask-SQLAlchemy's own pool
+    choice, which takes no sizing arguments; everything else gets a
+    TimedQueuePool so /internal/db-pool can report wait times.
+    """
+    options = dict(options)
+    if sa_url.drivername.startswith('sqlite'):
+        for name in QUEUE_POOL_OPTIONS:
+            options.pop(name, None)
+    else:
+        options.setdefault('poolclass', TimedQueuePool)
+    return options
+
+
+def pool_status(engine):
+    """Occupancy and checkout wait times of `engine`'s pool."""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # Negative while fewer than `size` connections have been opened.
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+            'timeout_s': pool.timeout(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            status.update({
+                'checkouts': pool.checkouts,
+                'timeouts': pool.timeouts,
+                'wait_ms_total': round(pool.wait_total * 1000, 3),
+                'wait_ms_avg': round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else None,
+                'wait_ms_max': round(pool.wait_max * 1000, 3),
+            })
+    return status
@@ -0,0 +1,122 @@
+"""Streaming writers for data exports.
+
+Each writer takes a list of (name, type) columns and an iterable of rows
+(tuples in column order) and yields the encoded output as bytes chunks,
+holding at most one chunk of rows in memory at a time. Column types are
+'int', 'str', 'bool', 'datetime' and 'list' (a list of strings).
+"""
+import csv
+import importlib.util
+import io
+import json
+from datetime import date, datetime
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(columns, rows, chunk_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, type in columns])
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows([_csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def ndjson_chunks(columns, rows, chunk_size=1000):
+    names = [name for name, type in columns]
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(json.dumps(dict(zip(names, row)), default=_json_default) + '\n'
+                      for row in chunk).encode('utf-8')
+
+
+class _Sink(object):
+    """Write-only file object that hands back what was written since last drained."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.closed = False
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def parquet_chunks(columns, rows, chunk_size=50000):
+    """Parquet with one row group per chunk; needs pyarrow."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'int': pa.int64(),
+        'str': pa.string(),
+        'bool': pa.bool_(),
+        'datetime': pa.timestamp('us'),
+        'list': pa.list_(pa.string()),
+    }
+    schema = pa.schema([(name, types[type]) for name, type in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in _chunks(rows, chunk_size):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'ndjson': ndjson_chunks,
+    'parquet': parquet_chunks,
+}
+
+
+def available_formats():
+    """Formats whose dependencies are installed."""
+    return [format for format in WRITERS
+            if format != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
@@ -1,9 +1,9 @@
 from datetime import datetime
-from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from flask_wtf import FlaskForm
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
 from wtforms.validators import DataRequired, AnyOf, URL
 
-class ShowForm(Form):
+class ShowForm(FlaskForm):
     artist_id = StringField(
         'artist_id'
     )
@@ -15,8 +15,16 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # Optional further dates, see expand_show_times() in app.py: an RFC 5545
+    # recurrence rule starting at start_time, and/or dates one per line.
+    recurrence = TextAreaField(
+        'recurrence'
+    )
+    dates = TextAreaField(
+        'dates'
+    )
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -128,7 +136,7 @@ class VenueForm(Form):
 
 
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -0,0 +1,146 @@
+"""Venue coordinates, and the in-memory index behind /venues/nearby on SQLite.
+
+Venue.latitude and longitude come from a local gazetteer file, matched on
+city and state; nothing is looked up over the network, and a venue gets
+the coordinates of its city, not of its street address. Two formats are
+read:
+  - CSV with a header row naming at least city, state, latitude and
+    longitude, such as data/gazetteer.csv;
+  - a GeoNames dump (cities500.txt, cities15000.txt, ...), tab separated,
+    with the admin1 code as the state and the most populous of several
+    places with the same name winning.
+
+On PostgreSQL, migration 0009 indexes ll_to_earth(latitude, longitude)
+with GiST (cube and earthdistance extensions), and the nearby search is a
+single query against it. Other databases have no such index, so each
+worker process keeps a KD-tree of the venue coordinates instead, loaded on
+first use and reloaded once it is older than NEARBY_MAX_AGE seconds or a
+venue of that process moved.
+"""
+import csv
+import math
+import threading
+import time
+from functools import lru_cache
+
+from autocomplete import fold
+
+# The radius of earthdistance's earth(), so both back ends agree.
+EARTH_RADIUS_KM = 6378.168
+
+
+def area_key(city, state):
+    return fold(city), (state or '').strip().upper()
+
+
+def load_gazetteer(path, country='US'):
+    """{area_key(city, state): (latitude, longitude)} from the file at `path`."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if '\t' in f.readline():
+            f.seek(0)
+            return _load_geonames(f, country)
+        f.seek(0)
+        places = {}
+        for row in csv.DictReader(f):
+            places.setdefault(area_key(row['city'], row['state']),
+                              (float(row['latitude']), float(row['longitude'])))
+        return places
+
+
+def _load_geonames(f, country):
+    places, population = {}, {}
+    for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+        if country and row[8] != country:
+            continue
+        key = area_key(row[1], row[10])
+        if int(row[14] or 0) >= population.get(key, -1):
+            places[key] = (float(row[4]), float(row[5]))
+            population[key] = int(row[14] or 0)
+    return places
+
+
+@lru_cache(maxsize=4)
+def gazetteer(path):
+    """load_gazetteer(`path`), read once per process."""
+    return load_gazetteer(path)
+
+
+def _unit_vector(lat, lng):
+    lat, lng = math.radians(lat), math.radians(lng)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+
+class KDTree(object):
+    """Static 3-d tree over (id, (x, y, z)) points.
+
+    Points on the unit sphere keep great-circle order under straight-line
+    distance, so a sphere around a point answers a radius search.
+    """
+
+    def __init__(self, points):
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda point: point[1][axis])
+        middle = len(points) // 2
+        following = (axis + 1) % 3
+        return (points[middle], axis,
+                self._build(points[:middle], following),
+                self._build(points[middle + 1:], following))
+
+    def within(self, center, radius):
+        """(id, distance) of the points at most `radius` from `center`."""
+        found, stack, limit = [], [self.root], radius * radius
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            (id, point), axis, lower, higher = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, center))
+            if distance <= limit:
+                found.append((id, math.sqrt(distance)))
+            offset = center[axis] - point[axis]
+            stack.append(lower if offset <= 0 else higher)
+            if offset * offset <= limit:
+                stack.append(higher if offset <= 0 else lower)
+        return found
+
+
+class NearbyIndex(object):
+    """Radius search over the (id, latitude, longitude) rows `load` returns."""
+
+    def __init__(self, load):
+        self._load = load
+        self._lock = threading.Lock()
+        self._tree = KDTree([])
+        self.loaded_at = None
+
+    def reload(self):
+        rows = list(self._load())
+        tree = KDTree((id, _unit_vector(lat, lng)) for id, lat, lng in rows)
+        with self._lock:
+            self._tree = tree
+            self.loaded_at = time.monotonic()
+        return len(rows)
+
+    def warm(self, max_age=None):
+        """Load the index, or reload it if older than `max_age` seconds."""
+        loaded_at = self.loaded_at
+        if loaded_at is None or (max_age is not None and time.monotonic() - loaded_at > max_age):
+            self.reload()
+
+    def invalidate(self):
+        """Reload on the next search, e.g. after a venue moved."""
+        self.loaded_at = None
+
+    def search(self, lat, lng, radius_km, limit=None, max_age=None):
+        """[(id, distance in km)] within `radius_km` of (lat, lng), nearest first."""
+        self.warm(max_age)
+        # The chord of the arc `radius_km` long, on the unit sphere.
+        chord = 2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)
+        found = [(2 * EARTH_RADIUS_KM * math.asin(min(1.0, distance / 2)), id)
+                 for id, distance in self._tree.within(_unit_vector(lat, lng), chord)]
+        found.sort()
+        return [(id, distance) for distance, id in found[:limit]]
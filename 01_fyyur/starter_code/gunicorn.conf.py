@@ -0,0 +1,54 @@
+"""gunicorn settings for running Fyyur in production.
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+The app is built once in the master (preload_app) and its templates are
+compiled and its autocomplete indexes loaded there before the workers
+fork, so every worker starts with them loaded and shares their memory with
+the master until it writes to it.
+Database connections are not shared: the master closes its pools before
+each fork and every worker opens its own.
+
+Neither is the 'lru' cache, so a write would only invalidate the pages of
+the worker that served it. More than one worker needs CACHE_BACKEND=redis
+(or null); on_starting() refuses to start them otherwise.
+"""
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', '5000')))
+_shared_cache = os.environ.get('CACHE_BACKEND', 'lru') in ('redis', 'null')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2' if _shared_cache else '1'))
+preload_app = True
+
+
+def on_starting(server):
+    app = server.app.wsgi()
+    backend = app.extensions['cache'].backend
+    if server.cfg.workers > 1 and not backend.shared:
+        raise RuntimeError(
+            '{} workers would each keep their own {}, and writes would only invalidate '
+            'one of them; set CACHE_BACKEND=redis or WEB_CONCURRENCY=1.'.format(
+                server.cfg.workers, type(backend).__name__))
+
+
+def when_ready(server):
+    app = server.app.wsgi()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    from app import warm_autocomplete
+    with app.app_context():
+        warm_autocomplete()
+    # Objects created so far live for the whole process; leaving them out
+    # of collections keeps the collector from touching, and so copying,
+    # the pages they are on in each worker.
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    app = server.app.wsgi()
+    from models import db
+    with app.app_context():
+        db.engine.dispose()
+        for bind in app.config.get('SQLALCHEMY_BINDS') or {}:
+            db.get_engine(app, bind=bind).dispose()
@@ -0,0 +1,442 @@
+"""Resized copies of venue and artist images, served from /img/<kind>/<id>/<size>.
+
+image_link can point anywhere on the web, at an image of any size. The
+proxy fetches each image once and keeps the original in IMAGE_CACHE_DIR.
+Every size asked for is written next to it, as WebP for clients that
+accept it and as JPEG otherwise. Files are named after a hash of the link,
+so a changed link is fetched anew, and the edit handlers purge the files
+of the old one.
+
+The cache is an LRU bounded by IMAGE_CACHE_MAX_BYTES. Each process scans
+IMAGE_CACHE_DIR once, by file mtime, and then keeps its index and the
+total size up to date as it reads, writes and purges files. A process that
+has written past the cap removes its least recently used files until the
+cache is under 90% of it. Processes do not see each other's writes, so
+the cap can be overshot by what the others wrote since they started. A
+hit also touches the file, so the next scan finds it recently used.
+
+In templates, image_url() links to the proxy with a `v` parameter taken
+from the link. Responses to such URLs can be cached for a year, because a
+new link makes a new URL. Without Pillow, or with IMAGE_PROXY_ENABLED off,
+image_url() returns image_link itself.
+
+Only http and https links are fetched, without going through a proxy.
+Hosts that resolve to loopback, private, link-local or other non-public
+addresses are refused, redirects included, unless
+IMAGE_PROXY_ALLOW_PRIVATE is set, for example to use a local stand-in
+origin during development. The address is checked again on the connected
+socket, because the host is looked up anew when connecting and can then
+resolve elsewhere (DNS rebinding).
+
+Config keys:
+  IMAGE_PROXY_ENABLED         default True
+  IMAGE_CACHE_DIR             default instance/images
+  IMAGE_CACHE_MAX_BYTES       default 256 MiB
+  IMAGE_FETCH_TIMEOUT         seconds, default 5
+  IMAGE_FETCH_MAX_BYTES       default 10 MiB
+  IMAGE_PROXY_ALLOW_PRIVATE   default False
+"""
+import collections
+import functools
+import hashlib
+import http.client
+import importlib.util
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from flask import Response, current_app, request, url_for
+
+# Name: the box an image is fitted into, twice its CSS size for
+# high-density screens. Tiles are at most 200px high in a third of the
+# page, profile images at most 500px high in half of it.
+SIZES = {
+    'tile': (720, 400),
+    'profile': (1110, 1000),
+}
+# (mimetype, file extension, Pillow format), in order of preference.
+FORMATS = (('image/webp', 'webp', 'WEBP'), ('image/jpeg', 'jpg', 'JPEG'))
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Seconds before a link that failed is tried again, and the max-age of
+# responses to URLs without the current `v`.
+RETRY_AFTER = 300
+SHORT_MAX_AGE = 3600
+
+
+class ImageError(Exception):
+    pass
+
+
+def link_key(link):
+    return hashlib.sha256(link.encode('utf-8')).hexdigest()
+
+
+def version(link):
+    """The `v` parameter of the proxy URLs of `link`."""
+    return link_key(link)[:12]
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def __init__(self, check):
+        self.check = check
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.check(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class _PeerCheckMixin(object):
+    """An HTTP(S) connection that passes the address it connected to to
+    `check_address` before sending anything."""
+
+    def __init__(self, *args, check_address, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_address = check_address
+        self._create_connection = self._create_checked_connection
+
+    def _create_checked_connection(self, *args, **kwargs):
+        sock = socket.create_connection(*args, **kwargs)
+        try:
+            self.check_address(sock.getpeername()[0])
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+
+class _CheckedHTTPConnection(_PeerCheckMixin, http.client.HTTPConnection):
+    pass
+
+
+class _CheckedHTTPSConnection(_PeerCheckMixin, http.client.HTTPSConnection):
+    pass
+
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+
+    def __init__(self, check_address):
+        super().__init__()
+        self.check_address = check_address
+
+    def http_open(self, req):
+        return self.do_open(functools.partial(_CheckedHTTPConnection, check_address=self.check_address), req)
+
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def __init__(self, check_address):
+        super().__init__()
+        self.check_address = check_address
+
+    def https_open(self, req):
+        return self.do_open(functools.partial(_CheckedHTTPSConnection, check_address=self.check_address),
+                            req, context=self._context)
+
+
+def _pil():
+    """Pillow's Image, ImageOps and features modules, imported on first use."""
+    from PIL import Image, ImageOps, features
+    return Image, ImageOps, features
+
+
+class ImageProxy(object):
+    """Fetches, resizes and caches images; see the module docstring.
+
+    The settings and cache of each app are an ImageCache, kept in
+    app.extensions['images']. The app registers the view as `endpoint`;
+    image_url() links to it.
+    """
+
+    def __init__(self, app=None, endpoint='image'):
+        self.endpoint = endpoint
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['images'] = ImageCache(app)
+        app.add_template_global(self.url, 'image_url')
+
+    @property
+    def cache(self):
+        return current_app.extensions['images']
+
+    @property
+    def enabled(self):
+        return self.cache.enabled
+
+    def url(self, kind, id, link, size):
+        """Where to load `link`, the image_link of venue or artist `id`, at `size`."""
+        cache = self.cache
+        if not (cache.enabled and link):
+            return link
+        # Remembered, as url_for() would otherwise take most of the time
+        # of rendering a page of show tiles.
+        key = (request.script_root, kind, id, size, link)
+        url = cache.urls.get(key)
+        if url is None:
+            if len(cache.urls) >= 8192:
+                cache.urls.clear()
+            if urllib.parse.urlsplit(link).scheme in ('http', 'https'):
+                url = url_for(self.endpoint, kind=kind, id=id, size=size, v=version(link))
+            else:
+                url = link
+            cache.urls[key] = url
+        return url
+
+    def response(self, link, size):
+        """`link` at `size` in the format the client prefers, or None when it
+        cannot be fetched or read."""
+        return self.cache.response(link, size)
+
+    def purge(self, link):
+        """Remove every cached file of `link`."""
+        self.cache.purge(link)
+
+
+class ImageCache(object):
+    """One app's image proxy settings, and its cache in IMAGE_CACHE_DIR."""
+
+    def __init__(self, app):
+        self.logger = app.logger
+        self.enabled = (importlib.util.find_spec('PIL') is not None
+                        and app.config.get('IMAGE_PROXY_ENABLED', True))
+        self.cache_dir = app.config.get('IMAGE_CACHE_DIR') or os.path.join(app.instance_path, 'images')
+        self.max_bytes = app.config.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.timeout = app.config.get('IMAGE_FETCH_TIMEOUT', 5)
+        self.fetch_max_bytes = app.config.get('IMAGE_FETCH_MAX_BYTES', 10 * 1024 * 1024)
+        self.allow_private = app.config.get('IMAGE_PROXY_ALLOW_PRIVATE', False)
+        self.urls = {}
+        self._formats = None
+        self._lock = threading.Lock()
+        # Path: size of the files in the cache, least recently used first,
+        # and their total; None until the first write scans the directory.
+        self._files = None
+        self._size = 0
+        self._failures = {}
+
+    @property
+    def formats(self):
+        if self._formats is None:
+            Image, ImageOps, features = _pil()
+            self._formats = [f for f in FORMATS if f[2] != 'WEBP' or features.check('webp')]
+        return self._formats
+
+    def path(self, link, name):
+        key = link_key(link)
+        return os.path.join(self.cache_dir, key[:2], '{}.{}'.format(key, name))
+
+    def response(self, link, size):
+        mimetype, extension, format = self.negotiate()
+        name = '{}.{}'.format(size, extension)
+        path = self.path(link, name)
+        data = self._read(path)
+        if data is None:
+            original = self.original(link)
+            if original is None:
+                return None
+            try:
+                data = self.resize(original, SIZES[size], format)
+            except ImageError as e:
+                # Dropped, so the link is fetched again after RETRY_AFTER
+                # instead of failing to decode on every request.
+                self.purge(link)
+                self._failed(link, e)
+                return None
+            self._store(path, data)
+
+        response = Response(data, mimetype=mimetype)
+        response.set_etag('{}.{}'.format(link_key(link)[:16], name))
+        current = request.args.get('v') == version(link)
+        response.headers['Cache-Control'] = IMMUTABLE if current else 'public, max-age={}'.format(SHORT_MAX_AGE)
+        response.vary.add('Accept')
+        return response.make_conditional(request)
+
+    def negotiate(self):
+        # Only an explicit image/webp counts; browsers without WebP support
+        # send image/* too.
+        accepted = set(value for value, quality in request.accept_mimetypes if quality > 0)
+        for mimetype, extension, format in self.formats:
+            if mimetype in accepted or format == 'JPEG':
+                return mimetype, extension, format
+
+    def original(self, link):
+        """The bytes of `link`, from the cache or the origin; None if the
+        origin failed in the last RETRY_AFTER seconds."""
+        path = self.path(link, 'src')
+        data = self._read(path)
+        if data is not None:
+            return data
+        failed_at = self._failures.get(link)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER:
+            return None
+        try:
+            data = self.fetch(link)
+        except ImageError as e:
+            self._failed(link, e)
+            return None
+        self._store(path, data)
+        return data
+
+    def fetch(self, link):
+        self._check_url(link)
+        opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}),
+            _CheckedHTTPHandler(self._check_address),
+            _CheckedHTTPSHandler(self._check_address),
+            _CheckedRedirectHandler(self._check_url),
+        )
+        req = urllib.request.Request(link, headers={'Accept': 'image/*', 'User-Agent': 'fyyur-image-proxy'})
+        try:
+            with opener.open(req, timeout=self.timeout) as response:
+                data = response.read(self.fetch_max_bytes + 1)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ImageError(str(e))
+        if len(data) > self.fetch_max_bytes:
+            raise ImageError('larger than {} bytes'.format(self.fetch_max_bytes))
+        return data
+
+    def _check_url(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ImageError('not an http(s) URL: {}'.format(url))
+        if self.allow_private:
+            return
+        try:
+            addresses = socket.getaddrinfo(parts.hostname, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError) as e:
+            raise ImageError(str(e))
+        for address in addresses:
+            self._check_address(address[4][0], parts.hostname)
+
+    def _check_address(self, address, host=None):
+        if self.allow_private:
+            return
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ImageError('{} is a non-public address'.format(
+                address if host is None else '{} ({})'.format(host, address)))
+
+    def resize(self, data, box, format):
+        """`data` fitted into `box` and encoded as `format`; raises ImageError
+        if it is not an image Pillow can read."""
+        Image, ImageOps, features = _pil()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # JPEGs are decoded straight at a smaller scale.
+                image.draft('RGB', box)
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(box, Image.LANCZOS)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+                if format == 'JPEG' and image.mode == 'RGBA':
+                    background = Image.new('RGB', image.size, 'white')
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                out = io.BytesIO()
+                image.save(out, format, **SAVE_OPTIONS[format])
+                return out.getvalue()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageError('not a readable image: {}'.format(e))
+
+    def purge(self, link):
+        """Remove every cached file of `link`."""
+        if not link:
+            return
+        self._failures.pop(link, None)
+        key = link_key(link)
+        directory = os.path.join(self.cache_dir, key[:2])
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(key + '.'):
+                path = os.path.join(directory, name)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                with self._lock:
+                    self._forget(path)
+
+    def _failed(self, link, error):
+        if len(self._failures) > 1024:
+            self._failures.clear()
+        self._failures[link] = time.monotonic()
+        self.logger.warning('Image %s unavailable: %s', link, error)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Marks the file as recently used, here and for the next scan.
+        with self._lock:
+            if self._files is not None and path in self._files:
+                self._files.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _store(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staged = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(staged, 'wb') as f:
+            f.write(data)
+        os.replace(staged, path)
+        if self._files is None:
+            self.scan()
+        with self._lock:
+            self._forget(path)
+            self._files[path] = len(data)
+            self._size += len(data)
+            victims = []
+            if self._size > self.max_bytes:
+                while self._files and self._size > self.max_bytes * 0.9:
+                    victim, size = self._files.popitem(last=False)
+                    self._size -= size
+                    victims.append(victim)
+        for victim in victims:
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, path):
+        size = self._files.pop(path, None) if self._files is not None else None
+        if size is not None:
+            self._size -= size
+
+    def scan(self):
+        """Rebuild the index of the cache from IMAGE_CACHE_DIR, least
+        recently modified first; returns its size. The directory is walked
+        without holding the lock."""
+        files = []
+        for root, dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        with self._lock:
+            self._files = collections.OrderedDict((path, size) for mtime, path, size in files)
+            self._size = sum(self._files.values())
+            return self._size
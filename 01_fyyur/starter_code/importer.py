@@ -0,0 +1,288 @@
+"""Bulk loading of venues, artists and shows for `flask import`.
+
+Rows are streamed from a CSV or NDJSON file, validated with the same form
+classes the create pages use, and inserted in batches: multi-row INSERTs
+for venues and artists, COPY for shows on PostgreSQL. Every batch commits
+on its own, together with the ImportCheckpoint row that counts it, so an
+interrupted import picks up after the last committed batch and never loads
+a batch twice. Rejected rows go to an NDJSON error report, written once
+their batch has committed.
+"""
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+from werkzeug.datastructures import MultiDict
+
+from app import db, Venue, Artist, Show, refresh_areas, venue_ids_areas
+from forms import VenueForm, ArtistForm, ShowForm
+from models import ImportCheckpoint
+
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n', 'off')
+
+
+def read_rows(path, format=None):
+    """Yield (line number, row dict) from a CSV or NDJSON file."""
+    format = format or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_no, json.loads(line)
+
+
+def _formdata(row, list_fields=(), bool_fields=()):
+    """Turn a file row into the MultiDict a form expects."""
+    data = MultiDict()
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name in list_fields:
+            values = value if isinstance(value, list) else value.split(',')
+            for item in values:
+                if item.strip():
+                    data.add(name, item.strip())
+        elif name in bool_fields:
+            if str(value).strip().lower() not in FALSE_VALUES:
+                data.add(name, 'y')
+        else:
+            data.add(name, str(value))
+    return data
+
+
+class VenueLoader(object):
+    model = Venue
+
+    def __init__(self):
+        self.form = VenueForm(formdata=None, meta={'csrf': False})
+
+    def validate(self, row):
+        form = self.form
+        form.process(_formdata(row, ('genres',), ('seeking_talent',)))
+        if not form.validate():
+            return None, form.errors
+        return {
+            'name': form.name.data,
+            'genres': form.genres.data,
+            'address': form.address.data,
+            'city': form.city.data,
+            'state': form.state.data,
+            'phone': form.phone.data,
+            'website': form.website_link.data,
+            'facebook_link': form.facebook_link.data,
+            'seeking_talent': form.seeking_talent.data,
+            'seeking_description': form.seeking_description.data,
+            'image_link': form.image_link.data,
+        }, None
+
+    def load(self, rows):
+        # An executemany, which psycopg2 sends as multi-row INSERTs.
+        db.session.execute(self.model.__table__.insert(), rows)
+        refresh_areas(set((row['city'], row['state']) for row in rows))
+
+
+class ArtistLoader(VenueLoader):
+    model = Artist
+
+    def __init__(self):
+        self.form = ArtistForm(formdata=None, meta={'csrf': False})
+
+    def load(self, rows):
+        db.session.execute(self.model.__table__.insert(), rows)
+
+    def validate(self, row):
+        form = self.form
+        form.process(_formdata(row, ('genres',), ('seeking_venue',)))
+        if not form.validate():
+            return None, form.errors
+        return {
+            'name': form.name.data,
+            'genres': form.genres.data,
+            'city': form.city.data,
+            'state': form.state.data,
+            'phone': form.phone.data,
+            'website': form.website_link.data,
+            'facebook_link': form.facebook_link.data,
+            'seeking_venue': form.seeking_venue.data,
+            'seeking_description': form.seeking_description.data,
+            'image_link': form.image_link.data,
+        }, None
+
+
+class ShowLoader(object):
+    model = Show
+    columns = ('venue_id', 'artist_id', 'start_time', 'is_upcoming')
+
+    def __init__(self):
+        self.form = ShowForm(formdata=None, meta={'csrf': False})
+        # Checked in memory rather than by the foreign keys, so one bad id
+        # rejects its row instead of failing the whole batch.
+        self.venue_ids = set(id for id, in db.session.query(Venue.id))
+        self.artist_ids = set(id for id, in db.session.query(Artist.id))
+        self.now = datetime.now()
+
+    def validate(self, row):
+        if not row.get('start_time'):
+            # The form would fall back to its default, the current time.
+            return None, {'start_time': ['This field is required.']}
+        form = self.form
+        form.process(_formdata(row))
+        if not form.validate():
+            return None, form.errors
+        errors = {}
+        ids = {}
+        for name, known in (('venue_id', self.venue_ids), ('artist_id', self.artist_ids)):
+            try:
+                ids[name] = int(form[name].data)
+            except (TypeError, ValueError):
+                errors[name] = ['Not a valid id.']
+                continue
+            if ids[name] not in known:
+                errors[name] = ['No such {}.'.format(name[:-3])]
+        if errors:
+            return None, errors
+        return {
+            'venue_id': ids['venue_id'],
+            'artist_id': ids['artist_id'],
+            'start_time': form.start_time.data,
+            'is_upcoming': form.start_time.data > self.now,
+        }, None
+
+    def load(self, rows):
+        if db.session.bind.dialect.name == 'postgresql':
+            self._copy(rows)
+        else:
+            db.session.execute(Show.__table__.insert(), rows)
+
+        # Keep the denormalized counters in step, in the same transaction.
+        for model, column in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+            upcoming = Counter(row[column] for row in rows if row['is_upcoming'])
+            past = Counter(row[column] for row in rows if not row['is_upcoming'])
+            params = [{'_id': id, '_upcoming': upcoming[id], '_past': past[id]}
+                      for id in set(upcoming) | set(past)]
+            db.session.execute(
+                model.__table__.update()
+                .where(model.id == db.bindparam('_id'))
+                .values(upcoming_shows_count=model.upcoming_shows_count + db.bindparam('_upcoming'),
+                        past_shows_count=model.past_shows_count + db.bindparam('_past')),
+                params,
+            )
+        refresh_areas(venue_ids_areas(set(row['venue_id'] for row in rows)))
+
+    def _copy(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row['venue_id'], row['artist_id'],
+                             row['start_time'].isoformat(sep=' '), 't' if row['is_upcoming'] else 'f'])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY "Show" ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(self.columns)),
+            buffer,
+        )
+
+
+LOADERS = {
+    'venues': VenueLoader,
+    'artists': ArtistLoader,
+    'shows': ShowLoader,
+}
+
+
+class Checkpoint(object):
+    """Number of source rows already committed, kept in an ImportCheckpoint
+    row per source file and kind."""
+
+    def __init__(self, source, kind):
+        self.source = os.path.abspath(source)
+        self.kind = kind
+        self.row = None
+        self.rows_done = 0
+        self.batches_done = 0
+
+    def load(self):
+        self.row = ImportCheckpoint.query.filter_by(source=self.source, kind=self.kind).one_or_none()
+        if self.row is not None:
+            self.rows_done = self.row.rows_done
+            self.batches_done = self.row.batches_done
+
+    def stage(self, rows_done, batches_done):
+        """Record the counts in the session, to commit with the batch they count."""
+        if self.row is None:
+            self.row = ImportCheckpoint(source=self.source, kind=self.kind)
+            db.session.add(self.row)
+        self.row.rows_done = rows_done
+        self.row.batches_done = batches_done
+        self.row.updated_at = datetime.now()
+
+
+def run_import(kind, source, format=None, batch_size=5000, errors_path=None, restart=False, echo=print):
+    """Import `source` into the `kind` table; returns (loaded, rejected)."""
+    loader = LOADERS[kind]()
+    checkpoint = Checkpoint(source, kind)
+    checkpoint.load()
+    if restart:
+        checkpoint.rows_done = checkpoint.batches_done = 0
+    elif checkpoint.rows_done:
+        echo('Resuming after {} rows ({} batches).'.format(checkpoint.rows_done, checkpoint.batches_done))
+
+    loaded = rejected = 0
+    started = time.perf_counter()
+    errors_file = open(errors_path or source + '.errors.ndjson', 'w' if not checkpoint.rows_done else 'a')
+    try:
+        rows = read_rows(source, format)
+        for _ in range(checkpoint.rows_done):
+            next(rows, None)
+
+        batch, seen, batch_errors = [], 0, []
+        for line_no, row in rows:
+            seen += 1
+            values, errors = loader.validate(row)
+            if errors:
+                batch_errors.append(json.dumps({
+                    'batch': checkpoint.batches_done + 1, 'line': line_no, 'errors': errors,
+                }) + '\n')
+            else:
+                batch.append(values)
+            if seen == batch_size:
+                _commit_batch(loader, batch, seen, batch_errors, checkpoint, errors_file, echo)
+                loaded += len(batch)
+                rejected += len(batch_errors)
+                batch, seen, batch_errors = [], 0, []
+        if seen:
+            _commit_batch(loader, batch, seen, batch_errors, checkpoint, errors_file, echo)
+            loaded += len(batch)
+            rejected += len(batch_errors)
+    finally:
+        errors_file.close()
+
+    elapsed = time.perf_counter() - started
+    echo('Loaded {} {}, rejected {}, in {:.1f}s ({:.0f} rows/s).'.format(
+        loaded, kind, rejected, elapsed, (loaded + rejected) / elapsed if elapsed else 0))
+    return loaded, rejected
+
+
+def _commit_batch(loader, rows, seen, errors, checkpoint, errors_file, echo):
+    rows_done, batches_done = checkpoint.rows_done + seen, checkpoint.batches_done + 1
+    try:
+        if rows:
+            loader.load(rows)
+        checkpoint.stage(rows_done, batches_done)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        echo('batch {}: failed, nothing from it was committed'.format(batches_done))
+        raise
+    checkpoint.rows_done, checkpoint.batches_done = rows_done, batches_done
+    errors_file.writelines(errors)
+    echo('batch {}: {} rows, {} loaded, {} rejected'.format(
+        batches_done, seen, len(rows), len(errors)))
@@ -0,0 +1,44 @@
+"""denormalized upcoming/past show counters
+
+Revision ID: 0003_show_counters
+Revises: 0002_name_trgm
+Create Date: 2026-10-18 01:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_show_counters'
+down_revision = '0002_name_trgm'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('is_upcoming', sa.Boolean(), server_default=sa.false(), nullable=False))
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the existing shows. The app compares start_time with
+    # naive local time, hence LOCALTIMESTAMP rather than now().
+    op.execute('UPDATE "Show" SET is_upcoming = start_time > LOCALTIMESTAMP')
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = counts.upcoming, past_shows_count = counts.past '
+            'FROM (SELECT {column} AS id, '
+            'count(*) FILTER (WHERE is_upcoming) AS upcoming, '
+            'count(*) FILTER (WHERE NOT is_upcoming) AS past '
+            'FROM "Show" GROUP BY {column}) AS counts '
+            'WHERE counts.id = "{table}".id'.format(table=table, column=column)
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_column('Show', 'is_upcoming')
@@ -0,0 +1,39 @@
+"""indexes for the show and venue access patterns
+
+Revision ID: 0004_show_indexes
+Revises: 0003_show_counters
+Create Date: 2026-10-18 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_show_indexes'
+down_revision = '0003_show_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so the upgrade does not lock Show against writes.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Show_upcoming_start_time', 'Show', ['start_time'],
+                        unique=False, postgresql_concurrently=True,
+                        postgresql_where=sa.text('is_upcoming'))
+        op.create_index('ix_Venue_state_city_name', 'Venue', ['state', 'city', 'name', 'id'],
+                        unique=False, postgresql_concurrently=True,
+                        postgresql_include=['upcoming_shows_count'])
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_state_city_name', table_name='Venue', postgresql_concurrently=True)
+        op.drop_index('ix_Show_upcoming_start_time', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_Show_artist_id_start_time', table_name='Show', postgresql_concurrently=True)
+        op.drop_index('ix_Show_venue_id_start_time', table_name='Show', postgresql_concurrently=True)
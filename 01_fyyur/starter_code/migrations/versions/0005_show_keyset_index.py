@@ -0,0 +1,26 @@
+"""index for keyset pagination of /shows
+
+Revision ID: 0005_show_keyset
+Revises: 0004_show_indexes
+Create Date: 2026-10-18 02:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_show_keyset'
+down_revision = '0004_show_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Show_start_time_id', table_name='Show', postgresql_concurrently=True)
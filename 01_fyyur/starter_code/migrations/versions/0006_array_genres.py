@@ -0,0 +1,46 @@
+"""Artist.genres as a text array, GIN indexes on genres
+
+Revision ID: 0006_array_genres
+Revises: 0005_show_keyset
+Create Date: 2026-10-18 03:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_array_genres'
+down_revision = '0005_show_keyset'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 'Jazz, Blues' becomes {Jazz,Blues}; NULL and '' become an empty array.
+    op.alter_column(
+        'Artist', 'genres',
+        type_=postgresql.ARRAY(sa.String()),
+        existing_type=sa.String(length=120),
+        postgresql_using="coalesce(string_to_array("
+                         "nullif(regexp_replace(btrim(genres), '\\s*,\\s*', ',', 'g'), ''), ','), "
+                         "'{}')",
+    )
+    op.alter_column('Artist', 'genres', nullable=False, server_default='{}',
+                    existing_type=postgresql.ARRAY(sa.String()))
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+    op.alter_column('Artist', 'genres', nullable=True, server_default=None,
+                    existing_type=postgresql.ARRAY(sa.String()))
+    op.alter_column(
+        'Artist', 'genres',
+        type_=sa.String(length=120),
+        existing_type=postgresql.ARRAY(sa.String()),
+        postgresql_using="array_to_string(genres, ',')",
+    )
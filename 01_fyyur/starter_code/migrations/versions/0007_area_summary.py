@@ -0,0 +1,44 @@
+"""AreaSummary table behind /venues
+
+Revision ID: 0007_area_summary
+Revises: 0006_array_genres
+Create Date: 2026-10-18 03:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_area_summary'
+down_revision = '0006_array_genres'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'AreaSummary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=True),
+        sa.Column('city', sa.String(length=120), nullable=True),
+        sa.Column('venues', sa.JSON(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_AreaSummary_state_city', 'AreaSummary', ['state', 'city'], unique=True)
+
+    # Same shape as refresh_areas() writes; `flask area-summary status`
+    # reports any difference.
+    op.execute(
+        'INSERT INTO "AreaSummary" (state, city, venues, refreshed_at) '
+        'SELECT state, city, '
+        "json_agg(json_build_object('id', id, 'name', name, 'num_upcoming_shows', upcoming_shows_count) "
+        'ORDER BY name, id), LOCALTIMESTAMP '
+        'FROM "Venue" GROUP BY state, city'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_AreaSummary_state_city', table_name='AreaSummary')
+    op.drop_table('AreaSummary')
@@ -0,0 +1,135 @@
+"""partition Show by month and add ShowArchive
+
+Revision ID: 0008_show_partitions
+Revises: 0007_area_summary
+Create Date: 2026-10-18 04:30:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_show_partitions'
+down_revision = '0007_area_summary'
+branch_labels = None
+depends_on = None
+
+# Months past the current one that get a partition up front; after that,
+# `flask show-partitions ensure` keeps them coming.
+MONTHS_AHEAD = 12
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def _create_show_indexes():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_upcoming_start_time', 'Show', ['start_time'], unique=False,
+                    postgresql_where=sa.text('is_upcoming'))
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def _drop_show_indexes(table):
+    for name in ('ix_Show_start_time_id', 'ix_Show_upcoming_start_time',
+                 'ix_Show_artist_id_start_time', 'ix_Show_venue_id_start_time'):
+        op.drop_index(name, table_name=table)
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('archived_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('archived_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'ShowArchive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('partition', sa.String(length=63), nullable=False),
+        sa.Column('range_start', sa.DateTime(), nullable=False),
+        sa.Column('range_end', sa.DateTime(), nullable=False),
+        sa.Column('path', sa.String(length=500), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('partition'),
+    )
+
+    # The existing table is copied into a new partitioned one, so Show is
+    # locked for the length of the upgrade; run it in a quiet period.
+    op.rename_table('Show', 'Show_unpartitioned')
+    op.execute('ALTER INDEX "Show_pkey" RENAME TO "Show_unpartitioned_pkey"')
+    _drop_show_indexes('Show_unpartitioned')
+
+    # Every unique index on a partitioned table has to include the
+    # partition key, hence (id, start_time); ids stay unique through the
+    # shared sequence.
+    op.execute(
+        'CREATE TABLE "Show" ('
+        '  id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'),'
+        '  start_time timestamp without time zone NOT NULL,'
+        '  venue_id integer NOT NULL REFERENCES "Venue" (id),'
+        '  artist_id integer NOT NULL REFERENCES "Artist" (id),'
+        '  is_upcoming boolean NOT NULL DEFAULT false,'
+        '  CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time)'
+        ') PARTITION BY RANGE (start_time)'
+    )
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    first, last = op.get_bind().execute(
+        sa.text('SELECT min(start_time), max(start_time) FROM "Show_unpartitioned"')).one()
+    now = datetime.now()
+    month = datetime((first or now).year, (first or now).month, 1)
+    end = datetime(now.year, now.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        end = _next_month(end)
+    if last and last >= end:
+        end = _next_month(datetime(last.year, last.month, 1))
+    while month < end:
+        op.execute(
+            "CREATE TABLE \"Show_p{0:%Y_%m}\" PARTITION OF \"Show\" "
+            "FOR VALUES FROM ('{0:%Y-%m-%d}') TO ('{1:%Y-%m-%d}')".format(month, _next_month(month)))
+        month = _next_month(month)
+
+    op.execute(
+        'INSERT INTO "Show" (id, start_time, venue_id, artist_id, is_upcoming) '
+        'SELECT id, start_time, venue_id, artist_id, is_upcoming FROM "Show_unpartitioned"'
+    )
+    _create_show_indexes()
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.drop_table('Show_unpartitioned')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('ANALYZE "Show"')
+
+
+def downgrade():
+    # Archived months are not in Show; `flask show-partitions restore` them
+    # first or they are lost along with ShowArchive.
+    op.create_table(
+        'Show_unpartitioned',
+        sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\')'), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('is_upcoming', sa.Boolean(), server_default=sa.false(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+        sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+        sa.PrimaryKeyConstraint('id', name='Show_unpartitioned_pkey'),
+    )
+    op.execute(
+        'INSERT INTO "Show_unpartitioned" (id, start_time, venue_id, artist_id, is_upcoming) '
+        'SELECT id, start_time, venue_id, artist_id, is_upcoming FROM "Show"'
+    )
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    # Dropping the parent drops every partition with it.
+    op.drop_table('Show')
+    op.rename_table('Show_unpartitioned', 'Show')
+    op.execute('ALTER INDEX "Show_unpartitioned_pkey" RENAME TO "Show_pkey"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    _create_show_indexes()
+
+    op.drop_table('ShowArchive')
+    op.drop_column('Artist', 'archived_shows_count')
+    op.drop_column('Venue', 'archived_shows_count')
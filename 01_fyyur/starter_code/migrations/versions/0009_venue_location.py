@@ -0,0 +1,34 @@
+"""Venue coordinates with an earthdistance index
+
+Revision ID: 0009_venue_location
+Revises: 0008_show_partitions
+Create Date: 2026-10-18 07:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_venue_location'
+down_revision = '0008_show_partitions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+
+    # /venues/nearby asks for earth_box(...) @> ll_to_earth(latitude,
+    # longitude), which this index serves; see nearby_venues(). Fill the
+    # columns with `flask geocode-venues`.
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    op.execute('CREATE INDEX "ix_Venue_location" ON "Venue" USING gist (ll_to_earth(latitude, longitude))')
+
+
+def downgrade():
+    op.drop_index('ix_Venue_location', table_name='Venue')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
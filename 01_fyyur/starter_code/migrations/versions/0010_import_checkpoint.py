@@ -0,0 +1,35 @@
+"""ImportCheckpoint table for `flask import`
+
+Revision ID: 0010_import_checkpoint
+Revises: 0009_venue_location
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_import_checkpoint'
+down_revision = '0009_venue_location'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ImportCheckpoint',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=1000), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('rows_done', sa.Integer(), nullable=False),
+        sa.Column('batches_done', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_ImportCheckpoint_source_kind', 'ImportCheckpoint', ['source', 'kind'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_ImportCheckpoint_source_kind', table_name='ImportCheckpoint')
+    op.drop_table('ImportCheckpoint')
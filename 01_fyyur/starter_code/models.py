@@ -0,0 +1,173 @@
+"""Flask-SQLAlchemy models, and the `db` they are declared on.
+
+`db` is bound to an app by app.create_app(); importing this module needs no
+app, so scripts and commands can use the models with any app they create.
+"""
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.dialects.postgresql import ARRAY
+
+import dbpool
+import routing
+
+
+class FyyurSQLAlchemy(SQLAlchemy):
+    # Pool sizing from SQLALCHEMY_ENGINE_OPTIONS, adjusted per database.
+    def create_engine(self, sa_url, engine_opts):
+        return super().create_engine(sa_url, dbpool.engine_options(sa_url, engine_opts))
+
+    # GET requests read from the replica bind, if there is one.
+    def create_session(self, options):
+        return orm.sessionmaker(class_=routing.RoutingSession, db=self, **options)
+
+
+db = FyyurSQLAlchemy()
+
+
+# PostgreSQL text array, whose contains() (@>) can use the GIN indexes on
+# genres. SQLite, which scripts/benchmark.py falls back to, stores JSON.
+GenreList = ARRAY(db.String).with_variant(db.JSON, 'sqlite')
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Covers venue_areas() so /venues is an index-only scan.
+        db.Index('ix_Venue_state_city_name', 'state', 'city', 'name', 'id',
+                 postgresql_include=['upcoming_shows_count']),
+        # Serves genres @> ARRAY[...], see venue_areas(genre=...).
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+    website = db.Column(db.String(120), nullable=True)
+    genres = db.Column(GenreList, nullable=False)
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(500), nullable=True)
+
+    # Those of the city, from the gazetteer; see geo.py. On PostgreSQL,
+    # migration 0009 indexes ll_to_earth(latitude, longitude) for
+    # /venues/nearby.
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
+    # Maintained by create_show_submission and the rollover-shows command,
+    # see count_show() and roll_over_shows().
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # How many of the past shows were archived out of Show, see partitions.py.
+    archived_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    shows = db.relationship('Show', backref='venue', lazy=True)
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(GenreList, nullable=False, server_default='{}')
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+    website = db.Column(db.String(120), nullable=True)
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(500), nullable=True)
+
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    shows = db.relationship('Show', backref='artist', lazy=True)
+
+# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+# On PostgreSQL, migration 0008 range-partitions Show by month of
+# start_time, with primary key (id, start_time); see partitions.py. The ORM
+# identifies a show by id alone, which the shared sequence keeps unique.
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    # Whether the show is still counted in the upcoming_shows_count of its
+    # venue and artist. Flipped by roll_over_shows() once start_time passes.
+    is_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (
+        # Profile pages: all shows of one venue or artist, ordered by time.
+        db.Index('ix_Show_venue_id_start_time', venue_id, start_time),
+        db.Index('ix_Show_artist_id_start_time', artist_id, start_time),
+        # roll_over_shows(): only the shows still counted as upcoming.
+        db.Index('ix_Show_upcoming_start_time', start_time, postgresql_where=is_upcoming),
+        # /shows keyset pagination on (start_time, id), in both directions.
+        db.Index('ix_Show_start_time_id', start_time, id),
+    )
+
+class ShowArchive(db.Model):
+    """A monthly Show partition moved to cold storage by partitions.py."""
+    __tablename__ = 'ShowArchive'
+
+    id = db.Column(db.Integer, primary_key=True)
+    partition = db.Column(db.String(63), nullable=False, unique=True)
+    range_start = db.Column(db.DateTime, nullable=False)
+    range_end = db.Column(db.DateTime, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class AreaSummary(db.Model):
+    """The /venues listing, one row per (state, city); see refresh_areas()."""
+    __tablename__ = 'AreaSummary'
+    __table_args__ = (
+        # venue_areas() reads the whole table in this order.
+        db.Index('ix_AreaSummary_state_city', 'state', 'city', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.String(120))
+    city = db.Column(db.String(120))
+    # [{"id", "name", "num_upcoming_shows"}, ...], ordered by name.
+    venues = db.Column(db.JSON, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+class ImportCheckpoint(db.Model):
+    """How many rows of a source file `flask import` has committed.
+
+    Written in the transaction of each batch, see importer.py, so it never
+    disagrees with what was loaded.
+    """
+    __tablename__ = 'ImportCheckpoint'
+    __table_args__ = (
+        db.Index('ix_ImportCheckpoint_source_kind', 'source', 'kind', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(1000), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False)
+    batches_done = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
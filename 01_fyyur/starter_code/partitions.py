@@ -0,0 +1,223 @@
+"""Monthly partitions of the Show table, for `flask show-partitions`.
+
+Show is range-partitioned on start_time, one partition per month named
+Show_pYYYY_MM, plus a DEFAULT partition for rows outside all of them (see
+migration 0008). `ensure` creates partitions ahead of time, moving any rows
+the default partition already holds for a new month. `archive` copies a
+month that is entirely in the past to a gzipped CSV under SHOW_ARCHIVE_DIR,
+records it in ShowArchive, adds its shows to archived_shows_count and drops
+the partition, all in one transaction; the past_shows_count counters are
+left alone, so page counts still include archived shows. `restore` reverses
+an archive. Shows listed later for an archived month land in the default
+partition, and `restore` moves them into the month's partition with the
+archived ones. PostgreSQL only.
+"""
+import gzip
+import hashlib
+import os
+import re
+from datetime import datetime
+
+from models import db, Venue, Artist, ShowArchive
+
+DEFAULT_PARTITION = 'Show_default'
+PARTITION_NAME = re.compile(r'^Show_p(\d{4})_(\d{2})$')
+COLUMNS = ('id', 'start_time', 'venue_id', 'artist_id', 'is_upcoming')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start):
+    return 'Show_p{:%Y_%m}'.format(start)
+
+
+def partition_month(name):
+    """The first day of the month partition `name` holds, or None."""
+    match = PARTITION_NAME.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned():
+    if db.session.bind.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('\"Show\"')"
+    ).scalar() or False
+
+
+def list_partitions():
+    """(name, estimated rows, bound) of every partition, oldest first."""
+    return db.session.execute(
+        'SELECT c.relname, c.reltuples::bigint, pg_get_expr(c.relpartbound, c.oid) '
+        'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = \'"Show"\'::regclass ORDER BY c.relname'
+    ).fetchall()
+
+
+def _raw_cursor():
+    return db.session.connection().connection.cursor()
+
+
+def create_partition(start):
+    """Create and attach the partition for the month starting at `start`.
+
+    Returns the number of rows moved into it from the default partition.
+    The caller commits.
+    """
+    name, end = partition_name(start), next_month(start)
+    db.session.execute('CREATE TABLE "{}" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(name))
+    moved = _move_from_default(name, start, end)
+    db.session.execute(
+        "ALTER TABLE \"Show\" ATTACH PARTITION \"{}\" FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')"
+        .format(name, start, end))
+    return moved
+
+
+def _move_from_default(name, start, end):
+    """Move the default partition's rows from `start` to `end` into table
+    `name`; ATTACH fails while the default partition holds any. Returns
+    how many were moved."""
+    return db.session.execute(
+        db.text('WITH moved AS (DELETE FROM "{}" WHERE start_time >= :start AND start_time < :end '
+                'RETURNING {columns}) INSERT INTO "{}" ({columns}) SELECT {columns} FROM moved'
+                .format(DEFAULT_PARTITION, name, columns=', '.join(COLUMNS))),
+        {'start': start, 'end': end},
+    ).rowcount
+
+
+def ensure_partitions(months_ahead=12, now=None):
+    """Create the missing partitions from this month to `months_ahead`
+    months on, and for every month the default partition holds rows of.
+
+    Archived months are skipped: their shows stay in the default partition
+    until restore_partition() brings the month back.
+
+    Returns [(name, rows moved from the default partition)], one per
+    partition created; each is committed on its own.
+    """
+    start = month_start(now or datetime.now())
+    wanted = set()
+    for _ in range(months_ahead + 1):
+        wanted.add(start)
+        start = next_month(start)
+    wanted.update(month for month, in db.session.execute(
+        'SELECT DISTINCT date_trunc(\'month\', start_time) FROM "{}"'.format(DEFAULT_PARTITION)))
+    existing = set(name for name, rows, bound in list_partitions())
+    archived = set(name for name, in db.session.query(ShowArchive.partition))
+
+    created = []
+    for month in sorted(wanted):
+        name = partition_name(month)
+        if name in existing or name in archived:
+            continue
+        created.append((name, create_partition(month)))
+        db.session.commit()
+    return created
+
+
+def _owner_counts(name, column):
+    return db.session.execute(
+        'SELECT {0}, count(*) FROM "{1}" GROUP BY {0}'.format(column, name)).fetchall()
+
+
+def _add_archived(counts, model, sign):
+    params = [{'_id': id, '_n': sign * n} for id, n in counts]
+    if params:
+        db.session.execute(
+            model.__table__.update()
+            .where(model.id == db.bindparam('_id'))
+            .values(archived_shows_count=model.archived_shows_count + db.bindparam('_n')),
+            params,
+        )
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_partition(name, directory, now=None):
+    """Move partition `name` to `directory`; returns the ShowArchive row."""
+    start = partition_month(name)
+    if start is None:
+        raise ValueError('{} is not a monthly Show partition'.format(name))
+    end = next_month(start)
+    if end > month_start(now or datetime.now()):
+        raise ValueError('{} is not entirely in the past'.format(name))
+    db.session.execute('LOCK TABLE "{}" IN SHARE MODE'.format(name))
+    upcoming = db.session.execute('SELECT count(*) FROM "{}" WHERE is_upcoming'.format(name)).scalar()
+    if upcoming:
+        raise ValueError('{} still has {} show(s) counted as upcoming; run `flask rollover-shows` first'
+                         .format(name, upcoming))
+
+    # The file is complete before the partition goes; if the transaction
+    # then fails, the file is removed again.
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.csv.gz')
+    with gzip.open(path + '.tmp', 'wb') as f:
+        _raw_cursor().copy_expert(
+            'COPY (SELECT {} FROM "{}" ORDER BY start_time, id) TO STDOUT WITH (FORMAT csv, HEADER)'
+            .format(', '.join(COLUMNS), name), f)
+    os.replace(path + '.tmp', path)
+
+    try:
+        rows = db.session.execute('SELECT count(*) FROM "{}"'.format(name)).scalar()
+        _add_archived(_owner_counts(name, 'venue_id'), Venue, 1)
+        _add_archived(_owner_counts(name, 'artist_id'), Artist, 1)
+        db.session.execute('ALTER TABLE "Show" DETACH PARTITION "{}"'.format(name))
+        db.session.execute('DROP TABLE "{}"'.format(name))
+        archive = ShowArchive(partition=name, range_start=start, range_end=end, path=path,
+                              rows=rows, sha256=_sha256(path), archived_at=datetime.now())
+        db.session.add(archive)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        os.remove(path)
+        raise
+    return archive
+
+
+def archive_before(month, directory, now=None):
+    """Archive every monthly partition that ends on or before `month`."""
+    archived = []
+    for name, rows, bound in list_partitions():
+        start = partition_month(name)
+        if start is not None and next_month(start) <= month:
+            archived.append(archive_partition(name, directory, now))
+    return archived
+
+
+def restore_partition(name):
+    """Load an archived partition back into Show, together with any shows
+    listed for its month since, which wait in the default partition.
+    Returns the number of shows loaded from the archive."""
+    archive = ShowArchive.query.filter_by(partition=name).first()
+    if archive is None:
+        raise ValueError('{} has not been archived'.format(name))
+    if _sha256(archive.path) != archive.sha256:
+        raise ValueError('{} does not match its recorded checksum'.format(archive.path))
+
+    db.session.execute('CREATE TABLE "{}" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(name))
+    with gzip.open(archive.path, 'rb') as f:
+        _raw_cursor().copy_expert(
+            'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, HEADER)'.format(name, ', '.join(COLUMNS)), f)
+    _add_archived(_owner_counts(name, 'venue_id'), Venue, -1)
+    _add_archived(_owner_counts(name, 'artist_id'), Artist, -1)
+    # Counted as past shows already, not as archived ones.
+    _move_from_default(name, archive.range_start, archive.range_end)
+    db.session.execute(
+        "ALTER TABLE \"Show\" ATTACH PARTITION \"{}\" FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')"
+        .format(name, archive.range_start, archive.range_end))
+    rows = archive.rows
+    db.session.delete(archive)
+    db.session.commit()
+    return rows
@@ -0,0 +1,96 @@
+"""Primary/replica routing for the Flask-SQLAlchemy session.
+
+With a 'replica' entry in SQLALCHEMY_BINDS, every statement run while
+serving a GET or HEAD request goes to the replica, and everything else,
+including anything flushed, goes to the primary. After a request that
+committed a write, the client is pinned to the primary for
+REPLICA_PIN_SECONDS through the session cookie, so the page it is sent to
+next shows its own write even if the replica has not caught up yet.
+Requests that only read, such as the search forms' POSTs, do not pin.
+
+Reads inside primary_reads() go to the primary as well. The cache fills
+its entries in it (see Cache.filling()), since a replica read right after
+an invalidation could otherwise put the stale data back for as long as
+the entry lives. Other clients can still see a lagging replica in
+uncached reads; keep its usual lag well under REPLICA_PIN_SECONDS.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def use_replica():
+    """Whether reads in the current request may go to the replica."""
+    if not has_request_context() or request.method not in READ_METHODS or g.get('primary_reads'):
+        return False
+    return session.get('primary_until', 0) <= time.time()
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads of the current request to the primary while in the block."""
+    if not has_request_context():
+        yield
+        return
+    g.primary_reads = g.get('primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        g.primary_reads -= 1
+
+
+class RoutingSession(SignallingSession):
+    """SignallingSession that reads from the replica when use_replica() says so."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and REPLICA_BIND in (self.app.config['SQLALCHEMY_BINDS'] or {})
+                and use_replica()):
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+# A session that flushed changes or executed an INSERT, UPDATE or DELETE
+# has written; once it commits, the request marks its client for pinning.
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(execute_state):
+    if execute_state.is_insert or execute_state.is_update or execute_state.is_delete:
+        execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        g.committed_write = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(session):
+    session.info.pop('wrote', None)
+
+
+def pin_to_primary(response):
+    """after_request hook: send the next reads of a client whose request
+    committed a write to the primary."""
+    if g.pop('committed_write', False):
+        session['primary_until'] = time.time() + current_app.config.get('REPLICA_PIN_SECONDS', 10)
+    return response
+
+
+def init_app(app):
+    if (app.config['SQLALCHEMY_BINDS'] or {}).get(REPLICA_BIND):
+        app.after_request(pin_to_primary)
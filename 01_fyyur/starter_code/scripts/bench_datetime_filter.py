@@ -0,0 +1,64 @@
+"""Compare the `datetime` Jinja filter with the dateutil-per-call original.
+
+    python scripts/bench_datetime_filter.py --rows 100000
+
+The original filter parsed a string and let babel rebuild the pattern on
+every call. The current one takes datetime objects as they come out of the
+database and reuses a compiled pattern; format_datetimes() does a whole
+list at once.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+
+from app import format_datetime, format_datetimes  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def timed(label, rows, run):
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    print('{:<40} {:8.3f} s  {:8.2f} us/row'.format(label, elapsed, elapsed / rows * 1e6))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--format', default='full')
+    args = parser.parse_args()
+
+    base = datetime(2024, 1, 1, 20, 0)
+    values = [base + timedelta(minutes=37 * i) for i in range(args.rows)]
+    strings = [value.strftime('%Y-%m-%dT%H:%M:%S.%fZ') for value in values]
+
+    expected = timed('legacy filter, strings', args.rows,
+                     lambda: [legacy_format_datetime(value, args.format) for value in strings])
+    from_strings = timed('format_datetime, strings', args.rows,
+                         lambda: [format_datetime(value, args.format) for value in strings])
+    from_datetimes = timed('format_datetime, datetimes', args.rows,
+                           lambda: [format_datetime(value, args.format) for value in values])
+    batch = timed('format_datetimes, datetimes', args.rows,
+                  lambda: format_datetimes(values, args.format))
+
+    assert expected == from_strings == from_datetimes == batch, 'outputs differ'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""Benchmark every read controller against a seeded database.
+
+    python scripts/benchmark.py run --size 100k --output bench/baseline.json
+    python scripts/benchmark.py run --size 100k --compare bench/baseline.json
+    python scripts/benchmark.py compare bench/baseline.json bench/current.json
+
+The database comes from --database or $BENCH_DATABASE_URL and should be a
+dedicated one: it is created and seeded with scripts/seed.py's generator
+when empty, and reused when it already holds the data set for --size. When
+neither is set, or PostgreSQL cannot be reached, a SQLite file in the
+temporary directory is used instead; the genre filters are skipped there
+and similarity() is computed in Python, so compare runs on the same
+backend only.
+
+Each route is requested through the Flask test client, with the page cache
+off unless --cache is given, and the report records latency percentiles,
+the number of SQL statements per request and the peak memory allocated
+while serving it. `compare` exits with status 1 when a route got slower,
+allocates more, or runs more queries than in the baseline.
+
+    python scripts/benchmark.py compression --size 100k
+
+`compression` reports, for each route whose response would be compressed,
+the bytes compression.py saves and the CPU time it spends per response,
+for gzip and, when the brotli package is installed, brotli.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, db, cache, Venue, Artist, Show  # noqa: E402
+from cache import NullBackend  # noqa: E402
+from compression import CompressMiddleware, compress_chunks, supported_encodings  # noqa: E402
+from seed import seed_database  # noqa: E402
+
+app = create_app()
+
+# (venues, artists, shows) for each --size.
+SIZES = {
+    '1k': (50, 100, 1000),
+    '100k': (1000, 2500, 100000),
+    '1m': (5000, 20000, 1000000),
+}
+
+
+def _trigrams(value):
+    """The trigram set pg_trgm builds for `value`."""
+    trigrams = set()
+    for word in ''.join(c if c.isalnum() else ' ' for c in value.lower()).split():
+        word = '  ' + word + ' '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def similarity(a, b):
+    """pg_trgm's similarity(), for SQLite."""
+    if a is None or b is None:
+        return None
+    a, b = _trigrams(a), _trigrams(b)
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def choose_database(url, size):
+    """`url` if it can be connected to, else a SQLite file for `size`."""
+    if url:
+        try:
+            sqlalchemy.create_engine(url).connect().close()
+            return url
+        except Exception as e:
+            print('Cannot use {} ({}); falling back to SQLite.'.format(url, e.__class__.__name__))
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_bench_{}.sqlite'.format(size))
+
+
+def prepare_database(size):
+    """Create and seed the schema, or check that it holds `size` already."""
+    venues, artists, shows = SIZES[size]
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        event.listen(db.engine, 'connect',
+                     lambda connection, record: connection.create_function('similarity', 2, similarity))
+        db.engine.dispose()
+    elif dialect == 'postgresql':
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.commit()
+    db.create_all()
+
+    counts = (Venue.query.count(), Artist.query.count(), Show.query.count())
+    if counts == (venues, artists, shows):
+        return
+    if any(counts):
+        sys.exit('The database holds {} venues, {} artists and {} shows, not the {} data set; '
+                 'point --database at an empty one.'.format(*counts, size))
+    print('Seeding {} venues, {} artists and {} shows...'.format(venues, artists, shows))
+    started = time.perf_counter()
+    seed_database(venues, artists, shows)
+    if dialect == 'postgresql':
+        db.session.execute('ANALYZE')
+        db.session.commit()
+    print('Seeded in {:.1f}s.'.format(time.perf_counter() - started))
+
+
+def routes(dialect):
+    """(label, method, path, form data) for every read controller."""
+    venue = Venue.query.order_by(Venue.upcoming_shows_count.desc(), Venue.id).first()
+    artist = Artist.query.order_by(Artist.upcoming_shows_count.desc(), Artist.id).first()
+    genre = venue.genres[0]
+    routes = [
+        ('index', 'GET', '/', None),
+        ('venues', 'GET', '/venues', None),
+        ('venues_by_genre', 'GET', '/venues?genre={}'.format(genre), None),
+        ('search_venues', 'POST', '/venues/search', {'search_term': venue.name.split()[1]}),
+        ('show_venue', 'GET', '/venues/{}'.format(venue.id), None),
+        ('edit_venue', 'GET', '/venues/{}/edit'.format(venue.id), None),
+        ('create_venue_form', 'GET', '/venues/create', None),
+        ('artists', 'GET', '/artists', None),
+        ('artists_by_genre', 'GET', '/artists?genre={}'.format(genre), None),
+        ('search_artists', 'POST', '/artists/search', {'search_term': artist.name.split()[0]}),
+        ('show_artist', 'GET', '/artists/{}'.format(artist.id), None),
+        ('edit_artist', 'GET', '/artists/{}/edit'.format(artist.id), None),
+        ('create_artist_form', 'GET', '/artists/create', None),
+        ('shows', 'GET', '/shows', None),
+        ('shows_past', 'GET', '/shows?cursor=past', None),
+        ('create_shows', 'GET', '/shows/create', None),
+        ('api_venues', 'GET', '/api/v1/venues', None),
+        ('api_venue', 'GET', '/api/v1/venues/{}'.format(venue.id), None),
+        ('api_artists', 'GET', '/api/v1/artists', None),
+        ('api_artist', 'GET', '/api/v1/artists/{}'.format(artist.id), None),
+        ('api_shows', 'GET', '/api/v1/shows', None),
+        ('venues_nearby', 'GET', '/venues/nearby?lat={}&lng={}&radius=50'.format(venue.latitude, venue.longitude), None),
+        ('autocomplete_artists', 'GET', '/api/autocomplete/artists?q={}'.format(artist.name[:3]), None),
+        ('export_shows', 'GET', '/export/shows.csv?venue_id={}'.format(venue.id), None),
+    ]
+    if dialect != 'postgresql':
+        # genres @> ARRAY[...] has no SQLite equivalent.
+        routes = [route for route in routes if not route[0].endswith('_by_genre')]
+    return routes
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def measure(client, method, path, data, iterations, warmup):
+    """Time `iterations` requests, then one more under tracemalloc."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def request():
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        return response
+
+    for _ in range(warmup):
+        request()
+
+    timings = []
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for _ in range(iterations):
+            del statements[:]
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    tracemalloc.start()
+    try:
+        request()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p90_ms': round(_percentile(timings, 90), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': queries,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup(args):
+    """Point the app at the benchmark database; returns (dialect, routes)."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = choose_database(
+        args.database or os.environ.get('BENCH_DATABASE_URL'), args.size)
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Flask-SQLAlchemy's deprecation warnings and sqlstats' log line for
+    # every request would drown the report.
+    warnings.simplefilter('ignore', DeprecationWarning)
+    app.logger.setLevel(logging.WARNING)
+
+    with app.app_context():
+        prepare_database(args.size)
+        dialect = db.engine.dialect.name
+        selected = [route for route in routes(dialect) if not args.only or route[0] in args.only.split(',')]
+        if not args.cache:
+            cache.backend = NullBackend()
+    return dialect, selected
+
+
+def run(args):
+    dialect, selected = setup(args)
+
+    client = app.test_client()
+    results = {}
+    for label, method, path, data in selected:
+        results[label] = measure(client, method, path, data, args.iterations, args.warmup)
+        print('{:<20} {status:>3}  p50 {p50_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  '
+              '{queries:>3} queries  {peak_kib:>9.1f} KiB'.format(label, **results[label]))
+
+    report = {
+        'meta': {
+            'size': args.size,
+            'dialect': dialect,
+            'cache': args.cache,
+            'iterations': args.iterations,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        },
+        'routes': results,
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('Wrote {}.'.format(args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            return compare(json.load(f), report, args.threshold)
+    return 0
+
+
+def compression_report(args):
+    """Bytes saved and CPU time spent by compression.py, per route."""
+    dialect, selected = setup(args)
+    middleware = app.wsgi_app
+    if not isinstance(middleware, CompressMiddleware):
+        middleware = CompressMiddleware(middleware)
+    encodings = supported_encodings()
+    if 'br' not in encodings:
+        print('The brotli package is not installed; measuring gzip only.')
+
+    client = app.test_client()
+    results = {}
+    for label, method, path, data in selected:
+        # No Accept-Encoding, so the body comes back uncompressed, in the
+        # chunks the middleware would see.
+        response = client.open(path, method=method, data=data, buffered=False)
+        chunks = list(response.response)
+        response.close()
+        raw = sum(len(chunk) for chunk in chunks)
+        if not middleware.compressible(response.status, response.headers) or raw < middleware.min_size:
+            continue
+
+        results[label] = {'bytes': raw}
+        line = '{:<20} {:>9} B'.format(label, raw)
+        for encoding in encodings:
+            started = time.process_time()
+            for _ in range(args.iterations):
+                size = sum(len(out) for out in compress_chunks(
+                    iter(chunks), middleware.encoder(encoding), middleware.min_size, middleware.flush_size))
+            cpu_ms = (time.process_time() - started) * 1000 / args.iterations
+            results[label][encoding] = {
+                'bytes': size,
+                'saved_pct': round(100 * (1 - size / raw), 1),
+                'cpu_ms': round(cpu_ms, 3),
+            }
+            line += '  {} {:>8} B ({saved_pct:>5.1f}% saved, {cpu_ms:>7.3f} ms CPU)'.format(
+                encoding, size, **results[label][encoding])
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'size': args.size, 'dialect': dialect, 'iterations': args.iterations,
+                                'min_size': middleware.min_size, 'flush_size': middleware.flush_size},
+                       'routes': results}, f, indent=2, sort_keys=True)
+        print('Wrote {}.'.format(args.output))
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """Print the differences between two reports; 1 if anything regressed."""
+    for key in ('size', 'dialect', 'cache'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print('warning: {} differs ({} vs {})'.format(
+                key, baseline['meta'].get(key), current['meta'].get(key)))
+
+    regressions = 0
+    for label, now in sorted(current['routes'].items()):
+        before = baseline['routes'].get(label)
+        if before is None:
+            print('{:<20} new'.format(label))
+            continue
+        problems = []
+        # Timings need both a relative and an absolute change, so noise on
+        # sub-millisecond routes is not reported.
+        for metric, floor in (('p50_ms', 1.0), ('p99_ms', 2.0), ('peak_kib', 64.0)):
+            if now[metric] > before[metric] * (1 + threshold) and now[metric] - before[metric] > floor:
+                problems.append('{} {} -> {}'.format(metric, before[metric], now[metric]))
+        if now['queries'] > before['queries']:
+            problems.append('queries {} -> {}'.format(before['queries'], now['queries']))
+        if now['status'] != before['status']:
+            problems.append('status {} -> {}'.format(before['status'], now['status']))
+        if problems:
+            regressions += 1
+            print('{:<20} REGRESSED  {}'.format(label, ', '.join(problems)))
+        else:
+            print('{:<20} ok  p50 {} -> {} ms'.format(label, before['p50_ms'], now['p50_ms']))
+    print('{} regression(s).'.format(regressions))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='benchmark the routes')
+    run_parser.add_argument('--size', choices=sorted(SIZES), default='1k')
+    run_parser.add_argument('--database', help='SQLAlchemy URL of a dedicated database')
+    run_parser.add_argument('--iterations', type=int, default=50)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+    run_parser.add_argument('--only', help='comma-separated route labels to run')
+    run_parser.add_argument('--output', help='write the report to this JSON file')
+    run_parser.add_argument('--compare', help='baseline report to compare against')
+    run_parser.add_argument('--threshold', type=float, default=0.2,
+                            help='relative slowdown that counts as a regression (default 0.2)')
+
+    compression_parser = commands.add_parser('compression', help='measure response compression')
+    compression_parser.add_argument('--size', choices=sorted(SIZES), default='1k')
+    compression_parser.add_argument('--database', help='SQLAlchemy URL of a dedicated database')
+    compression_parser.add_argument('--iterations', type=int, default=20)
+    compression_parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+    compression_parser.add_argument('--only', help='comma-separated route labels to run')
+    compression_parser.add_argument('--output', help='write the report to this JSON file')
+
+    compare_parser = commands.add_parser('compare', help='compare two reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        sys.exit(run(args))
+    if args.command == 'compression':
+        sys.exit(compression_report(args))
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    sys.exit(compare(baseline, current, args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""EXPLAIN ANALYZE every query the controllers run against a seeded database.
+
+    python scripts/seed.py --venues 2000 --artists 5000 --shows 200000
+    python scripts/explain_report.py
+
+Each route is requested once through the Flask test client while the
+statements it sends are recorded. Every recorded SELECT is then run again
+under EXPLAIN (ANALYZE, BUFFERS) with the same parameters, and the report
+lists the plan together with the indexes it used and any sequential scans.
+PostgreSQL only.
+"""
+import argparse
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, db, Venue, Artist  # noqa: E402
+
+
+def routes(venue, artist):
+    """(label, method, path, form data) for every read controller."""
+    return [
+        ('venues', 'GET', '/venues', None),
+        ('search_venues', 'POST', '/venues/search', {'search_term': venue.name.split()[1]}),
+        ('show_venue', 'GET', '/venues/{}'.format(venue.id), None),
+        ('artists', 'GET', '/artists', None),
+        ('search_artists', 'POST', '/artists/search', {'search_term': artist.name.split()[0]}),
+        ('show_artist', 'GET', '/artists/{}'.format(artist.id), None),
+        ('shows', 'GET', '/shows', None),
+    ]
+
+
+def capture(client, method, path, data):
+    """Request `path` and return the SELECT statements it executed."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(path, method=method, data=data)
+        # Streamed pages, such as /shows, only run their queries as the
+        # body is read.
+        response.get_data()
+        response.close()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(statement, parameters):
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', help='comma-separated controller names to report on')
+    args = parser.parse_args()
+    only = set(args.only.split(',')) if args.only else None
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit('explain_report.py needs a PostgreSQL database.')
+        venue = Venue.query.order_by(Venue.upcoming_shows_count.desc()).first()
+        artist = Artist.query.order_by(Artist.upcoming_shows_count.desc()).first()
+        if venue is None or artist is None:
+            sys.exit('The database is empty; run scripts/seed.py first.')
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+    client = app.test_client()
+    for label, method, path, data in routes(venue, artist):
+        if only and label not in only:
+            continue
+        print('=' * 78)
+        print('{}  ({} {})'.format(label, method, path))
+        with app.app_context():
+            for statement, parameters in capture(client, method, path, data):
+                plan = explain(statement, parameters)
+                text = '\n'.join(plan)
+                indexes = sorted(set(re.findall(r'using (\S+) on', text, re.IGNORECASE)))
+                seq_scans = sorted(set(re.findall(r'Seq Scan on (\S+)', text)))
+                print('-' * 78)
+                print(' '.join(statement.split()))
+                print()
+                print(text)
+                print()
+                print('indexes used: {}'.format(', '.join(indexes) or 'none'))
+                if seq_scans:
+                    print('sequential scans: {}'.format(', '.join(seq_scans)))
+
+
+if __name__ == '__main__':
+    main()
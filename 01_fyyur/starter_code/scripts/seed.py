@@ -0,0 +1,167 @@
+"""Fill an empty database with synthetic venues, artists and shows.
+
+    python scripts/seed.py --venues 200 --artists 500 --shows 10000
+
+Rows are generated from a fixed random seed, so two runs with the same
+arguments produce the same data. Show counters on Venue and Artist are
+filled in as well, so `flask verify-show-counters` reports no drift, and
+so is the AreaSummary table behind /venues. Venues are placed within a few
+km of their city's entry in GAZETTEER_PATH, for /venues/nearby.
+"""
+import argparse
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import current_app  # noqa: E402
+
+import geo  # noqa: E402
+from app import create_app, db, Venue, Artist, Show, rebuild_area_summary  # noqa: E402
+
+AREAS = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('Oakland', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Buffalo', 'NY'),
+    ('Austin', 'TX'), ('Houston', 'TX'), ('Dallas', 'TX'),
+    ('Seattle', 'WA'), ('Portland', 'OR'), ('Denver', 'CO'),
+    ('Chicago', 'IL'), ('Nashville', 'TN'), ('Memphis', 'TN'),
+    ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+    ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Detroit', 'MI'),
+    ('Minneapolis', 'MN'), ('Kansas City', 'MO'), ('Phoenix', 'AZ'),
+]
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+]
+WORDS = [
+    'Musical', 'Hop', 'Park', 'Square', 'Live', 'Coffee', 'Dueling', 'Pianos',
+    'Wild', 'Sax', 'Band', 'Guns', 'Petals', 'Blue', 'Velvet', 'Neon',
+    'Echo', 'Lounge', 'Hall', 'Garden', 'Basement', 'Attic', 'Circuit',
+    'Static', 'Harbor', 'Moon', 'Gravel', 'Copper', 'Orchid', 'Lantern',
+]
+
+BATCH_SIZE = 5000
+
+
+def _name(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _shows(count, venues, artists, now, seed):
+    """Yield show rows; the same arguments always yield the same rows."""
+    rnd = random.Random(seed + 1)
+    for id in range(1, count + 1):
+        start_time = now + timedelta(minutes=rnd.randint(-365 * 24 * 60, 180 * 24 * 60))
+        yield {
+            'id': id,
+            'venue_id': rnd.randint(1, venues),
+            'artist_id': rnd.randint(1, artists),
+            'start_time': start_time,
+            'is_upcoming': start_time > now,
+        }
+
+
+def _insert(table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+
+
+def seed_database(venues, artists, shows, seed=0, now=None):
+    """Insert the synthetic data set into the (empty) configured database."""
+    if Venue.query.first() or Artist.query.first() or Show.query.first():
+        raise RuntimeError('the database already has data; seed an empty one')
+
+    now = now or datetime.now()
+    rnd = random.Random(seed)
+
+    # One pass over the shows to know the counters before the venues and
+    # artists they belong to are inserted.
+    upcoming, past = Counter(), Counter()
+    for show in _shows(shows, venues, artists, now, seed):
+        counter = upcoming if show['is_upcoming'] else past
+        counter['venue', show['venue_id']] += 1
+        counter['artist', show['artist_id']] += 1
+
+    places = geo.gazetteer(current_app.config['GAZETTEER_PATH'])
+    # A generator of its own, so the rest of the data set does not change.
+    scatter = random.Random(seed)
+
+    def venue_rows():
+        for id in range(1, venues + 1):
+            city, state = rnd.choice(AREAS)
+            point = places.get(geo.area_key(city, state))
+            yield {
+                'id': id,
+                'name': 'The {} {}'.format(_name(rnd, 2), id),
+                'city': city,
+                'state': state,
+                'address': '{} {} Street'.format(rnd.randint(1, 9999), rnd.choice(WORDS)),
+                'phone': '{:03d}-{:03d}-{:04d}'.format(rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+                'genres': rnd.sample(GENRES, rnd.randint(1, 3)),
+                'image_link': 'https://picsum.photos/seed/venue{}/400/300'.format(id),
+                'facebook_link': 'https://www.facebook.com/venue{}'.format(id),
+                'seeking_talent': rnd.random() < 0.5,
+                'upcoming_shows_count': upcoming['venue', id],
+                'past_shows_count': past['venue', id],
+                'latitude': point and point[0] + scatter.uniform(-0.05, 0.05),
+                'longitude': point and point[1] + scatter.uniform(-0.05, 0.05),
+            }
+
+    def artist_rows():
+        for id in range(1, artists + 1):
+            city, state = rnd.choice(AREAS)
+            yield {
+                'id': id,
+                'name': '{} {}'.format(_name(rnd, 2), id),
+                'city': city,
+                'state': state,
+                'phone': '{:03d}-{:03d}-{:04d}'.format(rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+                'genres': rnd.sample(GENRES, rnd.randint(1, 3)),
+                'image_link': 'https://picsum.photos/seed/artist{}/400/300'.format(id),
+                'facebook_link': 'https://www.facebook.com/artist{}'.format(id),
+                'seeking_venue': rnd.random() < 0.5,
+                'upcoming_shows_count': upcoming['artist', id],
+                'past_shows_count': past['artist', id],
+            }
+
+    _insert(Venue.__table__, venue_rows())
+    _insert(Artist.__table__, artist_rows())
+    _insert(Show.__table__, _shows(shows, venues, artists, now, seed))
+    rebuild_area_summary(now)
+
+    # Explicit ids bypass the serial sequences; move them past the seeded rows.
+    if db.session.bind.dialect.name == 'postgresql':
+        for model in (Venue, Artist, Show):
+            db.session.execute(
+                "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+                "coalesce(max(id), 1)) FROM \"{0}\"".format(model.__tablename__)
+            )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--artists', type=int, default=500)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed_database(args.venues, args.artists, args.shows, seed=args.seed)
+    print('Seeded {} venues, {} artists and {} shows.'.format(args.venues, args.artists, args.shows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Measure how long a fresh process takes to import and build the app.
+
+    python scripts/startup_time.py --runs 7
+
+Every measurement runs in a new Python process, as a starting worker would,
+and the median over --runs is reported for: importing app.py, create_app(),
+and compiling every template with an empty Jinja bytecode cache and with
+the one the previous run left behind. No database connection is made.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app()
+t2 = time.perf_counter()
+for name in application.jinja_env.list_templates():
+    application.jinja_env.get_template(name)
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'templates': t3 - t2}))
+'''
+
+
+def probe(cache_dir):
+    env = dict(os.environ, JINJA_BYTECODE_CACHE_DIR=cache_dir)
+    out = subprocess.run([sys.executable, '-W', 'ignore', '-c', PROBE], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(probe(cache_dir))
+            warm.append(probe(cache_dir))
+
+    def median(runs, key):
+        return statistics.median(run[key] for run in runs) * 1000
+
+    print('{:<32} {:>10}'.format('median of {} runs'.format(args.runs), 'ms'))
+    print('{:<32} {:>10.1f}'.format('import app', median(cold + warm, 'import')))
+    print('{:<32} {:>10.1f}'.format('create_app()', median(cold + warm, 'create_app')))
+    print('{:<32} {:>10.1f}'.format('templates, cold bytecode cache', median(cold, 'templates')))
+    print('{:<32} {:>10.1f}'.format('templates, warm bytecode cache', median(warm, 'templates')))
+
+
+if __name__ == '__main__':
+    main()
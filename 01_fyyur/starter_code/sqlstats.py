@@ -0,0 +1,158 @@
+import json
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class NPlusOneError(Exception):
+    """The same statement ran more times in one request than allowed."""
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_PARAMETER = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|\?')
+
+
+def statement_shape(statement):
+    """`statement` with literals and parameters replaced by ?, so repeats of
+    one query with different values compare equal."""
+    shape = _STRING.sub('?', statement)
+    shape = _PARAMETER.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDERS.sub('(?)', shape)
+    return ' '.join(shape.split())
+
+
+class RequestStats(object):
+    """SQL statements run while serving one request."""
+
+    def __init__(self, slowest=3):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.reported = set()
+        self.slowest = []
+        self.keep = slowest
+        # Set once the response turns out to be streamed; see SQLStats.
+        self.streamed = False
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.db_time += elapsed
+        self.slowest.append((elapsed, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.keep:]
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        return shape, self.shapes[shape]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 3),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'slowest': [{'ms': round(elapsed * 1000, 3), 'statement': ' '.join(statement.split())}
+                        for elapsed, statement in self.slowest],
+        }
+
+
+class SQLStats(object):
+    """Per-request SQL counts and timings, and an N+1 query detector.
+
+    Every response gets an X-Query-Count and a Server-Timing header, and a
+    JSON log line with the request's query count, database time and slowest
+    statements is written to app.logger once the response is closed. A
+    streamed response runs most of its statements after its headers are
+    sent, so it gets no headers at all; only the log line covers it.
+
+    A statement shape (the SQL with its values replaced by ?) that runs more
+    than SQLSTATS_N_PLUS_ONE_THRESHOLD times in one request is logged as a
+    warning, or raises NPlusOneError where it runs when the app is TESTING.
+    Once a streamed response has started it is only logged, since raising
+    would cut the body short after a 200 was sent.
+
+    Config keys:
+      SQLSTATS_ENABLED                 default True
+      SQLSTATS_HEADERS                 send the headers, default True
+      SQLSTATS_N_PLUS_ONE_THRESHOLD    default 5
+      SQLSTATS_SLOWEST                 statements kept for the log, default 3
+    """
+
+    def __init__(self, app=None):
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQLSTATS_ENABLED', True):
+            return
+        app.extensions['sqlstats'] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        # Listening on the Engine class rather than db.engine also covers
+        # engines Flask-SQLAlchemy creates later, e.g. after the URI changes.
+        # Statements outside a request of an app with SQLStats are ignored,
+        # so one pair of listeners serves every app.
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            self._listening = True
+
+    def _start(self):
+        g.sqlstats = RequestStats(current_app.config.get('SQLSTATS_SLOWEST', 3))
+
+    @staticmethod
+    def _current():
+        # An app context can outlive its request, e.g. one pushed around
+        # several test client calls, so require the request itself.
+        if has_request_context():
+            return g.get('sqlstats')
+        return None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('sqlstats_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        if stats is None or not conn.info.get('sqlstats_started'):
+            return
+        elapsed = time.perf_counter() - conn.info['sqlstats_started'].pop()
+        shape, count = stats.record(statement, elapsed)
+
+        app = current_app._get_current_object()
+        threshold = app.config.get('SQLSTATS_N_PLUS_ONE_THRESHOLD', 5)
+        if count > threshold and shape not in stats.reported:
+            stats.reported.add(shape)
+            message = 'N+1 queries in {} {}: ran {} times: {}'.format(
+                request.method, request.path, count, shape)
+            if app.testing and not stats.streamed:
+                raise NPlusOneError(message)
+            app.logger.warning(message)
+
+    def _finish(self, response):
+        stats = g.get('sqlstats')
+        if stats is None:
+            return response
+        app = current_app._get_current_object()
+        if response.is_streamed:
+            stats.streamed = True
+        elif app.config.get('SQLSTATS_HEADERS', True):
+            data = stats.as_dict()
+            response.headers['X-Query-Count'] = str(data['queries'])
+            response.headers['Server-Timing'] = 'db;dur={};desc="{} queries", app;dur={}'.format(
+                data['db_ms'], data['queries'], data['total_ms'])
+
+        method, path, status = request.method, request.full_path.rstrip('?'), response.status_code
+
+        def log():
+            app.logger.info(json.dumps(dict(
+                event='request', method=method, path=path, status=status, **stats.as_dict())))
+        response.call_on_close(log)
+        return response
@@ -2,3 +2,37 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead for inputs with data-autocomplete="artists" or "venues": offers
+// names from /api/autocomplete/<kind> and copies the id of the one picked
+// into the field whose id is in data-target.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+  var target = document.getElementById(input.dataset.target);
+  var list = document.getElementById(input.getAttribute('list'));
+  var ids = {};
+  var timer;
+  var latest = 0;
+  input.addEventListener('input', function () {
+    if (ids.hasOwnProperty(input.value)) {
+      target.value = ids[input.value];
+      return;
+    }
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var sent = ++latest;
+      fetch('/api/autocomplete/' + input.dataset.autocomplete + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (matches) {
+          if (sent !== latest) return;
+          ids = {};
+          list.innerHTML = '';
+          matches.forEach(function (match) {
+            var option = document.createElement('option');
+            option.value = match.name + ' (#' + match.id + ')';
+            ids[option.value] = match.id;
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
@@ -0,0 +1,90 @@
+"""Fixtures: an app on a fresh SQLite database per test, and helpers to
+fill it and to count the statements a page runs."""
+from datetime import datetime
+
+import pytest
+
+from app import create_app, refresh_areas
+from models import db, Venue, Artist
+
+
+@pytest.fixture
+def config(tmp_path):
+    """The config overrides of the test app; a test module can override
+    this fixture to change them."""
+    return {
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(tmp_path / 'fyyur.db'),
+        'SQLALCHEMY_BINDS': {},
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_RECORD_QUERIES': False,
+        'WTF_CSRF_ENABLED': False,
+        # Every request reaches the database, so its statements are counted.
+        'CACHE_BACKEND': 'null',
+        'JINJA_BYTECODE_CACHE_DIR': None,
+        'IMAGE_CACHE_DIR': str(tmp_path / 'images'),
+    }
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(overrides=config)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def query_count(client):
+    """GET a page and return the number of statements it ran, from the
+    X-Query-Count header sqlstats.py sets."""
+    def count(path):
+        response = client.get(path)
+        assert response.status_code == 200, response.status
+        return int(response.headers['X-Query-Count'])
+    return count
+
+
+@pytest.fixture
+def add_venue(app):
+    def add(name='The Musical Hop', city='San Francisco', state='CA', **fields):
+        with app.app_context():
+            venue = Venue(name=name, city=city, state=state, genres=fields.pop('genres', ['Jazz']), **fields)
+            db.session.add(venue)
+            db.session.flush()
+            refresh_areas([(city, state)])
+            db.session.commit()
+            return venue.id
+    return add
+
+
+@pytest.fixture
+def add_artist(app):
+    def add(name='Guns N Petals', city='San Francisco', state='CA', **fields):
+        with app.app_context():
+            artist = Artist(name=name, city=city, state=state, genres=fields.pop('genres', ['Rock n Roll']), **fields)
+            db.session.add(artist)
+            db.session.commit()
+            return artist.id
+    return add
+
+
+@pytest.fixture
+def add_shows(app):
+    """Insert shows of one venue and artist at `times`, keeping the show
+    counters and the area summary up to date as the app does."""
+    def add(venue_id, artist_id, times, now=None):
+        from app import insert_shows, show_batch_rows
+        with app.app_context():
+            insert_shows(venue_id, artist_id, show_batch_rows(venue_id, artist_id, times, now or datetime.now()))
+            db.session.commit()
+    return add
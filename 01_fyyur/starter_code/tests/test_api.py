@@ -0,0 +1,43 @@
+import pytest
+
+from app import cache
+from cache import LRUBackend
+
+
+@pytest.fixture
+def app(app):
+    with app.app_context():
+        cache.backend = LRUBackend(100)
+    return app
+
+
+def test_venue_revalidates_with_304_until_it_changes(client, add_venue, add_artist):
+    venue_id, artist_id = add_venue(), add_artist()
+    path = '/api/v1/venues/{}'.format(venue_id)
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.json['name'] == 'The Musical Hop'
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+
+    # Revalidation is answered from the cache, without a query.
+    for headers in [{'If-None-Match': etag}, {'If-Modified-Since': last_modified}]:
+        response = client.get(path, headers=headers)
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+        assert response.headers['X-Query-Count'] == '0'
+    assert client.get(path, headers={'If-None-Match': '"other"'}).status_code == 200
+
+    # A new show changes the venue, so the old ETag no longer matches.
+    client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                       'start_time': '2031-01-03 20:00'})
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json['upcoming_shows_count'] == 1
+
+
+def test_missing_venue_is_not_cached_as_json(client):
+    response = client.get('/api/v1/venues/1')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
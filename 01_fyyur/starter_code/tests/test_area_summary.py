@@ -0,0 +1,51 @@
+from app import area_summary_drift, rebuild_area_summary, refresh_areas
+from models import db, AreaSummary, Venue
+
+
+def summary():
+    return {(row.city, row.state): (row.id, [venue['name'] for venue in row.venues])
+            for row in AreaSummary.query}
+
+
+def test_refresh_updates_the_area_row_in_place(app, add_venue):
+    add_venue(name='B Hall', city='Austin', state='TX')
+    with app.app_context():
+        (id, names), = summary().values()
+    add_venue(name='A Club', city='Austin', state='TX')
+    with app.app_context():
+        assert summary() == {('Austin', 'TX'): (id, ['A Club', 'B Hall'])}
+        refresh_areas([('Austin', 'TX'), ('Austin', 'TX')])
+        db.session.commit()
+        assert summary() == {('Austin', 'TX'): (id, ['A Club', 'B Hall'])}
+        assert area_summary_drift() == []
+
+
+def test_moving_and_deleting_venues(app, client, add_venue):
+    moved = add_venue(name='Mover', city='Austin', state='TX')
+    deleted = add_venue(name='Closing', city='Dallas', state='TX')
+    add_venue(name='Stays', city='Dallas', state='TX')
+    with app.app_context():
+        venue = Venue.query.get(moved)
+        venue.city = 'Dallas'
+        db.session.flush()
+        refresh_areas([('Austin', 'TX'), ('Dallas', 'TX')])
+        db.session.commit()
+        assert sorted(summary()) == [('Dallas', 'TX')]
+        assert summary()[('Dallas', 'TX')][1] == ['Closing', 'Mover', 'Stays']
+
+    assert client.delete('/venues/{}'.format(deleted)).status_code == 302
+    with app.app_context():
+        assert summary()[('Dallas', 'TX')][1] == ['Mover', 'Stays']
+        assert area_summary_drift() == []
+
+
+def test_rebuild(app, add_venue):
+    for city in ('Austin', 'Dallas', 'Houston'):
+        add_venue(name=city + ' Hall', city=city, state='TX')
+    with app.app_context():
+        AreaSummary.query.delete()
+        db.session.commit()
+        assert len(area_summary_drift()) == 3
+        assert rebuild_area_summary() == 3
+        db.session.commit()
+        assert area_summary_drift() == []
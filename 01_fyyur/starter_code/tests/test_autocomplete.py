@@ -0,0 +1,54 @@
+import gc
+import os
+import runpy
+from types import SimpleNamespace
+
+from app import autocomplete_indexes
+
+
+def test_gunicorn_loads_the_indexes_before_forking(app, add_venue, add_artist):
+    venue_id = add_venue(name='The Musical Hop')
+    add_artist(name='Guns N Petals')
+    settings = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+    try:
+        settings['when_ready'](SimpleNamespace(app=SimpleNamespace(wsgi=lambda: app)))
+    finally:
+        gc.unfreeze()
+    with app.app_context():
+        indexes = autocomplete_indexes()
+        assert indexes['venues'].loaded_at is not None
+        assert indexes['artists'].loaded_at is not None
+        assert indexes['venues'].search('hop') == [{'id': venue_id, 'name': 'The Musical Hop'}]
+
+
+def suggest(client, kind, q, **args):
+    response = client.get('/api/autocomplete/{}'.format(kind), query_string=dict(args, q=q))
+    assert response.status_code == 200
+    return [match['name'] for match in response.json]
+
+
+def test_matches_the_start_of_any_word(client, add_artist):
+    for name in ['Guns N Petals', 'Matt Quevado', 'The Wild Sax Band', 'Wildflower', 'Quinn']:
+        add_artist(name=name)
+    assert suggest(client, 'artists', 'wild') == ['The Wild Sax Band', 'Wildflower']
+    assert suggest(client, 'artists', '  SAX  b') == ['The Wild Sax Band']
+    # In order of the matching word.
+    assert suggest(client, 'artists', 'q') == ['Matt Quevado', 'Quinn']
+    assert suggest(client, 'artists', 'q', limit=1) == ['Matt Quevado']
+    assert suggest(client, 'artists', 'petal n') == []
+    assert suggest(client, 'artists', '') == []
+
+
+def test_writes_update_the_loaded_index(client, add_venue):
+    venue_id = add_venue(name='The Musical Hop')
+    assert suggest(client, 'venues', 'dueling') == []
+
+    response = client.post('/venues/create', data={
+        'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY',
+        'address': '335 Delancey Street', 'genres': 'Jazz',
+        'facebook_link': 'https://www.facebook.com/theduelingpianos'})
+    assert response.status_code == 302
+    assert suggest(client, 'venues', 'dueling') == ['The Dueling Pianos Bar']
+
+    assert client.delete('/venues/{}'.format(venue_id)).status_code == 302
+    assert suggest(client, 'venues', 'musical') == []
@@ -0,0 +1,102 @@
+"""Cache invalidation across processes: two apps on one database stand in
+for a web worker and a `flask` command."""
+import fnmatch
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+
+from app import cache, create_app
+from cache import LRUBackend, RedisBackend
+from models import db, Venue
+
+
+class StandInRedis(object):
+    """The part of the Redis API RedisBackend uses, in a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, pattern)]
+
+
+@pytest.fixture
+def command_app(config):
+    """A second app, as the `flask` command would create."""
+    app = create_app(overrides=config)
+    yield app
+    with app.app_context():
+        db.get_engine(app).dispose()
+
+
+def use_backend(app, backend):
+    with app.app_context():
+        cache.backend = backend
+
+
+def rename_venue(app, venue_id, name):
+    with app.app_context():
+        Venue.query.get(venue_id).name = name
+        db.session.commit()
+
+
+@pytest.mark.parametrize('command', [['area-summary', 'rebuild'], ['verify-show-counters', '--fix']])
+def test_commands_invalidate_a_shared_cache(app, client, command_app, add_venue, command):
+    redis = StandInRedis()
+    use_backend(app, RedisBackend(redis))
+    use_backend(command_app, RedisBackend(redis))
+    venue_id = add_venue(name='Old Name')
+    assert b'Old Name' in client.get('/venues/{}'.format(venue_id)).data
+    rename_venue(command_app, venue_id, 'New Name')
+    assert b'Old Name' in client.get('/venues/{}'.format(venue_id)).data
+
+    if command[0] == 'area-summary':
+        result = command_app.test_cli_runner().invoke(args=command)
+        assert b'New Name' in client.get('/venues').data
+    else:
+        # Drift to fix, so the command has something to invalidate.
+        with command_app.app_context():
+            Venue.query.get(venue_id).upcoming_shows_count = 3
+            db.session.commit()
+        result = command_app.test_cli_runner().invoke(args=command)
+        assert b'New Name' in client.get('/venues/{}'.format(venue_id)).data
+    assert result.exit_code == 0, result.output
+    assert 'CACHE_BACKEND' not in result.output
+
+
+def test_commands_say_a_per_process_cache_is_out_of_reach(app, client, command_app, add_venue):
+    use_backend(app, LRUBackend())
+    use_backend(command_app, LRUBackend())
+    command_app.config['CACHE_BACKEND'] = 'lru'
+    add_venue(name='Old Name')
+    result = command_app.test_cli_runner().invoke(args=['area-summary', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    assert "CACHE_BACKEND is 'lru', so the running app keeps the pages it cached for up to 300 seconds" in result.output
+
+
+@pytest.mark.parametrize('backend, workers, starts', [
+    (LRUBackend(), 1, True),
+    (LRUBackend(), 2, False),
+    (RedisBackend(StandInRedis()), 4, True),
+])
+def test_gunicorn_needs_a_shared_cache_for_several_workers(app, backend, workers, starts):
+    settings = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+    use_backend(app, backend)
+    server = SimpleNamespace(app=SimpleNamespace(wsgi=lambda: app), cfg=SimpleNamespace(workers=workers))
+    if starts:
+        settings['on_starting'](server)
+    else:
+        with pytest.raises(RuntimeError, match='set CACHE_BACKEND=redis or WEB_CONCURRENCY=1'):
+            settings['on_starting'](server)
@@ -0,0 +1,93 @@
+import gzip
+import zlib
+
+import pytest
+
+import compression
+from compression import CompressMiddleware
+
+
+def text_app(chunks, content_type='text/html; charset=utf-8', consumed=None):
+    """A WSGI app that streams `chunks`, appending each to `consumed` as it
+    is read."""
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', content_type)])
+        for chunk in chunks:
+            if consumed is not None:
+                consumed.append(chunk)
+            yield chunk
+    return app
+
+
+def call(app, accept_encoding='gzip'):
+    """(headers, body iterator) of a GET to the WSGI app `app`; the headers
+    are only filled in once the body is started."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response.update(headers)
+        return lambda data: None
+
+    body = app({'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': accept_encoding}, start_response)
+    return response, iter(body)
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip;q=1, br;q=0.5', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('br;q=0', None),
+    ('*', 'br'),
+    ('identity', None),
+    ('gzip;q=0, br;q=0', None),
+    ('', None),
+])
+def test_negotiate(monkeypatch, accept_encoding, encoding):
+    monkeypatch.setattr(compression, 'supported_encodings', lambda: ('br', 'gzip'))
+    assert CompressMiddleware(None).negotiate(accept_encoding) == encoding
+
+
+def test_negotiate_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, 'supported_encodings', lambda: ('gzip',))
+    assert CompressMiddleware(None).negotiate('br') is None
+    assert CompressMiddleware(None).negotiate('br, gzip;q=0.1') == 'gzip'
+
+
+@pytest.mark.parametrize('chunks, content_type', [
+    ([b'<p>', b'x' * 100, b'</p>'], 'text/html'),
+    ([b'\x89PNG' + b'x' * 1000], 'image/png'),
+])
+def test_small_and_binary_bodies_pass_through(chunks, content_type):
+    middleware = CompressMiddleware(text_app(chunks, content_type), min_size=512)
+    headers, body = call(middleware)
+    assert b''.join(body) == b''.join(chunks)
+    assert 'Content-Encoding' not in headers
+
+
+def test_streamed_body_is_flushed_before_it_ends():
+    chunks = [b'<li>%04d</li>' % i for i in range(1000)]
+    consumed = []
+    middleware = CompressMiddleware(text_app(chunks, consumed=consumed), min_size=512, flush_size=4096)
+    headers, body = call(middleware)
+    # What has been read from the app decompresses as soon as each flush
+    # is out, long before the last chunk.
+    decompressor, received = zlib.decompressobj(16 + zlib.MAX_WBITS), b''
+    flushes = 0
+    for out in body:
+        assert headers['Content-Encoding'] == 'gzip'
+        received += decompressor.decompress(out)
+        if out and len(consumed) < len(chunks):
+            flushes += 1
+            assert received == b''.join(consumed)
+    assert received == b''.join(chunks)
+    assert 'Accept-Encoding' in headers['Vary']
+    assert 'Content-Length' not in headers
+    assert flushes >= len(b''.join(chunks)) // 4096
+
+
+def test_pages_are_compressed(client, add_venue):
+    add_venue()
+    response = client.get('/venues', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert b'The Musical Hop' in gzip.decompress(response.data)
+    assert client.get('/venues').headers.get('Content-Encoding') is None
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import babel.dates
+import pytest
+
+from app import format_datetime, format_datetimes
+
+VALUE = datetime(2026, 3, 5, 21, 30)
+
+
+@pytest.mark.parametrize('locale', ['en', 'de', 'ja'])
+@pytest.mark.parametrize('width', ['short', 'long'])
+def test_named_widths_use_the_locale_formats(width, locale):
+    expected = babel.dates.format_datetime(VALUE, width, locale=locale)
+    assert format_datetime(VALUE, width, locale) == expected
+    assert format_datetime(VALUE.isoformat(), width, locale) == expected
+
+
+def test_app_formats_and_patterns():
+    assert format_datetime(VALUE, 'full') == 'Thursday March, 5, 2026 at 9:30PM'
+    assert format_datetime(VALUE) == 'Thu 03, 05, 2026 9:30PM'
+    assert format_datetime(VALUE, 'yyyy-MM-dd HH:mm') == '2026-03-05 21:30'
+    assert format_datetimes([VALUE, '2026-03-06 10:00'], 'yyyy-MM-dd HH:mm') == \
+        ['2026-03-05 21:30', '2026-03-06 10:00']
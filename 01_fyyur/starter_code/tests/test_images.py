@@ -0,0 +1,136 @@
+"""The image proxy against a local HTTP server standing in for the hosts
+image links point at."""
+import io
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import images
+from app import purge_image
+from models import db, Artist, Venue
+
+
+def png(size=(1600, 900), color='red'):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def origin():
+    """An HTTP server on 127.0.0.1 serving a PNG at every path; `requests`
+    lists the paths it was asked for."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.requests.append(self.path)
+            body = png()
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    server.url = 'http://127.0.0.1:{}'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def allow_private(app):
+    app.config['IMAGE_PROXY_ALLOW_PRIVATE'] = True
+    images.ImageProxy(endpoint='fyyur.image').init_app(app)
+
+
+def image_files(app):
+    return sorted(name for root, dirs, names in os.walk(app.config['IMAGE_CACHE_DIR']) for name in names)
+
+
+def test_fetches_resizes_and_caches(app, client, origin, allow_private, add_venue):
+    venue_id = add_venue(image_link=origin.url + '/hop.png')
+    response = client.get('/img/venues/{}/tile'.format(venue_id), headers={'Accept': 'image/webp'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert Image.open(io.BytesIO(response.data)).size == (711, 400)
+    jpeg = client.get('/img/venues/{}/profile'.format(venue_id))
+    assert jpeg.mimetype == 'image/jpeg'
+    assert origin.requests == ['/hop.png']
+
+
+def test_refuses_private_addresses(app, client, origin, add_venue):
+    venue_id = add_venue(image_link=origin.url + '/hop.png')
+    assert client.get('/img/venues/{}/tile'.format(venue_id)).status_code == 502
+    assert origin.requests == []
+
+
+def test_refuses_a_host_that_resolves_elsewhere_on_connect(app, client, origin, add_venue, monkeypatch):
+    # The first lookup, by the URL check, finds a public address; the one
+    # made when connecting finds the origin on 127.0.0.1.
+    real_getaddrinfo = socket.getaddrinfo
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host != 'rebind.example':
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        lookups.append(host)
+        if len(lookups) == 1:
+            return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('93.184.216.34', port))]
+        return real_getaddrinfo('127.0.0.1', port, *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    venue_id = add_venue(image_link='http://rebind.example:{}/hop.png'.format(origin.server_port))
+    assert client.get('/img/venues/{}/tile'.format(venue_id)).status_code == 502
+    assert len(lookups) == 2
+    assert origin.requests == []
+
+
+def test_purges_a_link_only_once_nothing_uses_it(app, client, origin, allow_private, add_venue, add_artist):
+    link = origin.url + '/shared.png'
+    first, second = add_venue(name='First', image_link=link), add_venue(name='Second', image_link=link)
+    artist_id = add_artist(image_link=link)
+    assert client.get('/img/venues/{}/tile'.format(first)).status_code == 200
+    cached = image_files(app)
+    assert len(cached) == 2
+
+    client.delete('/venues/{}'.format(first))
+    client.delete('/venues/{}'.format(second))
+    with app.app_context():
+        assert Venue.query.count() == 0
+    assert image_files(app) == cached
+
+    with app.app_context():
+        Artist.query.get(artist_id).image_link = None
+        db.session.commit()
+        purge_image(link)
+    assert image_files(app) == []
+
+
+def test_evicts_least_recently_used_files(app, tmp_path):
+    with app.app_context():
+        cache = images.ImageCache(app)
+    cache.max_bytes = 1000
+    paths = [cache.path('http://example.com/{}.png'.format(i), 'src') for i in range(4)]
+    for path in paths[:3]:
+        cache._store(path, b'x' * 300)
+    cache._read(paths[0])
+    # 1200 bytes: the least recently used files go until it is 900 or less.
+    cache._store(paths[3], b'x' * 300)
+    assert [os.path.exists(path) for path in paths] == [True, False, True, True]
+    assert cache._size == 900
+    assert list(cache._files) == [paths[2], paths[0], paths[3]]
+    # Another process finds the same files.
+    assert images.ImageCache(app).scan() == 900
+
+    cache.purge('http://example.com/0.png')
+    assert cache._size == 600 and list(cache._files) == [paths[2], paths[3]]
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import importer
+from models import db, ImportCheckpoint, Venue
+
+VENUES = [
+    {'name': 'Venue {}'.format(i), 'city': 'Austin', 'state': 'TX', 'address': '{} Main St'.format(i),
+     'genres': 'Jazz,Blues', 'facebook_link': 'https://www.facebook.com/venue{}'.format(i)}
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def source(tmp_path):
+    rows = list(VENUES)
+    rows[2] = dict(rows[2], genres='')
+    path = tmp_path / 'venues.ndjson'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    return str(path)
+
+
+def run(app, source, **options):
+    with app.app_context():
+        return importer.run_import('venues', source, batch_size=2, echo=lambda message: None, **options)
+
+
+def state(app):
+    with app.app_context():
+        checkpoint = ImportCheckpoint.query.one()
+        return sorted(name for name, in db.session.query(Venue.name)), (checkpoint.rows_done, checkpoint.batches_done)
+
+
+def errors(source):
+    with open(source + '.errors.ndjson') as f:
+        return [(error['batch'], error['line']) for error in map(json.loads, f)]
+
+
+def test_import_in_batches(app, source):
+    assert run(app, source) == (4, 1)
+    assert state(app) == (['Venue 0', 'Venue 1', 'Venue 3', 'Venue 4'], (5, 3))
+    assert errors(source) == [(2, 3)]
+    # Rerunning resumes after the last batch, so nothing is loaded twice.
+    assert run(app, source) == (0, 0)
+    assert state(app)[0] == ['Venue 0', 'Venue 1', 'Venue 3', 'Venue 4']
+
+
+def test_a_failed_batch_leaves_no_rows_and_no_checkpoint(app, source, monkeypatch):
+    # The checkpoint of the second batch fails after its rows were inserted,
+    # as a crash before its commit would.
+    stage = importer.Checkpoint.stage
+
+    def fail_second_batch(self, rows_done, batches_done):
+        if batches_done == 2:
+            raise RuntimeError('interrupted')
+        stage(self, rows_done, batches_done)
+
+    monkeypatch.setattr(importer.Checkpoint, 'stage', fail_second_batch)
+    with pytest.raises(RuntimeError):
+        run(app, source)
+    assert state(app) == (['Venue 0', 'Venue 1'], (2, 1))
+    assert errors(source) == []
+
+    monkeypatch.setattr(importer.Checkpoint, 'stage', stage)
+    assert run(app, source) == (2, 1)
+    assert state(app) == (['Venue 0', 'Venue 1', 'Venue 3', 'Venue 4'], (5, 3))
+    assert errors(source) == [(2, 3)]
+
+
+def test_restart(app, source):
+    run(app, source)
+    with app.app_context():
+        Venue.query.delete()
+        db.session.commit()
+    assert run(app, source, restart=True) == (4, 1)
+    assert state(app) == (['Venue 0', 'Venue 1', 'Venue 3', 'Venue 4'], (5, 3))
+    assert errors(source) == [(2, 3)]
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def booked(add_venue, add_artist, add_shows):
+    """A venue and an artist with one show, and add(n) for n more shows of
+    each with other artists and venues, half of them past."""
+    now = datetime.now().replace(microsecond=0)
+    venue_id, artist_id = add_venue(), add_artist()
+    add_shows(venue_id, artist_id, [now + timedelta(days=1)])
+
+    def add(n):
+        for i in range(10):
+            other_artist, other_venue = add_artist(name='Artist {}'.format(i)), add_venue(name='Venue {}'.format(i))
+            times = [now + timedelta(days=(j - n // 20) * 7, hours=i) for j in range(n // 20)]
+            add_shows(venue_id, other_artist, times)
+            add_shows(other_venue, artist_id, times)
+
+    return venue_id, artist_id, add
+
+
+@pytest.mark.parametrize('page, other', [('/venues/{venue_id}', b'Artist 9'), ('/artists/{artist_id}', b'Venue 9')])
+def test_profile_query_count_does_not_grow_with_shows(booked, query_count, client, page, other):
+    venue_id, artist_id, add = booked
+    path = page.format(venue_id=venue_id, artist_id=artist_id)
+    one = query_count(path)
+    add(200)
+    assert query_count(path) == one
+    assert other in client.get(path).data
+
+
+@pytest.mark.parametrize('page', ['/venues/{venue_id}', '/artists/{artist_id}'])
+def test_profile_counts_shows_started_since_the_last_rollover_as_past(add_venue, add_artist, add_shows, client, page):
+    now = datetime.now().replace(microsecond=0)
+    venue_id, artist_id = add_venue(), add_artist()
+    add_shows(venue_id, artist_id, [now - timedelta(days=7), now + timedelta(days=7)])
+    # Listed before it started and not rolled over since, so the counters
+    # still have it as upcoming.
+    add_shows(venue_id, artist_id, [now - timedelta(hours=1)], now=now - timedelta(hours=2))
+    data = client.get(page.format(venue_id=venue_id, artist_id=artist_id)).data
+    assert b'1 Upcoming Show<' in data
+    assert b'2 Past Shows<' in data
@@ -0,0 +1,68 @@
+"""Primary/replica routing, with two SQLite files: the replica is a copy of
+the primary taken before a venue was renamed there, so a page shows which
+of the two it was read from."""
+import shutil
+
+import pytest
+
+from app import cache
+from cache import LRUBackend
+from models import db, Venue
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    return dict(config, SQLALCHEMY_BINDS={'replica': 'sqlite:///{}'.format(tmp_path / 'replica.db')})
+
+
+@pytest.fixture
+def venue_id(app, tmp_path, add_venue):
+    venue_id = add_venue(name='Old Name')
+    with app.app_context():
+        db.get_engine(app).dispose()
+        shutil.copy(tmp_path / 'fyyur.db', tmp_path / 'replica.db')
+        Venue.query.get(venue_id).name = 'New Name'
+        db.session.commit()
+    yield venue_id
+    with app.app_context():
+        db.get_engine(app, bind='replica').dispose()
+
+
+def read_from(client, venue_id):
+    page = client.get('/venues/{}'.format(venue_id)).data
+    assert (b'Old Name' in page) != (b'New Name' in page)
+    return 'replica' if b'Old Name' in page else 'primary'
+
+
+def pinned(client):
+    with client.session_transaction() as session:
+        return 'primary_until' in session
+
+
+def test_reads_after_a_write_go_to_the_primary(client, venue_id, add_artist):
+    artist_id = add_artist()
+    assert read_from(client, venue_id) == 'replica'
+
+    # A POST that only reads, here a show for an artist that does not
+    # exist, leaves the client on the replica.
+    response = client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id + 1,
+                                                  'start_time': '2031-01-03 20:00'})
+    assert response.status_code == 400
+    assert not pinned(client)
+    assert read_from(client, venue_id) == 'replica'
+
+    response = client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                                  'start_time': '2031-01-03 20:00'})
+    assert b'Show was successfully listed!' in response.data
+    assert pinned(client)
+    assert read_from(client, venue_id) == 'primary'
+
+
+def test_cache_entries_are_filled_from_the_primary(app, client, venue_id):
+    with app.app_context():
+        cache.backend = LRUBackend(100)
+    assert read_from(client, venue_id) == 'primary'
+    assert not pinned(client)
+    # Uncached pages, such as older past shows, still read from the replica.
+    page = client.get('/venues/{}?past=x'.format(venue_id)).data
+    assert b'Old Name' in page
@@ -0,0 +1,61 @@
+"""Ranked name search and its keyset cursor. similarity() is pg_trgm's; the
+SQLite test database gets the same trigram measure as a Python function."""
+import re
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+
+def trigrams(value):
+    words = re.findall(r'[^\W_]+', value.lower())
+    return set(padded[i:i + 3] for word in words for padded in ['  ' + word + ' '] for i in range(len(padded) - 2))
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, SEARCH_PAGE_SIZE=2)
+
+
+@pytest.fixture
+def app(app):
+    def register(dbapi_connection, connection_record):
+        dbapi_connection.create_function('similarity', 2, similarity)
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', register)
+        db.engine.dispose()
+    return app
+
+
+def search(client, path, term):
+    """The names on every page of results, following the cursors."""
+    pages, data = [], {'search_term': term}
+    while True:
+        page = client.post(path, data=data).data.decode()
+        pages.append(re.findall(r'<h5>(.*?)</h5>', page))
+        cursor = re.search(r'name="cursor" value="([^"]+)"', page)
+        if cursor is None:
+            return pages
+        data = {'search_term': term, 'cursor': cursor.group(1)}
+
+
+def test_search_ranks_matches_and_pages_through_ties(client, add_venue):
+    for name in ['The Musical Hop', 'Music Hall C', 'Music', 'Jazz Club', 'Music Hall A', 'Music Hall B']:
+        add_venue(name=name)
+    # "Music" matches exactly; the three halls tie, so they follow in id
+    # order across the page boundary; "Jazz Club" does not match at all.
+    assert search(client, '/venues/search', 'MUSIC') == [
+        ['Music', 'Music Hall C'], ['Music Hall A', 'Music Hall B'], ['The Musical Hop']]
+
+
+def test_search_escapes_like_wildcards(client, add_artist):
+    add_artist(name='100% Blues')
+    add_artist(name='1000 Blues')
+    assert search(client, '/artists/search', '100%') == [['100% Blues']]
@@ -0,0 +1,107 @@
+import html
+import re
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Show
+
+
+def post_show(client, venue_id, artist_id, start_time='2031-01-03 20:00', **fields):
+    return client.post('/shows/create', data=dict(
+        venue_id=venue_id, artist_id=artist_id, start_time=start_time, **fields))
+
+
+def show_times(app):
+    with app.app_context():
+        return [time for time, in db.session.query(Show.start_time).order_by(Show.start_time)]
+
+
+@pytest.fixture
+def ids(add_venue, add_artist):
+    return add_venue(), add_artist()
+
+
+def test_one_show(app, client, ids):
+    response = post_show(client, *ids)
+    assert response.status_code == 200
+    assert b'Show was successfully listed!' in response.data
+    assert show_times(app) == [datetime(2031, 1, 3, 20)]
+
+
+def test_recurrence(app, client, ids):
+    response = post_show(client, *ids, recurrence='RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=3')
+    assert b'4 shows were successfully listed!' in response.data
+    assert show_times(app) == [datetime(2031, 1, 3, 20), datetime(2031, 1, 31, 20),
+                               datetime(2031, 2, 28, 20), datetime(2031, 3, 28, 20)]
+
+
+def test_dates(app, client, ids):
+    response = post_show(client, *ids, dates='2031-02-01\n2031-02-02 18:30, 2031-01-03')
+    assert b'3 shows were successfully listed!' in response.data
+    assert show_times(app) == [datetime(2031, 1, 3, 20), datetime(2031, 2, 1, 20), datetime(2031, 2, 2, 18, 30)]
+
+
+def test_a_taken_time_rejects_the_whole_batch(app, client, ids, add_shows):
+    add_shows(*ids, [datetime(2031, 1, 10, 20)])
+    response = post_show(client, *ids, recurrence='FREQ=WEEKLY;COUNT=4', dates='not a date')
+    assert response.status_code == 400
+    assert b'2 of the shows could not be listed' in response.data
+    assert b'The venue already has a show at this time.' in response.data
+    assert b'Not a date.' in response.data
+    assert show_times(app) == [datetime(2031, 1, 10, 20)]
+
+
+@pytest.mark.parametrize('fields, error', [
+    ({'recurrence': 'FREQ=DAILY;COUNT=3', 'dates': '2031-02-01\n2031-02-02\n2031-02-03'},
+     b'At most 5 shows can be listed at once.'),
+    ({'dates': '2031-02-01\n2031-02-02\n2031-02-03\n2031-02-04\n2031-02-05'}, b'At most 5 shows can be listed at once.'),
+    ({'recurrence': 'FREQ=WEEKLY'}, b'Repeats more than 5 times; give it a COUNT or UNTIL.'),
+])
+def test_show_batch_limit(app, client, ids, fields, error):
+    app.config['SHOW_BATCH_LIMIT'] = 5
+    response = post_show(client, *ids, **fields)
+    assert response.status_code == 400
+    assert error in response.data
+    assert show_times(app) == []
+
+
+@pytest.mark.parametrize('recurrence, error', [
+    ('FREQ=SECONDLY;BYMONTH=2;BYMONTHDAY=30', b'Repeat DAILY, WEEKLY or MONTHLY.'),
+    ('FREQ=YEARLY;COUNT=2', b'Repeat DAILY, WEEKLY or MONTHLY.'),
+    ('FREQ=DAILY;BYMONTH=2;COUNT=2', b'FREQ=DAILY does not take BYMONTH.'),
+    ('FREQ=MONTHLY;BYDAY=5FR;BYMONTHDAY=1', b'Give BYDAY or BYMONTHDAY, not both.'),
+    ('FREQ=MONTHLY;BYDAY=5FR;COUNT=2', b'BYDAY takes the 1st to 4th weekday of a month'),
+    ('FREQ=WEEKLY;BYDAY=1FR;COUNT=2', b'Only MONTHLY rules take the nth weekday of a month.'),
+    ('FREQ=MONTHLY;BYMONTHDAY=31;COUNT=2', b'BYMONTHDAY takes days 1 to 28'),
+    ('FREQ=WEEKLY;BYDAY=XX;COUNT=2', b'Not a valid recurrence rule'),
+    ('FREQ=DAILY;UNTIL=20300101T000000', b'The rule gives no dates from the start time on.'),
+])
+def test_rejected_recurrence(app, client, ids, recurrence, error):
+    started = time.perf_counter()
+    response = post_show(client, *ids, recurrence=recurrence)
+    assert time.perf_counter() - started < 1
+    assert response.status_code == 400
+    assert error in response.data
+    assert show_times(app) == []
+
+
+@pytest.mark.parametrize('page_size', [2, 3, 4])
+def test_shows_pages_run_on_from_upcoming_to_past(app, client, add_venue, add_artist, add_shows, page_size):
+    app.config['SHOWS_PAGE_SIZE'] = page_size
+    now = datetime.now().replace(microsecond=0)
+    venue_id = add_venue()
+    # Two shows at each of two times, so ties are broken by id.
+    for name, days in [('A', 1), ('B', 2), ('C', 2), ('D', -1), ('E', -2), ('F', -2)]:
+        add_shows(venue_id, add_artist(name='Artist ' + name), [now + timedelta(days=days)])
+
+    pages, path = [], '/shows'
+    while path:
+        page = client.get(path).data.decode()
+        pages.append(re.findall(r'<a href="/artists/\d+">Artist (\w)</a>', page))
+        path = re.search(r'href="(/shows\?cursor=[^"]+)">Next page', page)
+        path = path and html.unescape(path.group(1))
+    # Upcoming shows soonest first, then past shows most recent first.
+    assert [name for page in pages for name in page] == ['A', 'B', 'C', 'D', 'F', 'E']
+    assert all(len(page) == page_size for page in pages[:-1])
@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from flask import Response, stream_with_context
+
+from models import Venue
+from sqlstats import NPlusOneError, statement_shape
+
+
+def lookups(n):
+    for id in range(n):
+        Venue.query.filter(Venue.id == id).all()
+        yield b'.'
+
+
+@pytest.fixture
+def views(app):
+    app.add_url_rule('/test/lookups/<int:n>', 'lookups', lambda n: b''.join(lookups(n)))
+    app.add_url_rule('/test/streamed/<int:n>', 'streamed',
+                     lambda n: Response(stream_with_context(lookups(n))))
+
+
+def test_statement_shape_ignores_values():
+    assert statement_shape('SELECT * FROM "Venue" WHERE id = 7 AND name = \'x\'') == \
+        statement_shape('SELECT * FROM "Venue" WHERE id = 12 AND name = \'y\'')
+    assert statement_shape('SELECT 1 WHERE id IN (?, ?, ?)') == 'SELECT ? WHERE id IN (?)'
+
+
+def test_query_count_headers(views, client):
+    response = client.get('/test/lookups/3')
+    assert response.headers['X-Query-Count'] == '3'
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+
+def test_repeated_statement_raises_when_testing(app, views, client):
+    threshold = app.config['SQLSTATS_N_PLUS_ONE_THRESHOLD']
+    assert client.get('/test/lookups/{}'.format(threshold)).status_code == 200
+    with pytest.raises(NPlusOneError):
+        client.get('/test/lookups/{}'.format(threshold + 1))
+
+
+def test_repeated_statement_is_logged_when_not_testing(app, views, client, caplog):
+    app.testing = False
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert client.get('/test/lookups/10').status_code == 200
+    assert [record.getMessage() for record in caplog.records if 'N+1' in record.getMessage()]
+
+
+def test_streamed_response_has_no_headers_and_is_only_logged(app, views, client, caplog):
+    with caplog.at_level(logging.INFO, logger=app.logger.name):
+        response = client.get('/test/streamed/10')
+        assert response.data == b'.' * 10
+        response.close()
+    assert 'X-Query-Count' not in response.headers
+    assert 'Server-Timing' not in response.headers
+    messages = [record.getMessage() for record in caplog.records]
+    assert any('N+1' in message for message in messages)
+    assert any('"queries": 10' in message for message in messages)
+
+
+def test_shows_page_is_streamed_without_query_headers(client):
+    response = client.get('/shows')
+    assert response.status_code == 200
+    assert 'X-Query-Count' not in response.headers
@@ -0,0 +1,23 @@
+from app import group_venue_areas, venue_areas
+from models import db
+
+
+def test_venues_listing_query_count_does_not_grow_with_venues(add_venue, query_count):
+    add_venue()
+    one = query_count('/venues')
+    for i in range(24):
+        add_venue(name='Venue {}'.format(i), city='City {}'.format(i % 6), state='NY')
+    assert query_count('/venues') == one == 1
+
+
+def test_venue_areas_matches_grouping_venue(app, add_venue):
+    for i in range(6):
+        add_venue(name='Venue {}'.format(i), city='City {}'.format(i % 3), state='TX')
+    add_venue(name='The Dueling Pianos Bar', city='New York', state='NY')
+    with app.app_context():
+        areas = venue_areas()
+        assert areas == group_venue_areas()
+        assert [(area['state'], area['city']) for area in areas] == [
+            ('NY', 'New York'), ('TX', 'City 0'), ('TX', 'City 1'), ('TX', 'City 2')]
+        assert [venue['name'] for venue in areas[1]['venues']] == ['Venue 0', 'Venue 3']
+        db.session.remove()